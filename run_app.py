@@ -26,12 +26,16 @@ def check_environment():
         os.makedirs(directory, exist_ok=True)
         logging.info(f"已确保目录存在: {directory}")
     
-    # 检查数据库文件
-    db_file = "chat_history.db"
-    if not os.path.exists(db_file):
-        logging.info(f"创建新的数据库文件: {db_file}")
+    # 检查数据库
+    from src.database.backends import DATABASE_URL
+    if DATABASE_URL.startswith("sqlite:///"):
+        db_file = DATABASE_URL[len("sqlite:///"):]
+        if not os.path.exists(db_file):
+            logging.info(f"创建新的数据库文件: {db_file}")
+        else:
+            logging.info(f"已有数据库文件: {db_file}")
     else:
-        logging.info(f"已有数据库文件: {db_file}")
+        logging.info(f"使用数据库: {DATABASE_URL.split('@')[-1]}")
     
     # 检查示例数据
     example_data = "example_data.csv"
@@ -84,6 +88,7 @@ def run_application():
         # 然后再导入其他模块（避免matplotlib配置被覆盖）
         from src.app_controller import AppController
         from src.ui.app_ui import AppUI
+        from src.app import launch_interface
         
         logging.info("正在初始化应用控制器...")
         controller = AppController()
@@ -102,7 +107,7 @@ def run_application():
         print("="*50 + "\n")
         
         # 启动应用 - 使用share=False避免下载frpc
-        interface.launch(share=False)
+        launch_interface(interface, share=False)
         
     except ImportError as e:
         logging.error(f"导入错误: {str(e)}")
@@ -4,6 +4,27 @@ import logging
 from .app_controller import AppController
 from .ui.app_ui import AppUI
 
+def launch_interface(interface, **launch_kwargs):
+    """
+    启动Gradio界面并挂载图表分发路由
+    
+    图表按内容哈希通过 /charts/<id> 提供，带长期缓存头，
+    浏览器重复打开会话时无需重新下载图片
+    
+    Args:
+        interface: Gradio Blocks界面
+        **launch_kwargs: 传递给launch的参数
+    """
+    from .storage.chart_registry import chart_registry
+    
+    launch_kwargs.setdefault("allowed_paths", ["charts", "exports/charts"])  # 允许浏览器访问图表及其缩略图
+    app, _, _ = interface.launch(prevent_thread_lock=True, **launch_kwargs)
+    try:
+        chart_registry.mount(app)
+    except Exception as e:
+        print(f"⚠ 挂载图表路由失败，将使用Gradio文件服务: {e}")
+    interface.block_thread()
+
 def main():
     """应用程序主入口"""
     # 确保必要的目录存在
@@ -54,7 +75,8 @@ def main():
         print("仅在本地访问")
     
     # 启动应用
-    interface.launch(
+    launch_interface(
+        interface,
         server_name=server_name,
         server_port=server_port,
         share=share
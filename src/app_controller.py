@@ -1,24 +1,38 @@
 import os
 import socket
+import shutil
+import threading
 import time
 import uuid
 import json
 import requests
 from datetime import datetime
 import matplotlib
+import pandas as pd
 
 from pandasai import Agent
 
 from .utils.language_utils import LanguageUtils
 from .utils.data_loader import DataLoader
 from .utils.chart_analyzer import ChartAnalyzer
+from .utils.chart_spec import ChartSpecBuilder, ALTAIR_AVAILABLE
 from .utils.oss_uploader import OSSUploader
-from .utils.image_utils import create_image_html
+from .utils.image_utils import create_image_html, create_thumbnail_markdown
+from .utils.code_vectorizer import pop_last_report as pop_code_report
 from .utils.font_config import get_chinese_plot_kwargs, ensure_chinese_font_for_pandasai
-from .database.db_manager import DBManager
+from .utils.execution_context import build_execution_context, execution_scope
+from .utils.batch_runner import BatchRunner, parse_questions, BATCH_MAX_WORKERS
+from .utils.request_timing import start_request, finish_request, current_request, timed_stage
+from .utils.agent_memory import export_memory, restore_memory, compact_memory, clear_memory, memory_size
+from .database.db_manager import DBManager, HISTORY_PAGE_SIZE, HISTORY_REFRESH_DEBOUNCE_SECONDS
+from .database.result_store import extract_table, summarize_table, RESULT_PAGE_SIZE
 from .config.config_manager import ConfigManager
-from .llm.llm_factory import LLMFactory
+from .llm.agent_registry import agent_registry
 from .storage.chart_storage import chart_storage
+from .storage.chart_optimizer import chart_optimizer
+from .storage.chart_registry import chart_registry
+from .storage.batch_report import batch_report
+from .storage.dataset_cache import dataset_cache
 
 class AppController:
     """应用控制器类，作为应用的核心，协调各个模块的工作"""
@@ -45,6 +59,7 @@ class AppController:
         # 初始化成员变量
         self.df = None
         self.agent = None
+        self.plot_kwargs = None  # 初始化Agent时配置字体得到的绘图参数
         self.session_id = str(uuid.uuid4())  # 创建会话ID
         self.session_file = ""  # 会话文件名
         
@@ -63,6 +78,18 @@ class AppController:
         # 语言设置 - 默认中文
         self.language = "zh"
         
+        # 图表输出模式: image=服务器端渲染PNG, spec=返回声明式图表规格由浏览器渲染
+        self.chart_output_mode = os.getenv("CHART_OUTPUT_MODE", "image").lower()
+        self.current_chart_spec = None  # 当前显示的图表规格，用于按需导出PNG
+        
+        # 当前数据集在缓存中的ID和列概况，随会话快照保存
+        self.dataset_id = None
+        self.column_profile = None
+        
+        # 历史记录数据的版本号：删除会话等无法在各个浏览器会话的表格中增量更新的修改后递增，
+        # 各会话的表格在下次刷新时据此重新加载（表格的分页状态保存在每个浏览器会话自己的状态中）
+        self.history_generation = 0
+        
         # 加载聊天历史记录
         self.chat_history = []
     
@@ -100,55 +127,223 @@ class AppController:
         """显示所有的聊天记录历史"""
         return self.db_manager.display_all_history(self.language)
     
-    def refresh_current_history(self):
-        """刷新当前的历史记录显示"""
-        history_data = self.db_manager.display_all_history(self.language)
-        
-        # 如果没有历史记录，显示提示信息
-        if not history_data:
-            # 创建一个包含"暂无对话记录"提示的记录
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
-            return [[
-                f"{self.get_text('last_updated')} {current_time}", 
-                "-",  # 会话ID列
-                self.get_text('no_history'), 
-                "-",  # 回答列
-                "-",  # 加载操作列
-                "-"   # 删除操作列
-            ]]
-            
-        return history_data
+    def _empty_history_placeholder(self, text_key):
+        """没有记录时在表格中显示的提示行"""
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+        return [[
+            f"{self.get_text('last_updated')} {current_time}", 
+            "-",  # 会话ID列
+            self.get_text(text_key), 
+            "-",  # 回答列
+            "-",  # 加载操作列
+            "-"   # 删除操作列
+        ]]
+    
+    def _fetch_history_page(self, search_keywords, limit=HISTORY_PAGE_SIZE, cursor=None):
+        """根据是否有搜索关键词获取一页历史记录"""
+        if search_keywords and search_keywords.strip():
+            return self.db_manager.search_history_page(search_keywords, self.language, limit, cursor)
+        return self.db_manager.get_history_page(self.language, limit, cursor)
+    
+    def new_history_state(self):
+        """
+        创建历史记录表格的分页状态（每个浏览器会话一份，保存在gr.State中）
+        
+        Returns:
+            dict: view为表格当前显示的视图（搜索关键词、语言），rows和record_ids为已加载的记录
+                及对应的记录ID，cursor为下一页游标，generation为加载时的历史数据版本号，
+                loaded_at为完整加载的时间（用于合并短时间内的重复刷新），
+                changed表示已加载的记录在本地增删后尚未发送给表格
+        """
+        return {"view": None, "rows": [], "record_ids": [], "cursor": None, "generation": None,
+                "loaded_at": 0.0, "changed": False}
+    
+    def _show_history(self, state, search_keywords, limit=HISTORY_PAGE_SIZE):
+        """从第一页开始加载历史记录，并记录分页状态"""
+        state["generation"] = self.history_generation
+        rows, state["cursor"], state["record_ids"] = self._fetch_history_page(search_keywords, limit)
+        state["rows"] = rows
+        state["view"] = self._current_history_view(search_keywords)
+        state["loaded_at"] = time.monotonic()
+        state["changed"] = False
+        return self._loaded_history(state, search_keywords)
+    
+    def _current_history_view(self, search_keywords):
+        """表格视图的标识：搜索关键词和语言相同时显示的内容相同"""
+        return (search_keywords or "").strip(), self.language
+    
+    def _is_current_view(self, state, search_keywords):
+        """表格显示的是否为当前视图且加载后历史数据没有发生无法增量更新的修改"""
+        return (state["view"] == self._current_history_view(search_keywords)
+                and state["generation"] == self.history_generation)
+    
+    def _loaded_history(self, state, search_keywords):
+        """已加载的记录，没有记录时返回提示行"""
+        if not state["rows"]:
+            searching = bool(search_keywords and search_keywords.strip())
+            return self._empty_history_placeholder('no_search_results' if searching else 'no_history')
+        return state["rows"]
+    
+    def resolve_history_row(self, state, row_index, row_value=None):
+        """
+        确定表格选择事件点击的是已加载记录中的哪一行
+        
+        表格显示的内容可能已被同一会话的其他事件更新（如插入新记录、加载下一页），
+        事件携带点击行的内容时以内容为准，行索引只作为首选位置
+        
+        Args:
+            state: 历史记录表格的分页状态
+            row_index: 事件中的行索引
+            row_value: 事件中点击行的内容，没有时只按行索引确定
+            
+        Returns:
+            int: 已加载记录中的行索引，找不到对应的记录（如提示行或表格已过期）时返回None
+        """
+        rows = state["rows"]
+        if row_value is None:
+            return row_index if 0 <= row_index < len(state["record_ids"]) else None
+        row_value = list(row_value)
+        if 0 <= row_index < len(rows) and list(rows[row_index]) == row_value:
+            return row_index
+        for index, row in enumerate(rows):
+            if list(row) == row_value:
+                return index
+        return None
+    
+    def get_history_record_id(self, state, row_index):
+        """
+        获取历史记录表格中某一行对应的记录ID
+        
+        Args:
+            state: 历史记录表格的分页状态
+            row_index: 表格行索引
+            
+        Returns:
+            int: 记录ID，行索引无效（如提示行）时返回None
+        """
+        if 0 <= row_index < len(state["record_ids"]):
+            return state["record_ids"][row_index]
+        return None
+    
+    @staticmethod
+    def has_more_history(state):
+        """历史记录表格是否还有下一页"""
+        return state["cursor"] is not None
+    
+    def refresh_current_history(self, state):
+        """刷新当前的历史记录显示（回到第一页）"""
+        return self._show_history(state, "")
     
-    def search_history(self, search_keywords):
+    def search_history(self, search_keywords, state):
         """
         搜索历史记录
         
         Args:
             search_keywords: 搜索关键词
+            state: 历史记录表格的分页状态
+            
+        Returns:
+            list: 搜索结果的第一页
+        """
+        return self._show_history(state, search_keywords)
+    
+    def load_more_history(self, search_keywords, state):
+        """
+        加载下一页历史记录并追加到表格末尾
+        
+        Args:
+            search_keywords: 当前搜索关键词
+            state: 历史记录表格的分页状态
+            
+        Returns:
+            list: 当前已加载的全部记录
+        """
+        if state["cursor"] is None:
+            return state["rows"] or self._empty_history_placeholder('no_history')
+        
+        rows, state["cursor"], record_ids = self._fetch_history_page(search_keywords, cursor=state["cursor"])
+        state["rows"] = state["rows"] + rows
+        state["record_ids"] = state["record_ids"] + record_ids
+        print(f"已加载 {len(state['rows'])} 条历史记录，{'还有更多' if self.has_more_history(state) else '已全部加载'}")
+        return state["rows"]
+    
+    def reload_history(self, search_keywords, state):
+        """
+        重新加载历史记录，保留已加载的记录数量
+        
+        新增和删除的记录已在本地增量更新，同一视图在HISTORY_REFRESH_DEBOUNCE_SECONDS内的重复刷新
+        不再查询数据库：本地有改动时返回已加载的记录，否则返回None表示表格无需更新
+        
+        Args:
+            search_keywords: 当前搜索关键词
+            state: 历史记录表格的分页状态
+            
+        Returns:
+            list: 重新加载的记录，或None
+        """
+        if (self._is_current_view(state, search_keywords)
+                and time.monotonic() - state["loaded_at"] < HISTORY_REFRESH_DEBOUNCE_SECONDS):
+            if not state["changed"]:
+                return None
+            state["changed"] = False
+            return self._loaded_history(state, search_keywords)
+        return self._show_history(state, search_keywords, max(HISTORY_PAGE_SIZE, len(state["rows"])))
+    
+    def append_history_record(self, search_keywords, state, record_id):
+        """
+        把本次问答保存的记录插入到历史记录表格顶部（只查询这一条记录，不重新加载整个表格）
+        
+        Args:
+            search_keywords: 当前搜索关键词，新记录不匹配时不插入
+            state: 历史记录表格的分页状态
+            record_id: 本会话的问答保存的记录ID（process_question的返回值）
+            
+        Returns:
+            list: 更新后的记录，表格无需更新时返回None
+        """
+        if record_id is None or record_id in state["record_ids"]:
+            return None
+        if not self._is_current_view(state, search_keywords):
+            # 表格显示的不是当前视图（如切换语言后尚未刷新），完整加载一次
+            return self._show_history(state, search_keywords, max(HISTORY_PAGE_SIZE, len(state["rows"])))
+        
+        rows, record_ids = self.db_manager.get_history_rows([record_id], self.language, search_keywords)
+        if not rows:
+            return None
+        state["rows"] = rows + state["rows"]
+        state["record_ids"] = record_ids + state["record_ids"]
+        state["changed"] = False
+        return state["rows"]
+    
+    def confirm_record_saved(self, chatbot, record_id):
+        """
+        确认本次问答的记录已写入数据库（记录由后台线程写入），写入失败时在回答末尾提示
+        
+        Args:
+            chatbot: 聊天记录
+            record_id: 本会话的问答保存的记录ID（process_question的返回值）
             
         Returns:
-            list: 搜索结果列表
-        """
-        if not search_keywords or not search_keywords.strip():
-            # 如果搜索关键词为空，返回所有历史记录
-            return self.db_manager.display_all_history(self.language)
-        
-        # 执行搜索
-        results = self.db_manager.search_history_by_question(search_keywords, self.language)
-        
-        # 如果没有结果，返回提示信息
-        if not results:
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
-            return [[
-                f"{self.get_text('last_updated')} {current_time}", 
-                "-",  # 会话ID列
-                self.get_text('no_search_results'), 
-                "-",  # 回答列
-                "-",  # 加载操作列
-                "-"   # 删除操作列
-            ]]
-        
-        return results
+            list: 加上提示后的聊天记录，记录已写入时返回None
+        """
+        error = self.db_manager.get_save_error(record_id)
+        if not error:
+            return None
+        print(f"聊天记录 {record_id} 写入失败: {error}")
+        if chatbot and chatbot[-1].get("role") == "assistant":
+            chatbot[-1]["content"] += f"\n\n⚠️ {self.get_text('history_save_failed')}"
+        return chatbot
+    
+    def remove_history_rows(self, state, record_ids):
+        """从已加载的历史记录中移除已删除的记录"""
+        removed = set(record_ids)
+        kept = [(row, record_id) for row, record_id in zip(state["rows"], state["record_ids"])
+                if record_id not in removed]
+        if len(kept) == len(state["rows"]):
+            return
+        state["rows"] = [row for row, _ in kept]
+        state["record_ids"] = [record_id for _, record_id in kept]
+        state["changed"] = True
     
     def set_language(self, language):
         """设置界面语言"""
@@ -172,7 +367,8 @@ class AppController:
             # 获取所有图表文件
             chart_files = glob.glob("charts/*.png") + glob.glob("charts/*.jpg") + glob.glob("charts/*.jpeg") + glob.glob("charts/*.svg")
             export_chart_files = glob.glob("exports/charts/*.png") + glob.glob("exports/charts/*.jpg") + glob.glob("exports/charts/*.jpeg") + glob.glob("exports/charts/*.svg")
-            all_chart_files = chart_files + export_chart_files
+            # 展示图和缩略图跟随原图一起保留或清理
+            all_chart_files = [f for f in chart_files + export_chart_files if not chart_optimizer.is_variant(f)]
             
             if not all_chart_files:
                 print("没有找到需要清理的图表文件")
@@ -212,6 +408,7 @@ class AppController:
                 else:
                     try:
                         os.remove(chart_file)
+                        chart_optimizer.remove_variants(chart_file)
                         cleaned_count += 1
                         print(f"清理图表文件: {chart_file}")
                     except Exception as e:
@@ -260,10 +457,15 @@ class AppController:
             print(f"✅ 新数据已加载: {len(self.df)} 行 x {len(self.df.columns)} 列")
             print(f"📊 数据列名: {list(self.df.columns)}")
             
+            # 列概况只在上传时计算一次；数据集缓存为列式文件，重启后恢复会话时直接映射加载
+            self.column_profile = DataLoader.profile_columns(self.df)
+            self.dataset_id = dataset_cache.save(self.df)
+            
             # 初始化AI处理器 - 这会创建新的Agent
             init_result, success = self.initialize_ai(self.llm_type)
             if not success:
                 return f"{self.get_text('load_error')}: {init_result}", None
+            self._save_session_snapshot()
             
             # 生成预览HTML - 传递当前语言
             preview_html = DataLoader.generate_preview_html(self.df, 500, self.language)
@@ -290,41 +492,31 @@ class AppController:
             
             # 强制清除旧的Agent实例
             self.agent = None
+            
+            # 相同数据集和模型的Agent已初始化过时直接复用（来回切换模型、重新上传相同文件）
+            dataset_key = self.dataset_id or dataset_cache.fingerprint(self.df)
+            cached_agent = agent_registry.get_agent(dataset_key, llm_type)
+            if cached_agent is not None:
+                clear_memory(cached_agent)
+                self.agent = cached_agent
+                print(f"♻️ 复用已初始化的 {llm_type} Agent")
+                return self.get_text("init_success", llm_type), True
+            
             print(f"🔄 正在初始化 {llm_type} 模型...")
                 
-            # 创建LLM实例
-            llm, success, error_msg = LLMFactory.create_llm(llm_type, self.language)
+            # 获取LLM实例（同一模型只创建和探测一次）
+            llm, success, error_msg = agent_registry.get_llm(llm_type, self.language)
             
             if not success:
                 return error_msg, False
                 
-            # 生成数据描述，包含列名信息
-            data_description = self._generate_data_description()
-            print(f"📋 数据描述已生成，包含 {len(self.df.columns)} 个列")
-            
-            # 确保中文字体配置
-            plot_kwargs = ensure_chinese_font_for_pandasai()
-            
-            # 配置PandasAI
-            config = {
-                "llm": llm,
-                "save_charts": True,  # 保存生成的图表
-                "verbose": True,  # 启用详细输出
-                "enforce_privacy": False,  # 不强制隐私保护
-                "auto_vis": False,  # 禁用自动生成可视化图表，只有在用户明确要求时才生成
-                "enable_cache": False,  # 禁用缓存以避免列名混淆
-                "custom_head": 5,  # 显示更多行来帮助理解数据
-                # 设置matplotlib字体和样式配置，确保中文正常显示
-                "custom_plot_kwargs": plot_kwargs
-            }
-            
             # 创建全新的Agent实例
-            print(f"🤖 正在创建新的 Agent 实例...")
-            self.agent = Agent(self.df, config=config, description=data_description)
+            self.agent = self._create_agent(llm)
             
             # 验证Agent是否正确初始化
             if self.agent is None:
                 return self.get_text("init_failed", "Agent creation failed"), False
+            agent_registry.put_agent(dataset_key, llm_type, self.agent)
             
             print(f"✅ {llm_type} 模型初始化成功，Agent 已就绪")
             return self.get_text("init_success", llm_type), True
@@ -334,20 +526,111 @@ class AppController:
             print(f"❌ {error_msg}")
             return self.get_text("init_failed", str(e)), False
     
+    def _create_agent(self, llm, df=None, data_description=None):
+        """
+        为数据集创建新的Agent实例（交互问答和批量运行的工作线程使用同一套配置）
+        
+        Args:
+            llm: LLM实例
+            df: 数据集，None表示当前数据集
+            data_description: 数据描述，None表示根据当前数据集的列概况生成
+            
+        Returns:
+            Agent: 新的Agent实例
+        """
+        if df is None:
+            df = self.df
+        # 生成数据描述，包含列名信息
+        if data_description is None:
+            data_description = self._generate_data_description()
+        print(f"📋 数据描述已生成，包含 {len(df.columns)} 个列")
+        
+        # 确保中文字体配置
+        plot_kwargs = ensure_chinese_font_for_pandasai()
+        if df is self.df:
+            # 批量运行开始后上传了新文件时，不覆盖当前数据集的绘图参数
+            self.plot_kwargs = plot_kwargs
+        
+        # 配置PandasAI
+        config = {
+            "llm": llm,
+            "save_charts": True,  # 保存生成的图表
+            "verbose": True,  # 启用详细输出
+            "enforce_privacy": False,  # 不强制隐私保护
+            "auto_vis": False,  # 不自动绘图；每个问题的图表意图由执行上下文写入生成代码的提示
+            "enable_cache": False,  # 禁用缓存以避免列名混淆
+            "custom_head": 5,  # 显示更多行来帮助理解数据
+            # 设置matplotlib字体和样式配置，确保中文正常显示
+            "custom_plot_kwargs": plot_kwargs
+        }
+        
+        print(f"🤖 正在创建新的 Agent 实例...")
+        # 记忆大小覆盖滚动摘要和保留的最近几轮问答
+        return Agent(df, config=config, description=data_description, memory_size=memory_size())
+    
+    def _save_session_snapshot(self):
+        """保存当前会话的快照：缓存数据集引用、列概况、Agent对话记忆和模型选择"""
+        if not self.session_id or not self.dataset_id:
+            return
+        self.db_manager.save_session_snapshot(
+            self.session_id,
+            self.dataset_id,
+            self.column_profile,
+            export_memory(self.agent),
+            self.llm_type,
+            self.get_model_name()
+        )
+    
+    def _resume_session(self, session_id):
+        """
+        根据会话快照恢复会话的数据和Agent（映射加载缓存的数据集，重建Agent并写回对话记忆）
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            str: 恢复结果说明，会话已是当前会话时返回None
+        """
+        if session_id == self.session_id and self.agent is not None:
+            return None
+        
+        snapshot = self.db_manager.get_session_snapshot(session_id)
+        if not snapshot or not dataset_cache.exists(snapshot["dataset_id"]):
+            return self.get_text("session_data_unavailable")
+        
+        started = time.perf_counter()
+        dataframe = dataset_cache.load(snapshot["dataset_id"])
+        if dataframe is None:
+            return self.get_text("session_data_unavailable")
+        
+        self.df = dataframe
+        self.dataset_id = snapshot["dataset_id"]
+        self.column_profile = snapshot["column_profile"]
+        init_result, success = self.initialize_ai(snapshot["llm_type"] or self.llm_type)
+        if not success:
+            return f"{self.get_text('load_error')}: {init_result}"
+        restored = restore_memory(self.agent, snapshot["agent_memory"])
+        # 旧快照中的记忆可能超过当前的记忆策略
+        restored -= compact_memory(self.agent)
+        
+        elapsed = time.perf_counter() - started
+        print(f"✅ 会话已恢复: {session_id[:8]}... {len(self.df)} 行, {restored} 条对话记忆, 耗时 {elapsed:.2f}s")
+        return self.get_text("session_resumed", len(self.df), self.llm_type, elapsed)
+    
     def _generate_data_description(self):
         """生成数据描述，帮助LLM更好地理解数据结构"""
         if self.df is None:
             return ""
         
-        # 获取列名和基本信息
+        # 获取列名和基本信息（使用上传时生成的列概况，不再扫描数据）
+        if self.column_profile is None:
+            self.column_profile = DataLoader.profile_columns(self.df)
         columns_info = []
-        for col in self.df.columns:
-            dtype = str(self.df[col].dtype)
-            sample_values = self.df[col].dropna().head(3).tolist()
-            columns_info.append(f"'{col}' ({dtype}): {sample_values}")
+        for column in self.column_profile["columns"]:
+            columns_info.append(f"'{column['name']}' ({column['dtype']}): {column['samples']}")
         
         description = f"""
-数据集包含 {len(self.df)} 行 {len(self.df.columns)} 列。
+数据集包含 {self.column_profile['rows']} 行 {len(self.column_profile['columns'])} 列。
 列信息：
 {chr(10).join(columns_info)}
 
@@ -368,6 +651,7 @@ class AppController:
         
         result, success = self.initialize_ai(llm_type)
         if success:
+            self._save_session_snapshot()
             # 获取模型名称并显示
             model_name = self.get_model_name()
             return f"{result} ({model_name})"
@@ -376,22 +660,73 @@ class AppController:
     def ask_question(self, question, chatbot):
         """
         处理用户问题 - 仅将问题添加到chatbot
+        
+        同时返回提交时间，保存在浏览器会话的状态中，开始处理时据此计算排队时间
         """
         if not question:
-            return chatbot, None, None
+            return chatbot, None, None, None
         
         # 更新chatbot消息列表 - 使用新的messages格式
         updated_chatbot = list(chatbot) if chatbot is not None else []
         updated_chatbot.append({"role": "user", "content": question})
         
-        return updated_chatbot, None, None
+        return updated_chatbot, None, None, time.perf_counter()
+    
+    def process_question(self, question, chatbot, submitted_at=None):
+        """
+        处理用户问题并生成AI回答，同时记录各阶段耗时、token用量和重试次数
+        
+        Args:
+            question: 用户问题
+            chatbot: 当前对话内容
+            submitted_at: ask_question返回的提交时间
+            
+        Returns:
+            tuple: (对话内容, 图表文件, 图表信息, 交互式图表, 本次保存的记录ID, 结果数据区状态)，
+                记录ID和结果数据区状态保存在浏览器会话的状态中
+        """
+        queue_ms = 0.0
+        if submitted_at is not None:
+            queue_ms = (time.perf_counter() - submitted_at) * 1000
+        
+        timer = start_request(queue_ms)
+        # 本次请求的状态、保存的记录ID和表格结果ID，由_process_question填写
+        outcome = {"status": None, "record_id": None, "result_id": None}
+        try:
+            response = self._process_question(question, chatbot, outcome)
+            return response + (outcome["record_id"], self.new_result_state(outcome["result_id"]))
+        finally:
+            finish_request()
+            # 较早的问答合并为滚动摘要，控制后续提示中的记忆长度
+            if outcome["status"] is not None and self.agent is not None:
+                folded = compact_memory(self.agent)
+                if folded:
+                    print(f"🧠 对话记忆已压缩: {folded} 条较早的消息合并为摘要")
+            # 问答成功后更新会话快照中的对话记忆
+            if outcome["status"] == "ok":
+                self._save_session_snapshot()
+            # 只记录实际调用了模型的请求
+            if outcome["status"] is not None:
+                self.db_manager.telemetry.record(
+                    self.llm_type,
+                    self.get_model_name(),
+                    timer.to_metrics(),
+                    record_id=outcome["record_id"],
+                    status=outcome["status"]
+                )
     
-    def process_question(self, question, chatbot):
+    def _process_question(self, question, chatbot, outcome):
         """
         处理用户问题并生成AI回答
+        
+        Args:
+            question: 用户问题
+            chatbot: 当前对话内容
+            outcome: 请求结果，进入模型调用后填写status（ok/error），保存记录后填写record_id，
+                表格结果单独存储时填写result_id
         """
         if not question:
-            return chatbot, None, None
+            return chatbot, None, None, None
             
         # 更新chatbot消息列表 - 使用新的messages格式
         updated_chatbot = list(chatbot) if chatbot is not None else []
@@ -411,7 +746,7 @@ class AppController:
                     {"role": "user", "content": question},
                     {"role": "assistant", "content": self.get_text("please_upload")}
                 ])
-            return updated_chatbot, None, None
+            return updated_chatbot, None, None, None
             
         # 初始化AI模型（如果尚未初始化）
         if self.agent is None:
@@ -424,7 +759,7 @@ class AppController:
                         {"role": "user", "content": question},
                         {"role": "assistant", "content": f"{self.get_text('init_failed')}: {init_result}"}
                     ])
-                return updated_chatbot, None, None
+                return updated_chatbot, None, None, None
         
         # 更新最后一条消息的回答为"思考中..."或添加新的助手消息
         if updated_chatbot and len(updated_chatbot) > 0 and updated_chatbot[-1].get("role") == "user":
@@ -439,106 +774,63 @@ class AppController:
         should_generate_chart = ChartAnalyzer.is_visualization_required(question)
         print(f"用户问题: '{question}' - 是否需要生成图表: {should_generate_chart}")
         
+        # 声明式图表模式下不在服务器端绘图，而是让LLM返回聚合数据
+        use_chart_spec = should_generate_chart and self.chart_output_mode == "spec"
+        chart_spec = None
+        self.current_chart_spec = None
+        
         # 重试机制
         max_retries = 3
         retry_count = 0
         
         chart_file_for_display = None  # 用于独立图片显示区域
         chart_info_text = self.get_text("no_chart")  # 图表信息文本
+        chart_plot = None  # 交互式图表区域
         
         while retry_count < max_retries:
+            # 进入模型调用后才记录遥测数据，失败时状态保持为error
+            outcome["status"] = "error"
             try:
                 # 清理旧图表记录
                 latest_chart_time = 0
                 chart_file = None
                 
-                # 如果用户明确要求绘图，临时启用自动可视化
-                # 在PandasAI 2.0+中，配置保存在_config字典中而不是config对象中
-                if hasattr(self.agent, "_config"):
-                    current_config = self.agent._config
-                    
-                    # 检测提问的语言
-                    is_chinese = LanguageUtils.is_chinese(question)
-                    response_language = "zh" if is_chinese else "en"
-                    
-                    # 根据检测到的语言修改问题，添加语言提示
-                    modified_question = question
-                    if is_chinese:
-                        # 如果是中文提问，确保回答是中文
-                        if not any(keyword in question.lower() for keyword in ['中文', '请用中文', '用中文回答']):
-                            modified_question = f"{question}。请用中文回答。"
-                    else:
-                        # 如果是英文提问，确保回答是英文
-                        if not any(keyword in question.lower() for keyword in ['english', 'in english', 'respond in english']):
-                            modified_question = f"{question}. Please respond in English."
-                    
-                    print(f"🔤 语言检测: {'中文' if is_chinese else '英文'}")
-                    print(f"🔤 原问题: {question}")
-                    print(f"🔤 修改后问题: {modified_question}")
-                    
-                    # 创建新的配置字典，保留原始配置的所有内容
-                    config_dict = {
-                        "llm": current_config.get("llm", None),
-                        "save_charts": current_config.get("save_charts", True),
-                        "verbose": current_config.get("verbose", True),
-                        "enforce_privacy": current_config.get("enforce_privacy", False),
-                        "auto_vis": should_generate_chart,  # 根据用户意图设置auto_vis
-                        "enable_cache": current_config.get("enable_cache", False),
-                        "custom_head": current_config.get("custom_head", 5)
-                    }
-                    
-                    # 确保中文字体配置并获取plot_kwargs
-                    plot_kwargs = ensure_chinese_font_for_pandasai()
-                    
-                    # 安全地添加custom_plot_kwargs
-                    if "custom_plot_kwargs" in current_config:
-                        # 合并现有配置和中文字体配置
-                        existing_kwargs = current_config["custom_plot_kwargs"]
-                        if isinstance(existing_kwargs, dict):
-                            existing_kwargs.update(plot_kwargs)
-                            config_dict["custom_plot_kwargs"] = existing_kwargs
-                        else:
-                            config_dict["custom_plot_kwargs"] = plot_kwargs
-                    else:
-                        config_dict["custom_plot_kwargs"] = plot_kwargs
-                    
-                    # 重新应用配置
-                    self.agent._config = config_dict
-                    
-                    # 在调用chat前再次确保字体配置
-                    ensure_chinese_font_for_pandasai()
-                    
-                    # 使用修改后的问题调用Agent的chat方法
-                    result = self.agent.chat(modified_question)
-                    
-                    # 恢复默认设置（关闭自动可视化）
-                    config_dict["auto_vis"] = False
-                    self.agent._config = config_dict
-                else:
-                    # 不支持配置的情况下，仍然添加语言提示
-                    is_chinese = LanguageUtils.is_chinese(question)
-                    modified_question = question
-                    if is_chinese:
-                        if not any(keyword in question.lower() for keyword in ['中文', '请用中文', '用中文回答']):
-                            modified_question = f"{question}。请用中文回答。"
-                    else:
-                        if not any(keyword in question.lower() for keyword in ['english', 'in english', 'respond in english']):
-                            modified_question = f"{question}. Please respond in English."
-                    
-                    print(f"🔤 语言检测: {'中文' if is_chinese else '英文'}")
-                    print(f"🔤 修改后问题: {modified_question}")
-                    
-                    # 确保中文字体配置
-                    ensure_chinese_font_for_pandasai()
-                    
-                    # 直接使用chat方法
-                    result = self.agent.chat(modified_question)
+                # 本次问答的执行参数随请求传递，不修改共享的Agent配置
+                execution = build_execution_context(
+                    question,
+                    should_generate_chart,
+                    use_chart_spec,
+                    plot_kwargs=self.plot_kwargs,
+                    output_dir="charts"
+                )
+                print(f"🔤 语言检测: {'中文' if execution.response_language == 'zh' else '英文'}")
+                print(f"🔤 原问题: {question}")
+                print(f"🔤 修改后问题: {execution.prompt}")
+                
+                with execution_scope(execution):
+                    result = self.agent.chat(execution.prompt)
+                
+                # 输出生成代码的向量化分析结果
+                vectorization_report = pop_code_report()
+                if vectorization_report and vectorization_report["hits"]:
+                    hit_patterns = sorted({hit["pattern"] for hit in vectorization_report["hits"]})
+                    print(f"⚡ 生成代码命中非向量化写法: {', '.join(hit_patterns)}，"
+                          f"自动改写{vectorization_report['rewrites']}处，剩余{len(vectorization_report['remaining'])}处")
                 
                 # 检查结果中是否包含图表路径
                 print(f"🔍 检查AI返回结果: {result}")
                 print(f"🔍 结果类型: {type(result)}")
                 
-                if isinstance(result, dict):
+                # 大型表格结果单独压缩存储，回答和历史记录中只保留摘要
+                result_table = extract_table(result)
+                result_id = None
+                if result_table is not None:
+                    result_id = self.db_manager.result_store.save(result_table)
+                    outcome["result_id"] = result_id
+                    processed_result = f"{self.get_text('result_table_summary')} {summarize_table(result_table)}"
+                    if result_id:
+                        processed_result += f"\n\n{self.get_text('result_table_view_below')}"
+                elif isinstance(result, dict):
                     # 检查常见的图表路径字段
                     for path_field in ['path', 'figure_path', 'chart_path', 'image_path', 'plot_path']:
                         if path_field in result and isinstance(result[path_field], str) and os.path.exists(result[path_field]):
@@ -613,8 +905,22 @@ class AppController:
                     processed_result = self.get_text("chart_result")
                     print(f"✅ 从字符串结果检测到图表: {chart_file}")
                 
+                # 声明式图表模式：从返回的聚合数据构建图表规格，不再扫描图表目录
+                if use_chart_spec and not chart_file:
+                    chart_spec = ChartSpecBuilder.from_result(result, question)
+                    if chart_spec:
+                        processed_result = self.get_text("chart_spec_generated", len(chart_spec["data"]["values"]))
+                        print(f"✅ 已生成声明式图表规格: {chart_spec['mark']['type']}, {len(chart_spec['data']['values'])} 行数据")
+                
+                # 使用本次执行期间保存的图表，不受其他并行请求的影响
+                if not chart_file and not chart_spec:
+                    recorded_chart = execution.latest_chart()
+                    if recorded_chart and os.path.exists(recorded_chart):
+                        chart_file = recorded_chart
+                        print(f"✅ 从执行上下文检测到图表: {chart_file}")
+                
                 # 如果还没有检测到图表文件，作为备用方案扫描目录
-                if not chart_file:
+                if not chart_file and not chart_spec:
                     print("🔍 未从结果中检测到图表，开始目录扫描...")
                     chart_dirs = ["charts", "exports/charts"]
                     
@@ -638,27 +944,13 @@ class AppController:
                 if chart_file and os.path.exists(chart_file):
                     print(f"✅ 确认图表文件存在: {chart_file}")
                     
-                    # 如果图表在exports/charts目录，复制到charts目录以保持一致性
-                    final_chart_path = chart_file
-                    if chart_file.startswith('exports/charts/'):
-                        # 提取文件名
-                        chart_filename = os.path.basename(chart_file)
-                        # 目标路径在charts目录
-                        target_path = os.path.join('charts', chart_filename)
-                        
-                        try:
-                            # 复制文件到charts目录
-                            import shutil
-                            shutil.copy2(chart_file, target_path)
-                            final_chart_path = target_path
-                            print(f"📋 图表已复制到主目录: {final_chart_path}")
-                        except Exception as e:
-                            print(f"⚠️ 复制图表文件失败: {str(e)}, 使用原路径")
-                            # 如果复制失败，使用原路径
-                            final_chart_path = chart_file
+                    # 如果图表在exports/charts目录，复制到本次执行的图表输出目录以保持一致性
+                    final_chart_path = self._collect_chart_file(chart_file, execution.output_dir)
                     
-                    # 设置独立图片显示区域的数据
-                    chart_file_for_display = final_chart_path
+                    # 生成紧凑的展示图和缩略图，独立图片显示区域使用展示图
+                    with timed_stage("chart"):
+                        chart_variants = chart_optimizer.optimize(final_chart_path)
+                    chart_file_for_display = chart_variants["display"]
                     
                     # 获取绝对路径
                     absolute_path = os.path.abspath(final_chart_path)
@@ -667,18 +959,34 @@ class AppController:
 {self.get_text('generation_time')}: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 {self.get_text('chart_path')}: {absolute_path}"""
                     
-                    # 保存到本地存储，同时尝试上传到OSS
-                    local_path, oss_url = chart_storage.save_chart(final_chart_path)
+                    # 保存到本地存储，同时尝试上传到OSS（上传时间单独计入upload）
+                    with timed_stage("chart"):
+                        local_path, oss_url = chart_storage.save_chart(final_chart_path)
                     
                     if oss_url:
                         # 使用OSS URL - 创建包含文本和图片的内容
                         updated_chatbot[-1]["content"] = f"{processed_result}\n\n![Chart]({oss_url})"
                     else:
-                        # 使用简单的文本描述，因为有独立的图片显示区域
-                        updated_chatbot[-1]["content"] = f"{processed_result}\n\n✅ {self.get_text('chart_generated_view_right')}"
+                        # 聊天框中只显示缩略图，完整图表在独立的图片显示区域
+                        thumbnail_md = create_thumbnail_markdown(final_chart_path, self.get_text('generated_chart'))
+                        thumbnail_part = f"{thumbnail_md}\n\n" if thumbnail_md else ""
+                        updated_chatbot[-1]["content"] = f"{processed_result}\n\n{thumbnail_part}✅ {self.get_text('chart_generated_view_right')}"
                     
                     # 使用复制后的路径保存到数据库
                     chart_file = final_chart_path
+                elif chart_spec:
+                    # 交互式图表由浏览器端渲染，显示在右侧区域
+                    self.current_chart_spec = chart_spec
+                    updated_chatbot[-1]["content"] = f"{processed_result}\n\n✅ {self.get_text('chart_generated_view_right')}"
+                    chart_info_text = f"""{self.get_text('chart_file')}: {self.get_text('interactive_chart')}
+{self.get_text('generation_time')}: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"""
+                    chart_plot = ChartSpecBuilder.to_plot(chart_spec)
+                    if chart_plot is None:
+                        # 无法在浏览器端渲染（未安装altair等）时，在服务器端导出PNG显示在图片区域
+                        with timed_stage("chart"):
+                            png_file, png_info = self._render_chart_spec_png(chart_spec)
+                        if png_file:
+                            chart_file_for_display, chart_info_text = png_file, png_info
                 else:
                     # 仅更新文本内容
                     updated_chatbot[-1]["content"] = processed_result
@@ -687,10 +995,12 @@ class AppController:
                 history_content = processed_result
                 if chart_file:
                     history_content += f"\n[{self.get_text('chart_alt_text', os.path.basename(chart_file))}]"
+                elif chart_spec:
+                    history_content += f"\n[{self.get_text('chart_alt_text', self.get_text('interactive_chart'))}]"
                 
-                # 保存聊天记录到SQLite数据库
+                # 保存聊天记录到SQLite数据库（后台组提交写入，立即得到记录ID）
                 model_name = self.get_model_name()
-                self.db_manager.save_chat_history(
+                record_id = self.db_manager.save_chat_history(
                     self.session_id, 
                     self.session_file, 
                     self.client_id, 
@@ -698,16 +1008,21 @@ class AppController:
                     history_content, 
                     self.llm_type, 
                     model_name,
-                    chart_path=chart_file  # 直接传入图表文件路径
+                    chart_path=chart_file,  # 直接传入图表文件路径
+                    chart_spec=ChartSpecBuilder.to_json(chart_spec),
+                    result_id=result_id
                 )
+                outcome["status"] = "ok"
+                outcome["record_id"] = record_id
                 
-                return updated_chatbot, chart_file_for_display, chart_info_text
+                return updated_chatbot, chart_file_for_display, chart_info_text, chart_plot
             except requests.exceptions.ConnectionError as e:
                 retry_count += 1
+                current_request().retries = retry_count
                 if retry_count >= max_retries:
                     error_msg = self.get_text("network_error")
                     updated_chatbot[-1]["content"] = error_msg
-                    return updated_chatbot, None, self.get_text("network_connection_error")
+                    return updated_chatbot, None, self.get_text("network_connection_error"), None
                 time.sleep(2)  # 重试前等待2秒
             except KeyError as e:
                 # 专门处理列名错误
@@ -719,7 +1034,7 @@ class AppController:
                     error_msg = f"数据列访问错误：{str(e)}"
                 
                 updated_chatbot[-1]["content"] = error_msg
-                return updated_chatbot, None, f"错误: {error_msg}"
+                return updated_chatbot, None, f"错误: {error_msg}", None
             except Exception as e:
                 error_msg = str(e)
                 if "Connection error" in error_msg or "SSL" in error_msg or "EOF occurred" in error_msg:
@@ -728,13 +1043,177 @@ class AppController:
                     error_msg = self.get_text("processing_error", error_msg)
                 
                 updated_chatbot[-1]["content"] = error_msg
-                return updated_chatbot, None, f"处理错误: {error_msg}"
+                return updated_chatbot, None, f"处理错误: {error_msg}", None
+    
+    def _collect_chart_file(self, chart_file, output_dir="charts"):
+        """
+        把PandasAI导出目录中的图表复制到图表输出目录
+        
+        Args:
+            chart_file: 生成的图表文件路径
+            output_dir: 图表输出目录
+            
+        Returns:
+            str: 复制后的图表路径，无需复制或复制失败时返回原路径
+        """
+        if not chart_file.startswith('exports/charts/'):
+            return chart_file
+        
+        # 目标路径在图表输出目录，文件名不变
+        target_path = os.path.join(output_dir, os.path.basename(chart_file))
+        try:
+            shutil.copy2(chart_file, target_path)
+            print(f"📋 图表已复制到主目录: {target_path}")
+            return target_path
+        except Exception as e:
+            print(f"⚠️ 复制图表文件失败: {str(e)}, 使用原路径")
+            return chart_file
+    
+    def set_chart_output_mode(self, mode):
+        """
+        设置图表输出模式
+        
+        Args:
+            mode: "image"（服务器端渲染PNG）或 "spec"（浏览器端渲染交互式图表）
+        """
+        if mode in ["image", "spec"]:
+            self.chart_output_mode = mode
+            print(f"图表输出模式已切换为: {mode}")
+    
+    def export_chart_png(self):
+        """
+        将当前的交互式图表按需导出为PNG
+        
+        Returns:
+            tuple: (图表文件路径, 图表信息文本)
+        """
+        if not self.current_chart_spec:
+            return None, self.get_text("no_chart_spec")
+        
+        return self._render_chart_spec_png(self.current_chart_spec)
+    
+    def _render_chart_spec_png(self, chart_spec):
+        """
+        在服务器端将指定的图表规格渲染为PNG
+        
+        处理请求时传入本次请求的规格，不读取共享的 current_chart_spec，避免并发请求互相覆盖
+        
+        Args:
+            chart_spec: Vega-Lite规格
+            
+        Returns:
+            tuple: (展示图路径, 图表信息文本)，渲染失败时为 (None, 提示文本)
+        """
+        chart_file = ChartSpecBuilder.render_png(chart_spec)
+        if not chart_file:
+            return None, self.get_text("no_chart_spec")
+        
+        chart_variants = chart_optimizer.optimize(chart_file)
+        chart_info = f"""{self.get_text('chart_file')}: {os.path.basename(chart_file)}
+{self.get_text('generation_time')}: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+{self.get_text('chart_path')}: {os.path.abspath(chart_file)}"""
+        return chart_variants["display"], chart_info
+    
+    def get_request_stats_headers(self):
+        """获取性能统计表格的表头"""
+        return [
+            self.get_text("stats_provider"),
+            self.get_text("stats_model"),
+            self.get_text("stats_metric"),
+            self.get_text("stats_count"),
+            "P50", "P95", "P99",
+            self.get_text("stats_avg"),
+            self.get_text("stats_max")
+        ]
+    
+    def get_request_stats(self, period="7d"):
+        """
+        按提供方和模型统计请求各阶段耗时和token用量的分位数
+        
+        Args:
+            period: 统计范围 "24h"、"7d" 或 "30d"
+            
+        Returns:
+            pd.DataFrame: 性能统计表格
+        """
+        hours = {"24h": 24, "7d": 24 * 7, "30d": 24 * 30}.get(period, 24 * 7)
+        stats = self.db_manager.telemetry.get_stats(hours=hours)
+        
+        def fmt(value):
+            return "" if value is None else f"{value:.0f}" if value >= 10 else f"{value:.1f}"
+        
+        rows = [
+            [
+                stat["llm_type"],
+                stat["model_name"],
+                self.get_text(f"metric_{stat['metric']}"),
+                stat["count"],
+                fmt(stat["p50"]), fmt(stat["p95"]), fmt(stat["p99"]),
+                fmt(stat["avg"]), fmt(stat["max"])
+            ]
+            for stat in stats
+        ]
+        if not rows:
+            rows = [["", "", self.get_text("no_request_stats"), 0, "", "", "", "", ""]]
+        return pd.DataFrame(rows, columns=self.get_request_stats_headers())
+    
+    @staticmethod
+    def new_result_state(result_id=None):
+        """
+        创建结果数据区的状态（每个浏览器会话一份，保存在gr.State中）
+        
+        Args:
+            result_id: 显示的表格结果ID，None表示没有表格结果
+            
+        Returns:
+            dict: result_id为表格结果ID，page为当前页码
+        """
+        return {"result_id": result_id, "page": 1}
+    
+    def get_result_page(self, state, page=None):
+        """
+        获取当前表格结果的一页数据
+        
+        Args:
+            state: 结果数据区的状态
+            page: 页码（从1开始），None表示当前页
+            
+        Returns:
+            tuple: (当前页DataFrame, 分页信息文本, 结果数据区的状态)
+        """
+        state = state or self.new_result_state()
+        if not state["result_id"]:
+            return None, self.get_text("no_result_table"), state
+        
+        info = self.db_manager.result_store.get_info(state["result_id"])
+        if not info:
+            return None, self.get_text("no_result_table"), state
+        total_pages = max(1, -(-info["row_count"] // RESULT_PAGE_SIZE))
+        
+        page = state["page"] if page is None else int(page)
+        state["page"] = min(max(page, 1), total_pages)
+        
+        df, _ = self.db_manager.result_store.load_page(state["result_id"], state["page"])
+        return df, self.get_text("result_page_info", state["page"], total_pages, info["row_count"]), state
+    
+    def next_result_page(self, state):
+        """结果数据区翻到下一页"""
+        return self.get_result_page(state, (state or self.new_result_state())["page"] + 1)
+    
+    def prev_result_page(self, state):
+        """结果数据区翻到上一页"""
+        return self.get_result_page(state, (state or self.new_result_state())["page"] - 1)
+    
+    def get_current_chart_plot(self):
+        """获取当前交互式图表的Plot组件值"""
+        return ChartSpecBuilder.to_plot(self.current_chart_spec)
     
     def clear_chat(self, chatbot):
         """清空当前聊天界面和图表显示"""
         # 清理当前会话的图表文件（不保留引用，因为用户要求清空）
         self._clean_chart_files(preserve_referenced=False)
-        return [], None, self.get_text("no_chart")
+        self.current_chart_spec = None
+        return [], None, self.get_text("no_chart"), None
     
     def delete_session_history(self, session_id):
         """
@@ -747,18 +1226,275 @@ class AppController:
             return
             
         success = self.db_manager.delete_session_history(session_id)
+        # 无法确定各表格已加载的记录中哪些属于该会话，下次刷新时重新加载
+        self.history_generation += 1
         
         # 函数现在不需要返回值，因为UI不再显示结果
         return
     
     def delete_all_history(self):
         """
-        删除所有聊天历史记录
+        分批删除所有聊天历史记录，逐批返回删除进度
+        
+        Yields:
+            str: 进度消息
+        """
+        try:
+            for deleted, total in self.db_manager.iter_delete_history():
+                yield self.get_text("deleting_history_progress", deleted, total)
+                self.history_generation += 1
+        except Exception as e:
+            print(f"删除所有历史记录失败: {str(e)}")
+            yield f"{self.get_text('record_delete_failed')}: {str(e)}"
+    
+    def export_history(self, data_format="jsonl"):
         """
-        success = self.db_manager.delete_all_history()
+        流式导出全部对话记录（含图表文件）为zip包，逐批返回导出进度
         
-        # 函数现在不需要返回值，因为UI不再显示结果
-        return
+        Args:
+            data_format: jsonl 或 parquet
+            
+        Yields:
+            tuple: (进度消息, 导出包路径)，导出完成前路径为None
+        """
+        try:
+            for stage, done, total in self.db_manager.iter_export_history(data_format=data_format):
+                if stage == "done":
+                    yield self.get_text("history_exported", total), done
+                else:
+                    yield self.get_text("exporting_history_progress", self.get_text(f"transfer_table_{stage}"), done, total), None
+        except Exception as e:
+            print(f"导出历史记录失败: {str(e)}")
+            yield self.get_text("history_transfer_failed", str(e)), None
+    
+    def import_history(self, file):
+        """
+        从导出包批量导入对话记录，逐批返回导入进度
+        
+        Args:
+            file: 导出包路径
+            
+        Yields:
+            str: 进度消息
+        """
+        if not file:
+            yield self.get_text("import_bundle_file")
+            return
+        try:
+            for stage, done, total in self.db_manager.iter_import_history(file):
+                if stage == "done":
+                    self.history_generation += 1
+                    yield self.get_text("history_imported", done, total)
+                else:
+                    yield self.get_text("importing_history_progress", self.get_text(f"transfer_table_{stage}"), done, total)
+        except Exception as e:
+            print(f"导入历史记录失败: {str(e)}")
+            yield self.get_text("history_transfer_failed", str(e))
+    
+    def get_batch_headers(self):
+        """获取批量运行进度表格的表头"""
+        return [
+            "#",
+            self.get_text("history_question"),
+            self.get_text("batch_col_status"),
+            self.get_text("history_answer"),
+            self.get_text("batch_col_elapsed")
+        ]
+    
+    def _batch_rows(self, questions, results):
+        """批量运行进度表格的行"""
+        rows = []
+        for index, question in enumerate(questions):
+            item = results[index]
+            if item is None:
+                rows.append([index + 1, question, self.get_text("batch_status_pending"), "", ""])
+                continue
+            answer = str(item.get("answer", ""))
+            if len(answer) > 100:
+                answer = answer[:100] + "..."
+            status = self.get_text("batch_status_ok" if item["status"] == "ok" else "batch_status_error")
+            rows.append([index + 1, question, status, answer, f"{item.get('elapsed', 0):.1f}"])
+        return rows
+    
+    def run_batch(self, questions_text, questions_file, parallelism=BATCH_MAX_WORKERS):
+        """
+        并发运行问题清单，每完成一个问题返回一次进度，全部完成后生成汇总报告
+        
+        Args:
+            questions_text: 粘贴的问题（每行一个）
+            questions_file: 上传的问题清单文件路径
+            parallelism: 并发数
+            
+        Yields:
+            tuple: (进度消息, 进度表格行, 报告包路径)，报告生成前路径为None
+        """
+        if self.df is None:
+            yield self.get_text("please_upload"), [], None
+            return
+        try:
+            questions = parse_questions(questions_text, questions_file)
+        except Exception as e:
+            print(f"解析问题清单失败: {str(e)}")
+            yield self.get_text("batch_failed", str(e)), [], None
+            return
+        if not questions:
+            yield self.get_text("batch_no_questions"), [], None
+            return
+        
+        # 获取LLM实例（与交互问答共用同一个客户端）
+        llm_type = self.llm_type
+        llm, success, error_msg = agent_registry.get_llm(llm_type, self.language)
+        if not success:
+            yield error_msg, [], None
+            return
+        
+        # 批量运行期间上传新文件或切换会话不影响已开始的批量任务：
+        # 会话、数据集和数据描述在开始时确定，之后按需创建的Agent都使用这一份
+        batch_session = (self.session_id, self.session_file, self.client_id)
+        model_name = self.get_model_name()
+        df = self.df
+        data_description = self._generate_data_description()
+        plot_kwargs = ensure_chinese_font_for_pandasai()
+        create_lock = threading.Lock()
+        
+        def create_agent():
+            # 创建Agent时会配置全局的matplotlib字体，逐个创建
+            with create_lock:
+                return self._create_agent(llm, df=df, data_description=data_description)
+        
+        def answer(agent, question):
+            return self._answer_batch_question(agent, question, batch_session, llm_type, model_name, plot_kwargs)
+        
+        runner = BatchRunner(create_agent, answer, max_workers=parallelism or BATCH_MAX_WORKERS)
+        print(f"📋 开始批量运行: {len(questions)} 个问题, 并发 {runner.max_workers}")
+        started = time.perf_counter()
+        results = [None] * len(questions)
+        yield self.get_text("batch_progress", 0, len(questions)), self._batch_rows(questions, results), None
+        
+        try:
+            for done, total, results in runner.run(questions):
+                yield self.get_text("batch_progress", done, total), self._batch_rows(questions, results), None
+            
+            report_path = batch_report.write(
+                results,
+                labels={
+                    "title": self.get_text("batch_report_title"),
+                    "failed": self.get_text("batch_report_failed"),
+                    "elapsed": self.get_text("batch_col_elapsed"),
+                    "full_table": self.get_text("batch_report_full_table"),
+                    "generated_at": self.get_text("batch_report_generated_at")
+                },
+                meta=[
+                    (self.get_text("batch_report_model"), f"{llm_type} ({model_name})"),
+                    (self.get_text("batch_report_data"), batch_session[1])
+                ]
+            )
+        except Exception as e:
+            print(f"批量运行失败: {str(e)}")
+            yield self.get_text("batch_failed", str(e)), self._batch_rows(questions, results), None
+            return
+        
+        # 记录由后台线程写入，确认写入失败的记录（报告中的回答不受影响，只是不会出现在对话记录中）
+        unsaved = [item["record_id"] for item in results if self.db_manager.get_save_error(item.get("record_id"))]
+        if unsaved:
+            print(f"批量问题中有 {len(unsaved)} 条记录未能保存到对话记录: {unsaved}")
+        
+        succeeded = sum(1 for item in results if item["status"] == "ok")
+        elapsed = time.perf_counter() - started
+        yield self.get_text("batch_completed", succeeded, len(results), elapsed), self._batch_rows(questions, results), report_path
+    
+    def _answer_batch_question(self, agent, question, batch_session, llm_type, model_name, plot_kwargs=None):
+        """
+        在批量运行的工作线程上回答一个问题并保存到对话记录
+        
+        与交互问答使用同一条流水线（执行上下文、表格结果存储、图表存储、遥测），
+        但不读写控制器上与当前界面相关的状态（会话和绘图参数在批量运行开始时确定）
+        
+        Returns:
+            dict: question, status, answer, table, chart, record_id
+        """
+        timer = start_request()
+        status = "error"
+        item = {"question": question, "status": "error", "answer": "", "table": None, "chart": None, "record_id": None}
+        try:
+            # 清单中的问题相互独立，不带入上一个问题的对话记忆
+            clear_memory(agent)
+            execution = build_execution_context(
+                question,
+                ChartAnalyzer.is_visualization_required(question),
+                False,  # 报告中需要图片，批量模式始终在服务器端绘图
+                plot_kwargs=plot_kwargs
+            )
+            with execution_scope(execution):
+                result = agent.chat(execution.prompt)
+            
+            answer, chart_file = self._describe_batch_result(result)
+            if not chart_file:
+                recorded_chart = execution.latest_chart()
+                if recorded_chart and os.path.exists(recorded_chart):
+                    chart_file = recorded_chart
+            
+            # 大型表格结果单独压缩存储，报告中附带完整表格
+            result_table = extract_table(result)
+            result_id = None
+            if result_table is not None:
+                result_id = self.db_manager.result_store.save(result_table)
+                answer = f"{self.get_text('result_table_summary')} {summarize_table(result_table)}"
+            
+            history_content = answer
+            if chart_file:
+                chart_file = self._collect_chart_file(chart_file, execution.output_dir)
+                with timed_stage("chart"):
+                    chart_optimizer.optimize(chart_file)
+                    chart_storage.save_chart(chart_file)
+                history_content += f"\n[{self.get_text('chart_alt_text', os.path.basename(chart_file))}]"
+            
+            item["record_id"] = self.db_manager.save_chat_history(
+                batch_session[0],
+                batch_session[1],
+                batch_session[2],
+                question,
+                history_content,
+                llm_type,
+                model_name,
+                chart_path=chart_file,
+                result_id=result_id
+            )
+            item.update(status="ok", answer=answer, table=result_table, chart=chart_file)
+            status = "ok"
+        except Exception as e:
+            print(f"❌ 批量问题处理失败: {question}: {str(e)}")
+            item["answer"] = str(e)
+        finally:
+            finish_request()
+            self.db_manager.telemetry.record(
+                llm_type,
+                model_name,
+                timer.to_metrics(),
+                record_id=item["record_id"],
+                status=status
+            )
+        return item
+    
+    def _describe_batch_result(self, result):
+        """
+        把Agent的返回值转换为报告中的回答文本和图表文件
+        
+        Returns:
+            tuple: (回答文本, 图表文件路径或None)
+        """
+        if isinstance(result, dict) and "type" in result and "value" in result:
+            if result["type"] == "plot":
+                chart_file = result.get("path") or result["value"]
+                if isinstance(chart_file, str) and os.path.exists(chart_file):
+                    return self.get_text("chart_analysis"), chart_file
+            result = result["value"]
+        
+        if isinstance(result, str) and result.endswith(('.png', '.jpg', '.jpeg', '.svg')) and os.path.exists(result):
+            return self.get_text("chart_analysis"), result
+        if isinstance(result, (dict, list)):
+            return json.dumps(result, ensure_ascii=False, indent=2, default=str), None
+        return str(result), None
     
     def load_session(self, session_id):
         """加载指定的会话"""
@@ -768,19 +1504,25 @@ class AppController:
         # 如果session_id是字典，尝试提取值
         if isinstance(session_id, dict) and "value" in session_id:
             session_id = session_id["value"]
+        
+        # 根据会话快照恢复数据和Agent
+        resume_status = self._resume_session(session_id)
             
         # 更新当前会话ID
         self.session_id = session_id
         
         # 获取会话文件名
         self.session_file = self.db_manager.get_session_file_by_id(session_id)
+        status = f"{self.get_text('session_loaded')}: {self.session_file}"
+        if resume_status:
+            status = f"{status} - {resume_status}"
         
         # 加载聊天记录
         history = self.db_manager.get_chat_history_for_session(session_id)
         
         # 如果没有找到记录，返回提示
         if not history:
-            return [], f"{self.get_text('session_loaded')}: {self.session_file} (无对话记录)"
+            return [], f"{status} (无对话记录)"
         
         # 转换为Gradio Chatbot新的messages格式
         chatbot_messages = []
@@ -788,48 +1530,23 @@ class AppController:
             # 添加用户消息
             chatbot_messages.append({"role": "user", "content": msg["question"]})
             
-            # 处理助手回复，检查是否包含图片
-            answer_content = msg["answer"]
-            
-            # 检查是否有图片路径
-            if msg.get('has_chart') and msg.get('chart_path') and os.path.exists(msg['chart_path']):
-                # 分离文本和图片路径
-                text_content = answer_content
-                
-                # 移除图片路径相关文本
-                import re
-                chart_patterns = [
-                    r'本地图片路径:\s*[^\n]+',
-                    r'file://[^\n]+',
-                    r'<img[^>]*>',  # 移除现有的img标签
-                    r'<br><small>图片路径:[^<]*</small>',  # 移除图片路径信息
-                    r'!\[.*?\]\([^)]+\)',  # 移除Markdown图片语法
-                    r'[A-Za-z]:\\[^<>:|?*\n]+\.(png|jpg|jpeg|svg)',  # Windows绝对路径
-                    r'/[^<>:|?*\n]+\.(png|jpg|jpeg|svg)'  # Unix绝对路径
-                ]
-                
-                for pattern in chart_patterns:
-                    text_content = re.sub(pattern, '', text_content)
-                
-                # 清理多余的空行和<br>标签
-                text_content = re.sub(r'(<br>\s*){3,}', '<br><br>', text_content)
-                text_content = re.sub(r'\n{3,}', '\n\n', text_content).strip()
-                
-                # 构建包含图片的HTML内容
-                absolute_path = os.path.abspath(msg['chart_path'])
-                relative_path = os.path.relpath(absolute_path, os.getcwd()).replace('\\', '/')
-                
-                # 使用图片工具创建HTML
-                img_html = create_image_html(msg['chart_path'], "数据分析图表")
+            # 图表信息在保存记录时已解析，直接使用记录的列
+            if msg.get('chart_id'):
+                # 使用图片工具创建HTML，聊天框中优先使用缩略图
+                if msg.get('thumbnail_id'):
+                    img_html = create_image_html(msg['thumbnail_path'], "数据分析图表", chart_id=msg['thumbnail_id'])
+                else:
+                    img_html = create_image_html(msg['chart_path'], "数据分析图表", chart_id=msg['chart_id'])
                 
                 # 合并文本和图片
-                content = f"{text_content}<br><br>{img_html}<br><small>图片路径: {relative_path}</small>"
+                relative_path = msg['chart_path'].replace('\\', '/')
+                content = f"{msg['answer_text']}<br><br>{img_html}<br><small>图片路径: {relative_path}</small>"
                 chatbot_messages.append({"role": "assistant", "content": content})
             else:
                 # 纯文本回复
-                chatbot_messages.append({"role": "assistant", "content": answer_content})
+                chatbot_messages.append({"role": "assistant", "content": msg["answer"]})
         
-        return chatbot_messages, f"{self.get_text('session_loaded')}: {self.session_file}"
+        return chatbot_messages, status
     
     def get_model_name(self):
         """获取当前加载的模型具体名称"""
@@ -870,35 +1587,7 @@ class AppController:
                         return os.getenv("OLLAMA_MODEL", "llama3")
         return self.llm_type  # 如果无法获取具体名称，返回类型
         
-    def get_session_id_by_details(self, timestamp, question):
-        """
-        根据时间戳和问题获取会话ID
-        
-        Args:
-            timestamp: 时间戳，格式为"2025-06-02 17:29 (模型名称)"
-            question: 问题文本
-            
-        Returns:
-            str: 会话ID或空字符串
-        """
-        try:
-            # 从时间戳中提取日期时间部分
-            if '(' in timestamp:
-                time_part = timestamp[:timestamp.find('(')].strip()
-            else:
-                time_part = timestamp.strip()
-                
-            # 删除问题中的省略号
-            if question.endswith('...'):
-                question = question[:-3]
-                
-            # 调用数据库管理器查询会话ID
-            return self.db_manager.get_session_id_by_details(time_part, question)
-        except Exception as e:
-            print(f"根据详情获取会话ID时出错: {str(e)}")
-            return ""
-        
-    def load_history_record(self, session_id, chatbot, specific_record_id=None):
+    def load_history_record(self, session_id, chatbot, specific_record_id=None, result_state=None):
         """
         从历史记录中加载选中的会话记录到当前对话框
         
@@ -906,6 +1595,7 @@ class AppController:
             session_id: 选中的会话ID
             chatbot: 当前的对话框内容
             specific_record_id: 可选，指定要显示图表的记录ID
+            result_state: 可选，本会话结果数据区的状态，改为显示指定记录的表格结果
             
         Returns:
             tuple: 更新后的对话框内容、状态消息、图表文件路径、图表信息
@@ -922,6 +1612,9 @@ class AppController:
                 
             print(f"正在加载会话: {session_id}")
             
+            # 根据会话快照恢复数据和Agent，重启后无需重新上传文件
+            resume_status = self._resume_session(session_id)
+            
             # 更新当前会话ID
             self.session_id = session_id
             
@@ -948,6 +1641,7 @@ class AppController:
             target_chart_info = self.get_text("no_chart")
             
             # 如果指定了特定记录ID，先尝试加载该记录的图表
+            self.current_chart_spec = None
             if specific_record_id:
                 try:
                     chart_file, chart_info, status = self.load_chart_by_record_id(specific_record_id)
@@ -955,11 +1649,23 @@ class AppController:
                         target_chart_file = chart_file
                         target_chart_info = chart_info
                         print(f"✅ 成功加载指定记录 {specific_record_id} 的图表: {chart_file}")
+                    elif self.current_chart_spec:
+                        target_chart_info = chart_info
+                        print(f"✅ 指定记录 {specific_record_id} 包含交互式图表")
                     else:
                         print(f"❌ 指定记录 {specific_record_id} 没有图表或图表不存在")
                 except Exception as e:
                     print(f"❌ 加载指定记录图表失败: {str(e)}")
             
+            # 指定记录的表格结果显示在结果数据区
+            if result_state is not None:
+                result_state.update(self.new_result_state())
+                if specific_record_id:
+                    for msg in history:
+                        if str(msg['id']) == str(specific_record_id):
+                            result_state["result_id"] = msg.get('result_id')
+                            break
+            
             # 转换为Gradio Chatbot新的messages格式
             chatbot_messages = []
             fallback_chart_file = None
@@ -969,84 +1675,47 @@ class AppController:
                 # 添加用户消息
                 chatbot_messages.append({"role": "user", "content": msg["question"]})
                 
-                # 处理助手回复，检查是否包含图片
-                answer_content = msg["answer"]
-                
-                print(f"处理消息 {i+1}: has_chart={msg.get('has_chart')}, chart_path={msg.get('chart_path')}")
-                
-                # 检查是否有图片路径
-                if msg.get('has_chart') and msg.get('chart_path'):
-                    chart_path = msg['chart_path']
-                    print(f"检查图表路径: {chart_path}")
-                    
-                    # 使用新的路径解析方法
-                    resolved_chart_path = self._resolve_chart_path(chart_path)
-                    
-                    if resolved_chart_path:
-                        # 如果还没有目标图表，或者没有指定特定记录ID，则更新备用图表信息
-                        if not target_chart_file:
-                            fallback_chart_file = resolved_chart_path
-                            absolute_path = fallback_chart_file
-                            
-                            fallback_chart_info = f"""{self.get_text('chart_file')}: {os.path.basename(fallback_chart_file)}
+                # 图表信息在保存记录时已解析，直接使用记录的列
+                if msg.get('chart_id'):
+                    # 如果还没有目标图表，则更新备用图表信息
+                    if not target_chart_file:
+                        fallback_chart_file = msg['display_path'] or msg['chart_path']
+                        absolute_path = os.path.abspath(msg['chart_path'])
+                        
+                        fallback_chart_info = f"""{self.get_text('chart_file')}: {os.path.basename(absolute_path)}
 {self.get_text('loading_time')}: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 {self.get_text('chart_path')}: {absolute_path}"""
-                            
-                            print(f"更新备用图表信息: 文件={fallback_chart_file}, 绝对路径={absolute_path}")
-                        
-                        # 分离文本和图片路径
-                        text_content = answer_content
-                        
-                        # 移除图片路径相关文本
-                        import re
-                        chart_patterns = [
-                            r'本地图片路径:\s*[^\n]+',
-                            r'file://[^\n]+',
-                            r'<img[^>]*>',  # 移除现有的img标签
-                            r'<br><small>图片路径:[^<]*</small>',  # 移除图片路径信息
-                            r'!\[.*?\]\([^)]+\)',  # 移除Markdown图片语法
-                            r'[A-Za-z]:\\[^<>:|?*\n]+\.(png|jpg|jpeg|svg)',  # Windows绝对路径
-                            r'/[^<>:|?*\n]+\.(png|jpg|jpeg|svg)',  # Unix绝对路径
-                            r'exports/charts/[^<>:|?*\n]+\.(png|jpg|jpeg|svg)',  # exports目录路径
-                            r'charts/[^<>:|?*\n]+\.(png|jpg|jpeg|svg)'  # charts目录路径
-                        ]
-                        
-                        for pattern in chart_patterns:
-                            text_content = re.sub(pattern, '', text_content)
-                        
-                        # 清理多余的空行和<br>标签
-                        text_content = re.sub(r'(<br>\s*){3,}', '<br><br>', text_content)
-                        text_content = re.sub(r'\n{3,}', '\n\n', text_content).strip()
-                        
-                        # 添加提示信息而不是实际的图片HTML
-                        content = f"{text_content}\n\n✅ {self.get_text('chart_loaded_view_right')}"
-                        chatbot_messages.append({"role": "assistant", "content": content})
-                    else:
-                        print(f"❌ 未找到图表文件: {chart_path}")
-                        # 纯文本回复
-                        chatbot_messages.append({"role": "assistant", "content": answer_content})
+                    
+                    # 添加提示信息而不是实际的图片HTML
+                    content = f"{msg['answer_text']}\n\n✅ {self.get_text('chart_loaded_view_right')}"
+                    chatbot_messages.append({"role": "assistant", "content": content})
                 else:
-                    print(f"无图表信息: has_chart={msg.get('has_chart')}, chart_path={msg.get('chart_path')}")
                     # 纯文本回复
-                    chatbot_messages.append({"role": "assistant", "content": answer_content})
+                    chatbot_messages.append({"role": "assistant", "content": msg["answer"]})
             
             # 决定最终显示的图表：优先使用目标图表，否则使用备用图表
-            final_chart_file = target_chart_file if target_chart_file else fallback_chart_file
-            final_chart_info = target_chart_info if target_chart_file else fallback_chart_info
+            # 指定记录为交互式图表时，不再回退显示其他记录的图片
+            use_target = bool(target_chart_file or self.current_chart_spec)
+            final_chart_file = target_chart_file if use_target else fallback_chart_file
+            final_chart_info = target_chart_info if use_target else fallback_chart_info
             
             print(f"最终图表信息: final_chart_file={final_chart_file}, final_chart_info={final_chart_info}")
             
-            return chatbot_messages, f"{self.get_text('session_loaded_from_history')}: {self.session_file}", final_chart_file, final_chart_info
+            status = f"{self.get_text('session_loaded_from_history')}: {self.session_file}"
+            if resume_status:
+                status = f"{status} - {resume_status}"
+            return chatbot_messages, status, final_chart_file, final_chart_info
         except Exception as e:
             print(f"加载会话记录时出错: {str(e)}")
             return chatbot, f"加载会话记录失败: {str(e)}", None, f"加载错误: {str(e)}"
     
-    def delete_record(self, record_id):
+    def delete_record(self, record_id, shown_question=None):
         """
         删除单条聊天记录
         
         Args:
             record_id: 记录ID
+            shown_question: 表格中该行显示的问题，提供时先确认记录与用户看到的一致
             
         Returns:
             tuple: (是否成功, 消息)
@@ -1056,6 +1725,12 @@ class AppController:
                 print("未选择记录ID")
                 return False, self.get_text("no_row_selected")
             
+            if shown_question is not None:
+                record_info = self.db_manager.get_record_info(record_id)
+                if not record_info or self.db_manager.format_question(record_info['question']) != shown_question:
+                    print(f"记录 {record_id} 与表格中显示的问题不一致，取消删除")
+                    return False, self.get_text("record_changed")
+            
             print(f"正在删除记录: {record_id}")
             success = self.db_manager.delete_record(record_id)
             
@@ -1086,103 +1761,26 @@ class AppController:
             print(f"通过记录ID获取会话ID时出错: {str(e)}")
             return ""
     
-    def get_record_by_time_question(self, time_question_info):
+    def get_record_info(self, record_id):
         """
-        通过时间和问题信息获取记录详细信息
+        通过记录ID获取记录详细信息（主键查询）
         
         Args:
-            time_question_info: 格式为"时间信息|问题信息"的字符串
+            record_id: 记录ID
             
         Returns:
             dict: 包含session_id, record_id, has_chart等信息的字典
         """
         try:
-            # 首先获取record_id
-            record_id = self.db_manager.get_record_by_time_and_question(time_question_info)
-            
             if not record_id:
                 return None
             
-            # 获取记录的详细信息
-            conn = self.db_manager._connect()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                '''
-                SELECT 
-                    session_id,
-                    has_chart,
-                    chart_path
-                FROM 
-                    chat_history 
-                WHERE 
-                    id = ?
-                ''',
-                (record_id,)
-            )
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                return {
-                    'session_id': result[0],
-                    'record_id': record_id,
-                    'has_chart': result[1],
-                    'chart_path': result[2]
-                }
-            return None
+            return self.db_manager.get_record_info(record_id)
             
         except Exception as e:
-            print(f"通过时间和问题获取记录信息时出错: {str(e)}")
+            print(f"通过记录ID获取记录信息时出错: {str(e)}")
             return None
     
-    def _resolve_chart_path(self, chart_path):
-        """
-        解析图表文件路径，尝试在多个可能的位置查找文件
-        
-        Args:
-            chart_path: 原始图表路径
-            
-        Returns:
-            str: 找到的图表文件的绝对路径，如果未找到则返回None
-        """
-        if not chart_path:
-            return None
-            
-        # 如果路径直接存在，返回绝对路径
-        if os.path.exists(chart_path):
-            return os.path.abspath(chart_path)
-        
-        # 提取文件名
-        chart_filename = os.path.basename(chart_path)
-        
-        # 尝试在多个可能的位置查找
-        possible_paths = [
-            chart_path,  # 原始路径
-            os.path.join('charts', chart_filename),  # charts目录
-            os.path.join('exports/charts', chart_filename),  # exports/charts目录
-            chart_filename,  # 当前目录
-        ]
-        
-        # 如果原路径包含目录，也尝试相对路径
-        if '/' in chart_path or '\\' in chart_path:
-            # 如果是exports/charts路径，尝试charts目录
-            if 'exports/charts' in chart_path:
-                possible_paths.append(chart_path.replace('exports/charts', 'charts'))
-            # 如果是charts路径，尝试exports/charts目录
-            elif 'charts' in chart_path:
-                possible_paths.append(chart_path.replace('charts', 'exports/charts'))
-        
-        # 逐一尝试路径
-        for possible_path in possible_paths:
-            if os.path.exists(possible_path):
-                print(f"✅ 在位置找到图表文件: {possible_path}")
-                return os.path.abspath(possible_path)
-        
-        print(f"❌ 未找到图表文件: {chart_path}, 尝试了 {len(possible_paths)} 个位置")
-        return None
-    
     def load_chart_by_record_id(self, record_id):
         """
         根据记录ID加载对应的图表
@@ -1198,38 +1796,41 @@ class AppController:
                 return None, self.get_text("no_chart"), "未指定记录ID"
             
             # 从数据库获取记录信息
-            conn = self.db_manager._connect()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT has_chart, chart_path, question, answer, created_at
-                FROM chat_history 
-                WHERE id = ?
-            ''', (record_id,))
-            
-            record = cursor.fetchone()
-            conn.close()
+            record = self.db_manager.get_chart_record(record_id)
             
             if not record:
                 return None, self.get_text("no_chart"), "未找到指定记录"
             
-            has_chart, chart_path, question, answer, created_at = record
-            
-            if not has_chart or not chart_path:
+            chart_id, chart_path, display_path, created_at, chart_spec = record
+            
+            # 声明式图表记录：交给浏览器端渲染
+            chart_spec = ChartSpecBuilder.from_json(chart_spec)
+            self.current_chart_spec = chart_spec
+            if chart_spec and not chart_path:
+                if not ALTAIR_AVAILABLE:
+                    # 未安装altair时在服务器端导出PNG显示
+                    png_file, png_info = self._render_chart_spec_png(chart_spec)
+                    if png_file:
+                        return png_file, png_info, "图表加载成功"
+                chart_info = f"{self.get_text('chart_file')}: {self.get_text('interactive_chart')}\n{self.get_text('loading_time')}: {created_at}"
+                return None, chart_info, "图表加载成功"
+            
+            # 图表文件在保存记录时已确认并登记内容ID
+            if not chart_id:
                 return None, self.get_text("no_chart"), "该记录不包含图表"
             
-            # 使用路径解析方法查找图表文件
-            resolved_chart_path = self._resolve_chart_path(chart_path)
-            
-            if not resolved_chart_path:
+            # 图表文件之后可能已被清理，通过内存中的可用性索引确认
+            if not chart_registry.is_available(chart_path):
                 return None, self.get_text("no_chart"), f"图表文件不存在: {chart_path}"
+            if not chart_registry.is_available(display_path):
+                display_path = chart_path
             
-            # 生成图表信息
-            chart_filename = os.path.basename(resolved_chart_path)
-            chart_info = f"图表文件: {chart_filename}\n加载时间: {created_at}\n路径: {resolved_chart_path}"
+            # 生成图表信息，图片显示区域使用紧凑的展示图
+            absolute_path = os.path.abspath(chart_path)
+            chart_info = f"图表文件: {os.path.basename(absolute_path)}\n加载时间: {created_at}\n路径: {absolute_path}"
             
-            print(f"✅ 成功加载图表: {resolved_chart_path}")
-            return resolved_chart_path, chart_info, "图表加载成功"
+            print(f"✅ 成功加载图表: {absolute_path}")
+            return os.path.abspath(display_path or chart_path), chart_info, "图表加载成功"
             
         except Exception as e:
             print(f"加载图表时出错: {e}")
@@ -0,0 +1,157 @@
+import os
+import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 内存映射大小（字节），0表示禁用
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# 页缓存大小（KB）
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+# 每个连接缓存的预编译语句数量
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+# 数据库被锁定时的等待时间（秒）
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+
+
+class PooledConnection:
+    """
+    连接池中的连接代理
+
+    除close以外的操作都转发给底层连接；close只会回滚未提交的事务并把连接留在池中，
+    因此原有的 connect -> ... -> close 写法无需修改。
+    同一线程嵌套获取时共用一个连接，depth记录尚未close的使用者数量
+    """
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "depth", 0)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # row_factory等属性需要设置到底层连接上
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        """
+        归还连接，最外层的close丢弃未提交的修改（与关闭连接的语义一致）
+
+        嵌套的使用者close时外层的事务仍在进行，不能回滚
+        """
+        if self.depth > 0:
+            object.__setattr__(self, "depth", self.depth - 1)
+        if self.depth == 0 and self._conn.in_transaction:
+            self._conn.rollback()
+
+
+class SQLiteConnectionPool:
+    """按线程复用的SQLite连接池，每个线程只打开一次连接并设置好PRAGMA"""
+
+    def __init__(self, db_path):
+        """
+        初始化连接池
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._prepare_path()
+        atexit.register(self.close_all)
+
+    def _prepare_path(self):
+        """确保数据库文件所在的目录存在（只在创建连接池时检查一次）"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+            print(f"已创建数据目录: {db_dir}")
+
+        # 如果数据库路径是一个目录，删除它
+        if os.path.isdir(self.db_path):
+            print(f"警告: {self.db_path} 是一个目录，将被删除")
+            import shutil
+            shutil.rmtree(self.db_path)
+
+    def _open(self):
+        """打开新连接并设置PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=SQLITE_BUSY_TIMEOUT,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+            # 连接只在创建它的线程中使用，关闭时允许在退出线程中统一关闭
+            check_same_thread=False
+        )
+        # 新建的数据库直接启用增量回收；已有数据库由保留策略在首次回收时转换
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self):
+        """
+        获取当前线程的连接
+
+        同一线程嵌套获取时返回同一个连接；只有最外层的使用者取出时才重置连接状态，
+        不影响外层正在进行的事务和设置的行格式
+
+        Returns:
+            PooledConnection: 连接代理
+        """
+        pooled = getattr(self._local, "connection", None)
+        if pooled is None:
+            pooled = PooledConnection(self._open())
+            self._local.connection = pooled
+        if pooled.depth == 0:
+            if pooled.in_transaction:
+                # 上一次使用未提交就结束了，丢弃其修改
+                pooled.rollback()
+            # 与新建连接保持一致，恢复默认的行格式
+            pooled.row_factory = None
+        object.__setattr__(pooled, "depth", pooled.depth + 1)
+        return pooled
+
+    @contextmanager
+    def dedicated(self):
+        """
+        打开一个不与线程绑定的独立连接，用完后关闭
+
+        用于跨越多次yield的长时间操作（流式导出、批量导入）：生成器可能在不同的线程中恢复执行，
+        不能占用任何一个线程的池连接
+
+        Yields:
+            sqlite3.Connection: 数据库连接
+        """
+        conn = self._open()
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def close_all(self):
+        """关闭所有线程的连接（应用退出时调用）"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"关闭数据库连接失败: {str(e)}")
+        self._local = threading.local()
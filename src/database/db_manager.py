@@ -1,162 +1,155 @@
 import os
-import sqlite3
+import json
+import time
 import uuid
+from contextlib import ExitStack
 import re
 from datetime import datetime
 from src.utils.language_utils import LanguageUtils
+from src.utils.image_utils import create_markdown_image
+from src.storage.chart_optimizer import chart_optimizer
+from src.storage.chart_registry import chart_registry
+from src.database.backends import create_backend
+from src.database.history_writer import HistoryWriter
+from src.database.record_fields import build_record_fields, cjk_bigrams, is_cjk_bigram
+from src.database.retention import HistoryRetention
+from src.database.result_store import ResultStore
+from src.database.telemetry import RequestTelemetry
+from src.database.history_transfer import HistoryTransfer
+
+# 历史记录表每页显示的记录数
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+# 同一历史记录视图两次完整刷新之间的最短间隔（秒），期间新增和删除的记录在表格中增量更新
+HISTORY_REFRESH_DEBOUNCE_SECONDS = float(os.getenv("HISTORY_REFRESH_DEBOUNCE_SECONDS", "30"))
+# 全文搜索时参与相关度排序的最近匹配记录数，更早的匹配记录排在其后按时间倒序显示
+HISTORY_SEARCH_RANK_LIMIT = int(os.getenv("HISTORY_SEARCH_RANK_LIMIT", "500"))
+# 批量删除时每个事务删除的记录数
+HISTORY_DELETE_BATCH_SIZE = int(os.getenv("HISTORY_DELETE_BATCH_SIZE", "500"))
 
 class DBManager:
-    """数据库管理类，负责管理聊天历史和会话记录"""
+    """
+    数据库管理类，负责管理聊天历史和会话记录
+    
+    应用中所有的数据读写都经过这里；具体的数据库由后端决定（见backends.py），
+    默认使用SQLite，设置DATABASE_URL后可以改用PostgreSQL
+    """
     
-    def __init__(self, db_path="data/chat_history.db"):
+    def __init__(self, db_path=None, backend=None):
         """
         初始化数据库管理器
         
         Args:
-            db_path: 数据库文件路径
+            db_path: 数据库文件路径或连接地址，None表示使用DATABASE_URL
+            backend: 已创建的数据库后端（优先于db_path）
         """
-        self.db_path = db_path
+        self._backend = backend or create_backend(db_path)
+        self._writer = None
         self._init_database()
+        
+        # 记录ID在提交写入时预先分配，调用方无需等待写入完成（启动时读取已用过的最大ID）
+        self._allocate_record_ids(0)
+        self._writer = HistoryWriter(self._backend, self._write_history_batch, key=lambda record: record["id"])
+        
+        # 大型表格结果单独存储
+        self.result_store = ResultStore(self._backend)
+        
+        # 请求耗时、token用量等遥测数据
+        self.telemetry = RequestTelemetry(self._backend)
+        
+        # 会话快照随每次问答更新，由后台线程合并写入
+        self._snapshot_writer = HistoryWriter(self._backend, self._write_snapshot_batch, name="snapshot-writer")
+        
+        # 历史记录的批量导出和导入
+        self._transfer = HistoryTransfer(self._backend, self._allocate_record_ids)
+        
+        # 按保留策略在低峰时段归档并清理旧记录
+        self._retention = HistoryRetention(self._backend, self._remove_chart_files, self.result_store.prune_orphans)
+        self._retention.start()
     
-    def _connect(self):
+    def _connect(self, wait_for_writes=False):
         """
-        连接到SQLite数据库
+        获取当前线程的数据库连接（来自连接池，调用close只会归还连接）
+        
+        Args:
+            wait_for_writes: 是否先等待后台写入线程写完已提交的记录。只有需要读到刚保存的记录时
+                （按记录ID查询或删除、加载会话、清理图表等）才等待，普通的分页和搜索不等待
         
         Returns:
-            sqlite3.Connection: 数据库连接对象
+            PooledConnection: 数据库连接对象
         """
-        # 确保数据库文件所在的目录存在
-        db_dir = os.path.dirname(self.db_path)
-        if db_dir and not os.path.exists(db_dir):
-            os.makedirs(db_dir, exist_ok=True)
-            print(f"已创建数据目录: {db_dir}")
-            
-        # 如果数据库路径是一个目录，删除它
-        if os.path.isdir(self.db_path):
-            print(f"警告: {self.db_path} 是一个目录，将被删除")
-            import shutil
-            shutil.rmtree(self.db_path)
+        if wait_for_writes and self._writer is not None:
+            self._writer.wait_for_pending()
+        return self._backend.connection()
+    
+    def get_save_error(self, record_id):
+        """
+        等待记录写入完成，返回save_chat_history提交的记录写入失败的原因
+        
+        Args:
+            record_id: save_chat_history返回的记录ID
             
-        return sqlite3.connect(self.db_path)
+        Returns:
+            str: 失败原因，记录已写入（或等待超时仍在队列中）时返回None
+        """
+        if record_id is None or self._writer is None:
+            return None
+        if not self._writer.wait_for_pending():
+            print(f"等待聊天记录 {record_id} 写入超时")
+            return None
+        return self._writer.failure(record_id)
+    
+    def close(self):
+        """写完待保存的记录并关闭连接池中的所有连接"""
+        self._retention.stop()
+        if self._writer is not None:
+            self._writer.close()
+        self.telemetry.close()
+        self._snapshot_writer.close()
+        self._backend.close_all()
+    
+    def run_retention(self):
+        """
+        立即执行一次历史记录保留策略（归档并删除过期记录，回收空闲页）
+        
+        Returns:
+            dict: 清理统计
+        """
+        if self._writer is not None:
+            self._writer.wait_for_pending()
+        return self._retention.run_once()
+    
+    def _remove_chart_files(self, chart_paths):
+        """
+        删除图表文件及其展示图和缩略图（由图表登记表的后台线程删除，调用方无需等待）
+        
+        Args:
+            chart_paths: 图表路径列表
+        """
+        files = []
+        for chart_path in chart_paths:
+            if chart_path:
+                files.append(chart_path)
+                files.extend(chart_optimizer.variant_paths(chart_path))
+        chart_registry.remove_async(files)
     
     def _init_database(self):
-        """初始化数据库结构"""
+        """初始化数据库结构（执行尚未应用的版本化迁移）"""
         conn = self._connect()
-        cursor = conn.cursor()
-        
-        # 创建会话表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id TEXT PRIMARY KEY,
-            client_id TEXT,
-            session_file TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # 创建聊天历史记录表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            session_file TEXT,
-            client_id TEXT,
-            question TEXT,
-            answer TEXT,
-            created_at TIMESTAMP,
-            llm_type TEXT,
-            model_name TEXT,
-            has_chart BOOLEAN DEFAULT 0,
-            chart_path TEXT,
-            FOREIGN KEY (session_id) REFERENCES sessions(id)
-        )
-        ''')
-        
-        # 检查是否需要迁移旧数据
-        cursor.execute("PRAGMA table_info(chat_history)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        # 如果缺少新增的列，进行迁移
-        missing_columns = []
-        if 'has_chart' not in columns:
-            missing_columns.append('has_chart BOOLEAN DEFAULT 0')
-        if 'chart_path' not in columns:
-            missing_columns.append('chart_path TEXT')
-        if 'llm_type' not in columns and 'model' not in columns:
-            missing_columns.append('llm_type TEXT')
-        if 'model_name' not in columns:
-            missing_columns.append('model_name TEXT')
-        if 'client_id' not in columns and 'question_id' in columns:
-            # 重命名列，需要特殊处理
-            print("需要从question_id迁移到client_id，将创建新表...")
-            self._migrate_from_old_structure(conn, cursor)
-        elif missing_columns:
-            # 添加缺少的列
-            for column_def in missing_columns:
-                try:
-                    cursor.execute(f"ALTER TABLE chat_history ADD COLUMN {column_def}")
-                    print(f"数据库表已添加新列: {column_def}")
-                except sqlite3.OperationalError as e:
-                    print(f"添加列失败: {str(e)}")
-        
-        conn.commit()
-        conn.close()
-    
-    def _migrate_from_old_structure(self, conn, cursor):
-        """迁移旧的表结构到新的表结构"""
         try:
-            # 创建一个临时表
-            cursor.execute('''
-            CREATE TABLE chat_history_new (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT,
-                session_file TEXT,
-                client_id TEXT,
-                question TEXT,
-                answer TEXT,
-                created_at TIMESTAMP,
-                llm_type TEXT,
-                model_name TEXT,
-                has_chart BOOLEAN DEFAULT 0,
-                chart_path TEXT,
-                FOREIGN KEY (session_id) REFERENCES sessions(id)
-            )
-            ''')
-            
-            # 从旧表复制数据到新表
-            cursor.execute('''
-            INSERT INTO chat_history_new (
-                session_id, session_file, client_id, question, answer, created_at, llm_type, model_name
-            )
-            SELECT 
-                session_id, 
-                session_file, 
-                question_id as client_id, 
-                question, 
-                answer, 
-                timestamp as created_at,
-                model as llm_type,
-                model_name
-            FROM 
-                chat_history
-            ''')
-            
-            # 删除旧表
-            cursor.execute("DROP TABLE chat_history")
-            
-            # 重命名新表
-            cursor.execute("ALTER TABLE chat_history_new RENAME TO chat_history")
-            
-            conn.commit()
-            print("数据库结构迁移成功")
-        except Exception as e:
-            conn.rollback()
-            print(f"数据库迁移失败: {str(e)}")
+            self._backend.run_migrations(conn)
+            # 没有FTS5 trigram全文索引时（旧版SQLite或服务器数据库），历史搜索使用LIKE
+            self._fts_enabled = self._backend.has_fulltext(conn)
+            # 两个字的中文关键词（trigram无法索引）使用双字词索引，没有时使用LIKE
+            self._bigram_condition = self._backend.bigram_condition(conn)
+        finally:
+            conn.close()
     
-    def save_chat_history(self, session_id, session_file, client_id, question, answer, llm_type, model_name=None, chart_path=None):
+    def save_chat_history(self, session_id, session_file, client_id, question, answer, llm_type, model_name=None, chart_path=None, chart_spec=None, result_id=None):
         """
         保存聊天历史记录
         
+        记录由后台线程组提交写入，本方法立即返回预先分配的记录ID，不等待磁盘同步
+        
         Args:
             session_id: 会话ID
             session_file: 会话文件名
@@ -166,98 +159,76 @@ class DBManager:
             llm_type: AI模型类型
             model_name: 具体模型名称
             chart_path: 图表文件路径（如果有）
-        """
-        try:
-            # 如果直接传入了图表路径，使用它
-            has_chart = bool(chart_path and os.path.exists(chart_path))
-            # 使用相对路径存储，而不是绝对路径
-            final_chart_path = os.path.relpath(chart_path) if has_chart else None
-            
-            # 如果没有直接传入图表路径，尝试从回答文本中检测
-            if not has_chart:
-                # 检测是否包含图表路径
-                has_img = False
-                img_path = None
-                
-                # 提取图表路径 - 检查常见的格式
-                # 1. 检查是否有图片URL链接
-                if "图片URL链接:" in answer:
-                    has_img = True
-                    
-                # 2. 检查是否有本地图片路径
-                elif "本地图片路径:" in answer:
-                    has_img = True
-                    # 尝试提取图片路径
-                    path_matches = re.findall(r'本地图片路径:\s+(.+?)(?:\n|$)', answer)
-                    if path_matches:
-                        original_path = path_matches[0].strip()
-                        # 转换为相对路径
-                        img_path = os.path.relpath(original_path) if os.path.isabs(original_path) else original_path
-                
-                # 3. 检查Markdown图片格式 ![Chart](file://...) 或 ![Chart](charts/...)
-                elif re.search(r'!\[.*?\]\((file://)?(.+?\.(png|jpg|jpeg|svg))\)', answer):
-                    has_img = True
-                    # 提取Markdown图片路径
-                    markdown_matches = re.findall(r'!\[.*?\]\((file://)?(.+?\.(png|jpg|jpeg|svg))\)', answer)
-                    if markdown_matches:
-                        # 获取第一个匹配的路径
-                        file_protocol, path_part, ext = markdown_matches[0]
-                        original_path = path_part.strip()
-                        # 转换为相对路径
-                        img_path = os.path.relpath(original_path) if os.path.isabs(original_path) else original_path
-                
-                # 4. 检查是否有图片文件路径行 (单独的路径行)
-                elif re.search(r'charts/\d+_[a-zA-Z0-9]+\.(png|jpg|jpeg|svg)(?:\n|$)', answer):
-                    has_img = True
-                    path_matches = re.findall(r'(charts/\d+_[a-zA-Z0-9]+\.(png|jpg|jpeg|svg))(?:\n|$)', answer)
-                    if path_matches:
-                        original_path = path_matches[0][0].strip()
-                        # 转换为绝对路径
-                        img_path = os.path.abspath(original_path)
-                
-                # 5. 检查新格式：[数据分析图表: filename.png]
-                elif re.search(r'\[.*?图表.*?:\s*(.+?\.(png|jpg|jpeg|svg))\]', answer):
-                    has_img = True
-                    # 提取图表文件名
-                    chart_matches = re.findall(r'\[.*?图表.*?:\s*(.+?\.(png|jpg|jpeg|svg))\]', answer)
-                    if chart_matches:
-                        filename = chart_matches[0][0].strip()
-                        # 在可能的目录中查找这个文件
-                        possible_dirs = ["charts", "exports/charts", "."]
-                        for dir_path in possible_dirs:
-                            full_path = os.path.join(dir_path, filename)
-                            if os.path.exists(full_path):
-                                img_path = os.path.relpath(full_path)
-                                break
-                
-                has_chart = has_img and img_path and os.path.exists(img_path)
-                final_chart_path = img_path if has_chart else None
-            
-            conn = self._connect()
-            cursor = conn.cursor()
-            
-            # 插入新记录
-            cursor.execute(
-                '''
-                INSERT INTO chat_history (
-                    session_id, session_file, client_id, question, answer, 
-                    created_at, llm_type, model_name, has_chart, chart_path
-                ) VALUES (?, ?, ?, ?, ?, datetime('now', 'localtime'), ?, ?, ?, ?)
-                ''',
-                (
-                    session_id, session_file, client_id, question, answer, 
-                    llm_type, model_name or llm_type, has_chart, final_chart_path
-                )
-            )
+            chart_spec: 声明式图表规格JSON（如果有）
+            result_id: 单独存储的表格结果ID（如果有）
             
-            conn.commit()
-            conn.close()
-            
-            if has_chart:
-                print(f"✅ 图表记录已保存: {final_chart_path}")
+        Returns:
+            int: 记录ID
+        """
+        record_id = self._allocate_record_ids(1)[0]
+        
+        self._writer.submit({
+            "id": record_id,
+            "session_id": session_id,
+            "session_file": session_file,
+            "client_id": client_id,
+            "question": question,
+            "answer": answer,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "llm_type": llm_type,
+            "model_name": model_name or llm_type,
+            "chart_path": chart_path,
+            "chart_spec": chart_spec,
+            "result_id": result_id
+        })
+        return record_id
+    
+    def _allocate_record_ids(self, count):
+        """
+        分配记录ID
+        
+        Args:
+            count: 需要的ID数量
             
-        except Exception as e:
-            print(f"创建会话记录失败: {str(e)}")
+        Returns:
+            list: 分配的ID（按升序）
+        """
+        return list(self._backend.allocate_ids("chat_history", count))
+    
+    def _write_history_batch(self, conn, records):
+        """
+        在同一事务中写入一批聊天记录（由后台写入线程调用）
+        
+        Args:
+            conn: 写入线程的数据库连接
+            records: save_chat_history提交的记录列表
+        """
+        rows = []
+        for record in records:
+            # 图表检测、正文提取和摘要只在写入时计算一次
+            fields = build_record_fields(record["answer"], record["chart_path"])
+            rows.append((
+                record["id"], record["session_id"], record["session_file"], record["client_id"],
+                record["question"], record["answer"], record["created_at"], record["llm_type"],
+                record["model_name"], fields["has_chart"], fields["chart_path"], record["chart_spec"],
+                fields["answer_text"], fields["answer_summary"], fields["chart_id"],
+                fields["display_path"], fields["thumbnail_path"], fields["thumbnail_id"],
+                record.get("result_id"), cjk_bigrams(record["question"], record["answer"])
+            ))
+            if fields["has_chart"]:
+                print(f"✅ 图表记录已保存: {fields['chart_path']}")
+        
+        conn.executemany(
+            '''
+            INSERT INTO chat_history (
+                id, session_id, session_file, client_id, question, answer, 
+                created_at, llm_type, model_name, has_chart, chart_path, chart_spec,
+                answer_text, answer_summary, chart_id, display_path, thumbnail_path, thumbnail_id,
+                result_id, search_bigrams
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            rows
+        )
     
     def get_sessions_for_client(self, client_id):
         """
@@ -269,15 +240,17 @@ class DBManager:
         Returns:
             list: 会话记录列表
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
         
-        cursor.execute(
-            "SELECT id, session_file, created_at FROM sessions WHERE client_id=? ORDER BY created_at DESC",
-            (client_id,)
-        )
-        sessions = cursor.fetchall()
-        conn.close()
+            cursor.execute(
+                "SELECT id, session_file, created_at FROM sessions WHERE client_id=? ORDER BY created_at DESC",
+                (client_id,)
+            )
+            sessions = cursor.fetchall()
+        finally:
+            conn.close()
         
         return [{"session_id": s[0], "session_file": s[1], "timestamp": s[2]} for s in sessions]
     
@@ -290,23 +263,25 @@ class DBManager:
         """
         try:
             conn = self._connect()
-            cursor = conn.cursor()
+            try:
+                cursor = conn.cursor()
             
-            cursor.execute(
-                """
-                SELECT 
-                    id as session_id, 
-                    session_file, 
-                    created_at as timestamp 
-                FROM 
-                    sessions 
-                ORDER BY 
-                    created_at DESC
-                """
-            )
+                cursor.execute(
+                    """
+                    SELECT 
+                        id as session_id, 
+                        session_file, 
+                        created_at as timestamp 
+                    FROM 
+                        sessions 
+                    ORDER BY 
+                        created_at DESC
+                    """
+                )
             
-            sessions = cursor.fetchall()
-            conn.close()
+                sessions = cursor.fetchall()
+            finally:
+                conn.close()
             
             result = []
             for s in sessions:
@@ -325,6 +300,9 @@ class DBManager:
         """
         获取特定会话的聊天历史记录
         
+        回答正文和图表信息在写入时已解析为独立的列，这里只做列查询；
+        图表文件是否仍然存在通过图表登记表的内存索引判断，不访问文件系统
+        
         Args:
             session_id: 会话ID
         
@@ -334,77 +312,50 @@ class DBManager:
         if not session_id:
             return []
         
-        conn = self._connect()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        conn = self._connect(wait_for_writes=True)
+        try:
+            conn.row_factory = self._backend.row_factory
+            cursor = conn.cursor()
         
-        cursor.execute(
-            '''
-            SELECT 
-                id, session_id, question, answer, created_at, llm_type, model_name, has_chart, chart_path
-            FROM 
-                chat_history 
-            WHERE 
-                session_id = ? 
-            ORDER BY 
-                created_at
-            ''',
-            (session_id,)
-        )
+            cursor.execute(
+                '''
+                SELECT 
+                    id, session_id, question, answer, answer_text, created_at, llm_type, model_name,
+                    has_chart, chart_path, chart_spec, chart_id, display_path, thumbnail_path, thumbnail_id, result_id
+                FROM 
+                    chat_history 
+                WHERE 
+                    session_id = ? 
+                ORDER BY 
+                    created_at
+                ''',
+                (session_id,)
+            )
+        
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        
+        return [self._check_chart_availability(dict(row)) for row in rows]
+    
+    @staticmethod
+    def _check_chart_availability(entry):
+        """
+        根据图表可用性索引清除已被删除的图表信息
         
-        rows = cursor.fetchall()
-        conn.close()
-        
-        result = []
-        for row in rows:
-            chat_entry = dict(row)
-            
-            # 如果有图表，确保路径在回答中
-            if chat_entry.get('has_chart') and chat_entry.get('chart_path'):
-                chart_path = chat_entry['chart_path']
-                if os.path.exists(chart_path):
-                    # 确保路径是绝对路径并使用正斜杠
-                    absolute_path = os.path.abspath(chart_path).replace('\\', '/')
-                    
-                    # 处理回答中的图表路径
-                    answer_text = chat_entry['answer']
-                    
-                    # 移除任何现有的图表路径文本行
-                    if "本地图片路径:" in answer_text:
-                        parts = answer_text.split("本地图片路径:")
-                        answer_text = parts[0].strip()
-                    
-                    # 移除已有的图表路径
-                    chart_patterns = [
-                        r'charts/\d+_[a-zA-Z0-9]+\.(png|jpg|jpeg|svg)',
-                        r'files/charts/\d+_[a-zA-Z0-9]+\.(png|jpg|jpeg|svg)',
-                        r'[A-Za-z]:\\[^<>:|?*\n]+\.(png|jpg|jpeg|svg)',  # Windows绝对路径
-                        r'/[^<>:|?*\n]+\.(png|jpg|jpeg|svg)'  # Unix绝对路径
-                    ]
-                    
-                    for pattern in chart_patterns:
-                        answer_text = re.sub(pattern, '', answer_text)
-                    
-                    # 清理多余的空行
-                    answer_text = re.sub(r'\n{3,}', '\n\n', answer_text)
-                    answer_text = answer_text.strip()
-                    
-                    # 添加图表绝对路径作为单独的行
-                    if answer_text:
-                        answer_text += "\n\n"
-                    
-                    # 直接添加图片绝对路径，这将被Gradio识别为图片
-                    answer_text += absolute_path
-                    
-                    # 添加一个额外的图片绝对路径说明
-                    answer_text += f"\n\n本地图片路径: {absolute_path}"
-                    
-                    # 更新回答文本
-                    chat_entry['answer'] = answer_text
-            
-            result.append(chat_entry)
-        
-        return result
+        Args:
+            entry: 聊天记录字典
+            
+        Returns:
+            dict: 处理后的聊天记录
+        """
+        if entry['chart_id'] and not chart_registry.is_available(entry['chart_path']):
+            entry['chart_id'] = None
+        if entry['thumbnail_id'] and not chart_registry.is_available(entry['thumbnail_path']):
+            entry['thumbnail_id'] = None
+        if entry['display_path'] and not chart_registry.is_available(entry['display_path']):
+            entry['display_path'] = entry['chart_path']
+        return entry
     
     def create_session(self, client_id, file_name):
         """
@@ -421,7 +372,7 @@ class DBManager:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         session_file = f"{file_name}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -437,6 +388,72 @@ class DBManager:
         
         return session_id, session_file
     
+    # 会话快照表的列，session_id为主键
+    _SNAPSHOT_COLUMNS = ["session_id", "dataset_id", "column_profile", "agent_memory", "llm_type", "model_name", "updated_at"]
+    
+    def save_session_snapshot(self, session_id, dataset_id, column_profile, agent_memory, llm_type, model_name=None):
+        """
+        保存会话快照（立即返回，由后台线程写入；同一会话短时间内的多次更新只写最后一次）
+        
+        Args:
+            session_id: 会话ID
+            dataset_id: 缓存数据集ID（见dataset_cache）
+            column_profile: 列概况（DataLoader.profile_columns的结果）
+            agent_memory: Agent对话记忆（agent_memory.export_memory的结果）
+            llm_type: AI模型类型
+            model_name: 具体模型名称
+        """
+        if not session_id:
+            return
+        self._snapshot_writer.submit({
+            "session_id": session_id,
+            "dataset_id": dataset_id,
+            "column_profile": json.dumps(column_profile, ensure_ascii=False) if column_profile is not None else None,
+            "agent_memory": json.dumps(agent_memory or [], ensure_ascii=False),
+            "llm_type": llm_type,
+            "model_name": model_name or llm_type,
+            "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+    
+    def _write_snapshot_batch(self, conn, snapshots):
+        """写入一批会话快照（由后台写入线程调用）"""
+        latest = {}
+        for snapshot in snapshots:
+            latest[snapshot["session_id"]] = snapshot
+        conn.executemany(
+            self._backend.upsert_sql("session_snapshots", self._SNAPSHOT_COLUMNS, ["session_id"]),
+            [tuple(snapshot[name] for name in self._SNAPSHOT_COLUMNS) for snapshot in latest.values()]
+        )
+    
+    def get_session_snapshot(self, session_id):
+        """
+        获取会话快照
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            dict: dataset_id, column_profile, agent_memory, llm_type, model_name, updated_at；没有快照时返回None
+        """
+        if not session_id:
+            return None
+        self._snapshot_writer.wait_for_pending()
+        conn = self._backend.connection()
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(self._SNAPSHOT_COLUMNS)} FROM session_snapshots WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        
+        if not row:
+            return None
+        snapshot = dict(zip(self._SNAPSHOT_COLUMNS, row))
+        snapshot["column_profile"] = json.loads(snapshot["column_profile"]) if snapshot["column_profile"] else None
+        snapshot["agent_memory"] = json.loads(snapshot["agent_memory"]) if snapshot["agent_memory"] else []
+        return snapshot
+    
     def get_session_file_by_id(self, session_id):
         """
         根据会话ID获取会话文件名
@@ -451,34 +468,21 @@ class DBManager:
         if isinstance(session_id, dict) and "value" in session_id:
             session_id = session_id["value"]
             
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
         
-        cursor.execute("SELECT session_file FROM sessions WHERE id=?", (session_id,))
-        result = cursor.fetchone()
-        conn.close()
+            cursor.execute("SELECT session_file FROM sessions WHERE id=?", (session_id,))
+            result = cursor.fetchone()
+        finally:
+            conn.close()
         
         if result:
             return result[0]
         return None
     
-    def display_all_history(self, language="zh"):
-        """
-        获取所有聊天历史记录用于显示
-        
-        Args:
-            language: 语言代码，'zh'或'en'
-            
-        Returns:
-            list: 包含所有聊天记录的列表，格式化为显示用的格式
-        """
-        conn = self._connect()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''
-            SELECT 
+    # 历史记录列表查询的列
+    _HISTORY_COLUMNS = """
                 chat_history.id, 
                 chat_history.session_id,
                 chat_history.session_file, 
@@ -488,73 +492,123 @@ class DBManager:
                 chat_history.llm_type,
                 chat_history.model_name,
                 chat_history.has_chart,
-                chat_history.chart_path
-            FROM 
-                chat_history 
-            ORDER BY 
-                chat_history.created_at DESC
-            LIMIT 20
-            '''
-        )
+                chat_history.chart_path,
+                chat_history.chart_spec,
+                chat_history.answer_text,
+                chat_history.answer_summary,
+                chat_history.chart_id,
+                chat_history.thumbnail_path,
+                chat_history.thumbnail_id"""
+    
+    def display_all_history(self, language="zh"):
+        """
+        获取最新一页聊天历史记录用于显示
         
-        rows = cursor.fetchall()
-        conn.close()
+        Args:
+            language: 语言代码，'zh'或'en'
+            
+        Returns:
+            list: 聊天记录列表，格式化为显示用的格式
+        """
+        return self.get_history_page(language)[0]
+    
+    def get_history_page(self, language="zh", limit=HISTORY_PAGE_SIZE, cursor=None):
+        """
+        按时间倒序分页获取聊天历史记录（基于(created_at, id)的键集分页）
         
-        result = []
+        每页都是一次索引范围扫描，翻到多深的历史开销都相同
         
-        # 如果没有记录，返回空结果
-        if not rows:
-            return []
-            
-        for row in rows:
-            # 格式化时间 - 只显示日期和时间，不显示秒
-            created_at = row['created_at']
-            if created_at and len(created_at) > 16:
-                created_at = created_at[:16]
+        Args:
+            language: 语言代码，'zh'或'en'
+            limit: 每页记录数
+            cursor: 上一页返回的游标，None表示第一页
             
-            # 限制问题的长度
-            question = row['question']
-            if len(question) > 50:
-                question = question[:50] + "..."
-                
-            # 处理回答及图表
-            answer = row['answer']
-            answer_text = self._format_answer_for_display(answer, row, language)
-                
-            # 添加模型标记
-            model_info = row['model_name'] if row['model_name'] else row['llm_type']
-            model_info = model_info.replace("gpt-3.5-turbo", "GPT-3.5").replace("gpt-4", "GPT-4")
-            
-            # 添加会话ID和文件名，格式为：session_file (session_id)
-            session_id = row['session_id']
-            session_file = row['session_file']
-            session_info = f"{session_file} ({session_id[:8]}...)"
-            
-            # 返回6列数据: 时间, 会话ID, 问题, 回答, 点击加载数据, 删除操作
-            # 点击加载数据操作列：只显示用户友好的文本
-            has_chart_flag = 1 if (row['has_chart'] and row['chart_path'] and os.path.exists(row['chart_path'])) else 0
-            load_action_text = LanguageUtils.get_text(language, "load_record_action")
-            # 只显示用户友好的文本，不显示技术标记
-            load_record_action = f"📋 {load_action_text}"
-            
-            # 删除操作列：显示删除按钮
-            delete_action_text = LanguageUtils.get_text(language, "delete_this_record")
-            delete_record_action = f"🗑️ {delete_action_text}"
-                
-            result.append([
-                f"{created_at} ({model_info})",  # 时间与模型
-                session_info,                    # 会话ID与文件名
-                question,                        # 问题
-                answer_text,                     # 回答
-                load_record_action,              # 点击加载数据操作
-                delete_record_action             # 删除操作
-            ])
+        Returns:
+            tuple: (格式化后的记录列表, 下一页游标, 记录ID列表)，没有更多记录时游标为None
+        """
+        conn = self._connect()
+        try:
+            conn.row_factory = self._backend.row_factory
+            cursor_obj = conn.cursor()
+        
+            where = ""
+            params = []
+            if cursor:
+                where = "WHERE (chat_history.created_at, chat_history.id) < (?, ?)"
+                params.extend(cursor)
+        
+            cursor_obj.execute(
+                f'''
+                SELECT {self._HISTORY_COLUMNS}
+                FROM 
+                    chat_history 
+                {where}
+                ORDER BY 
+                    chat_history.created_at DESC, chat_history.id DESC
+                LIMIT ?
+                ''',
+                params + [limit + 1]
+            )
+        
+            rows = cursor_obj.fetchall()
+        finally:
+            conn.close()
         
-        return result
+        # 多取一条用于判断是否还有下一页
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['created_at'], rows[-1]['id'])
+        
+        return [self._format_history_row(row, language) for row in rows], next_cursor, [row['id'] for row in rows]
+    
+    def get_history_rows(self, record_ids, language="zh", search_keywords=None):
+        """
+        按记录ID获取格式化的历史记录行（新增记录后增量更新表格，只做主键查询）
+    
+        Args:
+            record_ids: 记录ID列表
+            language: 语言代码，'zh'或'en'
+            search_keywords: 当前搜索关键词，提供时只返回问题或回答包含全部关键词的记录
+    
+        Returns:
+            tuple: (格式化后的记录列表, 记录ID列表)，按时间倒序
+        """
+        if not record_ids:
+            return [], []
+    
+        conn = self._connect(wait_for_writes=True)
+        try:
+            conn.row_factory = self._backend.row_factory
+            rows = conn.execute(
+                f'''
+                SELECT {self._HISTORY_COLUMNS}
+                FROM
+                    chat_history
+                WHERE
+                    chat_history.id IN ({",".join("?" * len(record_ids))})
+                ORDER BY
+                    chat_history.created_at DESC, chat_history.id DESC
+                ''',
+                list(record_ids)
+            ).fetchall()
+        finally:
+            conn.close()
+    
+        terms = None
+        if search_keywords and search_keywords.strip():
+            # 与搜索相同的匹配规则：每个关键词都需出现在问题或回答中（不区分大小写）
+            terms = [term for term in re.split(r'[\s,，、]+', search_keywords.strip()) if term]
+            rows = [
+                row for row in rows
+                if all(term.lower() in f"{row['question']}\n{row['answer']}".lower() for term in terms)
+            ]
+    
+        return [self._format_history_row(row, language, terms) for row in rows], [row['id'] for row in rows]
     
     def search_history_by_question(self, search_keywords, language="zh"):
         """
-        根据问题内容进行模糊搜索
+        全文搜索历史记录的问题和回答，返回第一页结果
         
         Args:
             search_keywords: 搜索关键词
@@ -563,119 +617,354 @@ class DBManager:
         Returns:
             list: 包含匹配记录的列表，格式化为显示用的格式
         """
-        if not search_keywords or not search_keywords.strip():
-            return []
+        return self.search_history_page(search_keywords, language)[0]
+    
+    def search_history_page(self, search_keywords, language="zh", limit=HISTORY_PAGE_SIZE, cursor=None):
+        """
+        分页全文搜索历史记录的问题和回答
+        
+        多个关键词以空格分隔，需同时匹配；结果按相关度排序，回答列显示高亮摘要。
+        使用FTS5 trigram索引，不少于3个字符的关键词走索引；两个字的中文关键词走双字词索引（search_bigrams列），
+        其余较短的关键词在索引结果上用LIKE过滤。
+        只有最近的HISTORY_SEARCH_RANK_LIMIT条匹配记录按相关度排序（以(bm25得分, id)作为游标），
+        更早的匹配记录随后按写入顺序倒序显示（以id作为游标）；没有3个字符以上的关键词时按时间倒序，
+        以(created_at, id)作为游标
+        
+        Args:
+            search_keywords: 搜索关键词
+            language: 语言代码，'zh'或'en'
+            limit: 每页记录数
+            cursor: 上一页返回的游标，None表示第一页
             
+        Returns:
+            tuple: (格式化后的记录列表, 下一页游标, 记录ID列表)，没有更多记录时游标为None
+        """
+        if not search_keywords or not search_keywords.strip():
+            return [], None, []
+        
+        terms = [term for term in re.split(r'[\s,，、]+', search_keywords.strip()) if term]
+        # trigram分词器无法索引少于3个字符的词，两个字的中文关键词改用双字词索引，其余的短关键词用LIKE过滤
+        match_terms = [term for term in terms if len(term) >= 3]
+        bigram_terms = [term for term in terms if self._bigram_condition and is_cjk_bigram(term)]
+        like_terms = [term for term in terms if len(term) < 3 and term not in bigram_terms]
+        
         conn = self._connect()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        try:
+            conn.row_factory = self._backend.row_factory
+            cursor_obj = conn.cursor()
         
-        # 使用LIKE进行模糊搜索，支持多个关键词
-        search_pattern = f"%{search_keywords.strip()}%"
+            like_conditions = []
+            like_params = []
+            for term in bigram_terms:
+                like_conditions.append(self._bigram_condition)
+                like_params.append(term)
+            for term in like_terms:
+                like_conditions.append(self._LIKE_CONDITION)
+                like_params.extend([self._like_pattern(term)] * 2)
         
-        cursor.execute(
-            '''
-            SELECT 
-                chat_history.id, 
-                chat_history.session_id,
-                chat_history.session_file, 
-                chat_history.question, 
-                chat_history.answer, 
-                chat_history.created_at,
-                chat_history.llm_type,
-                chat_history.model_name,
-                chat_history.has_chart,
-                chat_history.chart_path
-            FROM 
-                chat_history 
-            WHERE 
-                chat_history.question LIKE ?
-            ORDER BY 
-                chat_history.created_at DESC
-            LIMIT 50
-            ''',
-            (search_pattern,)
-        )
+            if self._fts_enabled and match_terms:
+                # 每个关键词作为短语匹配，问题的权重高于回答
+                match_query = " AND ".join('"' + term.replace('"', '""') + '"' for term in match_terms)
+                where = " AND ".join(["chat_history_fts MATCH ?"] + like_conditions)
+                params = [match_query] + like_params
+            
+                if cursor is None:
+                    # 第一页：确定参与排序的候选记录范围（最近的HISTORY_SEARCH_RANK_LIMIT条匹配记录）
+                    floor_row = cursor_obj.execute(
+                        f'''
+                        SELECT chat_history_fts.rowid AS id
+                        FROM 
+                            chat_history_fts
+                            JOIN chat_history ON chat_history.id = chat_history_fts.rowid
+                        WHERE 
+                            {where}
+                        ORDER BY 
+                            chat_history_fts.rowid DESC
+                        LIMIT 1 OFFSET ?
+                        ''',
+                        params + [max(HISTORY_SEARCH_RANK_LIMIT, 1) - 1]
+                    ).fetchone()
+                    cursor = ("rank", None, None, floor_row['id'] if floor_row else None)
+            
+                if cursor[0] == "rank":
+                    # 只对候选范围内的记录计算bm25得分，翻页时不再对全部匹配记录重新排序
+                    _, last_score, last_id, floor_id = cursor
+                    if floor_id is not None:
+                        where += " AND chat_history_fts.rowid >= ?"
+                        params.append(floor_id)
+                    page_condition = ""
+                    if last_id is not None:
+                        page_condition = "WHERE score > ? OR (score = ? AND id < ?)"
+                        params.extend([last_score, last_score, last_id])
+                    cursor_obj.execute(
+                        f'''
+                        SELECT * FROM (
+                            SELECT {self._HISTORY_COLUMNS},
+                                bm25(chat_history_fts, 2.0, 1.0) AS score
+                            FROM 
+                                chat_history_fts
+                                JOIN chat_history ON chat_history.id = chat_history_fts.rowid
+                            WHERE 
+                                {where}
+                        )
+                        {page_condition}
+                        ORDER BY 
+                            score, id DESC
+                        LIMIT ?
+                        ''',
+                        params + [limit + 1]
+                    )
+                    sort_key = lambda row: ("rank", row['score'], row['id'], floor_id)
+                    # 候选范围之外还有更早的匹配记录时，排序结果之后按时间倒序继续翻页
+                    exhausted_key = ("recent", floor_id) if floor_id is not None else None
+                else:
+                    # 候选范围之外的匹配记录按id（即写入顺序）倒序，不计算得分
+                    params.append(cursor[1])
+                    cursor_obj.execute(
+                        f'''
+                        SELECT {self._HISTORY_COLUMNS}
+                        FROM 
+                            chat_history_fts
+                            JOIN chat_history ON chat_history.id = chat_history_fts.rowid
+                        WHERE 
+                            {where} AND chat_history_fts.rowid < ?
+                        ORDER BY 
+                            chat_history_fts.rowid DESC
+                        LIMIT ?
+                        ''',
+                        params + [limit + 1]
+                    )
+                    sort_key = lambda row: ("recent", row['id'])
+                    exhausted_key = None
+            else:
+                # 只有短关键词或不支持FTS5时：双字词索引条件加上LIKE，按时间倒序
+                for term in match_terms:
+                    like_conditions.append(self._LIKE_CONDITION)
+                    like_params.extend([self._like_pattern(term)] * 2)
+                if cursor:
+                    like_conditions.append("(chat_history.created_at, chat_history.id) < (?, ?)")
+                    like_params.extend(cursor)
+                cursor_obj.execute(
+                    f'''
+                    SELECT {self._HISTORY_COLUMNS}
+                    FROM 
+                        chat_history 
+                    WHERE 
+                        {" AND ".join(like_conditions)}
+                    ORDER BY 
+                        chat_history.created_at DESC, chat_history.id DESC
+                    LIMIT ?
+                    ''',
+                    like_params + [limit + 1]
+                )
+                sort_key = lambda row: (row['created_at'], row['id'])
+                exhausted_key = None
+        
+            rows = cursor_obj.fetchall()
+        finally:
+            conn.close()
         
-        rows = cursor.fetchall()
-        conn.close()
+        next_cursor = exhausted_key
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = sort_key(rows[-1])
         
-        result = []
+        return [self._format_history_row(row, language, terms) for row in rows], next_cursor, [row['id'] for row in rows]
+    
+    def _format_history_row(self, row, language="zh", terms=None):
+        """
+        将一条历史记录格式化为表格的一行
         
-        # 如果没有记录，返回空结果
-        if not rows:
-            return []
+        Args:
+            row: 数据库记录
+            language: 语言代码，'zh'或'en'
+            terms: 搜索关键词，提供时回答列显示高亮摘要
             
-        for row in rows:
-            # 格式化时间 - 只显示日期和时间，不显示秒
-            created_at = row['created_at']
-            if created_at and len(created_at) > 16:
-                created_at = created_at[:16]
+        Returns:
+            list: 6列数据: 时间, 会话ID, 问题, 回答, 点击加载数据, 删除操作
+        """
+        # 格式化时间 - 只显示日期和时间，不显示秒
+        created_at = row['created_at']
+        if created_at and len(created_at) > 16:
+            created_at = created_at[:16]
+        
+        question = self.format_question(row['question'])
             
-            # 限制问题的长度
-            question = row['question']
-            if len(question) > 50:
-                question = question[:50] + "..."
-                
-            # 处理回答及图表
-            answer = row['answer']
-            answer_text = self._format_answer_for_display(answer, row, language)
-                
-            # 添加模型标记
-            model_info = row['model_name'] if row['model_name'] else row['llm_type']
-            model_info = model_info.replace("gpt-3.5-turbo", "GPT-3.5").replace("gpt-4", "GPT-4")
-            
-            # 添加会话ID和文件名，格式为：session_file (session_id)
-            session_id = row['session_id']
-            session_file = row['session_file']
-            session_info = f"{session_file} ({session_id[:8]}...)"
-            
-            # 返回6列数据: 时间, 会话ID, 问题, 回答, 点击加载数据, 删除操作
-            # 点击加载数据操作列：只显示用户友好的文本
-            has_chart_flag = 1 if (row['has_chart'] and row['chart_path'] and os.path.exists(row['chart_path'])) else 0
-            load_action_text = LanguageUtils.get_text(language, "load_record_action")
-            # 只显示用户友好的文本，不显示技术标记
-            load_record_action = f"📋 {load_action_text}"
-            
-            # 删除操作列：显示删除按钮
-            delete_action_text = LanguageUtils.get_text(language, "delete_this_record")
-            delete_record_action = f"🗑️ {delete_action_text}"
-                
-            result.append([
-                f"{created_at} ({model_info})",  # 时间与模型
-                session_info,                    # 会话ID与文件名
-                question,                        # 问题
-                answer_text,                     # 回答
-                load_record_action,              # 点击加载数据操作
-                delete_record_action             # 删除操作
-            ])
-        
-        return result
-    
-    def _format_answer_for_display(self, answer, row, language="zh"):
-        """格式化回答用于显示"""
-        # 限制长度为120字符
-        MAX_LENGTH = 120
-        
-        # 如果回答为空，返回空字符串
-        if not answer:
-            return ""
+        # 处理回答及图表，搜索时回答命中关键词则显示高亮摘要
+        snippet = self._highlight_snippet(row['answer_text'], terms) if terms else None
+        answer_text = self._format_answer_for_display(snippet, row, language)
             
-        # 处理回答文本
-        answer_text = answer
+        # 添加模型标记
+        model_info = row['model_name'] if row['model_name'] else row['llm_type']
+        model_info = model_info.replace("gpt-3.5-turbo", "GPT-3.5").replace("gpt-4", "GPT-4")
+        
+        # 添加会话ID和文件名，格式为：session_file (session_id)
+        session_id = row['session_id']
+        session_file = row['session_file']
+        session_info = f"{session_file} ({session_id[:8]}...)"
+        
+        # 点击加载数据操作列：只显示用户友好的文本
+        load_action_text = LanguageUtils.get_text(language, "load_record_action")
+        load_record_action = f"📋 {load_action_text}"
+        
+        # 删除操作列：显示删除按钮
+        delete_action_text = LanguageUtils.get_text(language, "delete_this_record")
+        delete_record_action = f"🗑️ {delete_action_text}"
+            
+        return [
+            f"{created_at} ({model_info})",  # 时间与模型
+            session_info,                    # 会话ID与文件名
+            question,                        # 问题
+            answer_text,                     # 回答
+            load_record_action,              # 点击加载数据操作
+            delete_record_action             # 删除操作
+        ]
+    
+    @staticmethod
+    def format_question(question):
+        """问题在历史记录表格中的显示文本（限制长度）"""
+        if len(question) > 50:
+            return question[:50] + "..."
+        return question
+    
+    # 匹配问题或回答的LIKE条件，参数为两次相同的模式
+    _LIKE_CONDITION = "(chat_history.question LIKE ? ESCAPE '\\' OR chat_history.answer LIKE ? ESCAPE '\\')"
+    
+    @staticmethod
+    def _like_pattern(term):
+        """构造转义后的LIKE模式"""
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"%{escaped}%"
+    
+    @staticmethod
+    def _highlight_snippet(text, terms, context=24):
+        """
+        截取包含关键词的回答片段并加粗关键词
+        
+        Returns:
+            str: 高亮后的片段，回答中没有关键词时返回None
+        """
+        if not text or not terms:
+            return None
+        lower_text = text.lower()
+        positions = [lower_text.find(term.lower()) for term in terms]
+        positions = [pos for pos in positions if pos >= 0]
+        if not positions:
+            return None
+        
+        start = max(0, min(positions) - context)
+        end = min(len(text), min(positions) + context * 2)
+        snippet = text[start:end]
+        pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+        snippet = pattern.sub(lambda match: f"**{match.group(0)}**", snippet)
+        return f"{'…' if start > 0 else ''}{snippet}{'…' if end < len(text) else ''}"
+    
+    def _format_answer_for_display(self, snippet, row, language="zh"):
+        """
+        格式化回答用于显示（使用写入时生成的摘要和缩略图信息及图表可用性索引，不访问文件）
         
-        # 如果有图表，添加标记
-        if row['has_chart'] and row['chart_path'] and os.path.exists(row['chart_path']):
+        Args:
+            snippet: 搜索高亮摘要，为None时使用记录的回答摘要
+            row: 数据库记录
+            language: 语言代码，'zh'或'en'
+        """
+        answer_text = snippet or row['answer_summary'] or ""
+        if not answer_text:
+            return ""
+        
+        # 有图表（图片或交互式）时添加标记，图片是否仍然存在查询内存中的可用性索引
+        has_image = bool(row['chart_id']) and chart_registry.is_available(row['chart_path'])
+        if has_image or row['chart_spec']:
             chart_tag = LanguageUtils.get_text(language, "chart_tag")
-            if len(answer_text) > MAX_LENGTH:
-                answer_text = answer_text[:MAX_LENGTH] + f"... {chart_tag}"
-            else:
-                answer_text += f" {chart_tag}"
-        elif len(answer_text) > MAX_LENGTH:
-            answer_text = answer_text[:MAX_LENGTH] + "..."
+            answer_text += f" {chart_tag}"
+            
+            if has_image and row['thumbnail_id'] and chart_registry.is_available(row['thumbnail_path']):
+                thumbnail_md = create_markdown_image(row['thumbnail_path'], chart_tag, chart_id=row['thumbnail_id'])
+                answer_text = f"{thumbnail_md} {answer_text}"
             
         return answer_text
     
+    def iter_delete_history(self, session_id=None):
+        """
+        分批删除聊天记录，每批一个短事务，批次之间让出写锁，删除期间其他用户的读写不受影响
+        
+        Args:
+            session_id: 只删除该会话的记录，None表示删除全部记录
+            
+        Yields:
+            tuple: (已删除记录数, 开始时的记录总数)
+        """
+        where = "WHERE session_id = ?" if session_id else ""
+        params = [session_id] if session_id else []
+        
+        conn = self._connect(wait_for_writes=True)
+        try:
+            total = conn.execute(f"SELECT COUNT(*) FROM chat_history {where}", params).fetchone()[0]
+        finally:
+            conn.close()
+        deleted = 0
+        yield deleted, total
+        
+        while True:
+            # 生成器可能在不同的线程中恢复执行，每批重新获取当前线程的连接
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    f"SELECT id, has_chart, chart_path FROM chat_history {where} ORDER BY id LIMIT ?",
+                    params + [HISTORY_DELETE_BATCH_SIZE]
+                ).fetchall()
+                if rows:
+                    conn.executemany("DELETE FROM chat_history WHERE id = ?", [(row[0],) for row in rows])
+                    conn.commit()
+            finally:
+                conn.close()
+            if not rows:
+                break
+            
+            # 图表文件交给后台线程删除
+            self._remove_chart_files([row[2] for row in rows if row[1]])
+            
+            deleted += len(rows)
+            yield deleted, max(total, deleted)
+            time.sleep(0.01)
+        
+        # 清理不再被引用的表格结果
+        self.result_store.prune_orphans()
+    
+    def iter_export_history(self, output_path=None, data_format="jsonl", include_charts=True):
+        """
+        把全部历史记录流式导出为zip包（内存占用与记录数无关）
+        
+        Args:
+            output_path: 导出包路径，None表示使用默认导出目录
+            data_format: jsonl 或 parquet
+            include_charts: 是否打包图表文件
+            
+        Yields:
+            tuple: (表名, 已导出行数, 总行数)；最后一项为 ("done", 导出包路径, 总记录数)
+        """
+        if self._writer is not None:
+            self._writer.wait_for_pending()
+        yield from self._transfer.iter_export(output_path, data_format, include_charts)
+    
+    def iter_import_history(self, bundle_path):
+        """
+        从导出包批量导入历史记录（在一个事务中写入，导入期间新的聊天记录暂存在写入队列中）
+        
+        Args:
+            bundle_path: 导出包路径
+            
+        Yields:
+            tuple: (表名, 已处理行数, 总行数)；最后一项为 ("done", 导入的记录数, 跳过的记录数)
+        """
+        with ExitStack() as stack:
+            if self._writer is not None:
+                self._writer.wait_for_pending()
+                stack.enter_context(self._writer.hold())
+            stack.enter_context(self.telemetry.hold())
+            stack.enter_context(self._snapshot_writer.hold())
+            yield from self._transfer.iter_import(bundle_path)
+    
     def delete_session_history(self, session_id):
         """
         删除指定会话的所有聊天记录
@@ -694,34 +983,8 @@ class DBManager:
             session_id = session_id["value"]
         
         try:
-            conn = self._connect()
-            cursor = conn.cursor()
-            
-            # 查询该会话的图表文件路径，以便删除文件
-            cursor.execute(
-                "SELECT chart_path FROM chat_history WHERE session_id = ? AND has_chart = 1",
-                (session_id,)
-            )
-            chart_paths = cursor.fetchall()
-            
-            # 删除会话的所有聊天记录
-            cursor.execute(
-                "DELETE FROM chat_history WHERE session_id = ?",
-                (session_id,)
-            )
-            
-            conn.commit()
-            conn.close()
-            
-            # 删除对应的图表文件
-            for path_row in chart_paths:
-                chart_path = path_row[0]
-                if chart_path and os.path.exists(chart_path):
-                    try:
-                        os.remove(chart_path)
-                    except Exception as e:
-                        print(f"删除图表文件失败: {chart_path}, 错误: {str(e)}")
-            
+            for _ in self.iter_delete_history(session_id):
+                pass
             return True
         except Exception as e:
             print(f"删除会话历史记录失败: {str(e)}")
@@ -729,91 +992,19 @@ class DBManager:
     
     def delete_all_history(self):
         """
-        删除所有聊天记录和会话记录
+        删除所有聊天记录
         
         Returns:
             bool: 删除操作是否成功
         """
         try:
-            conn = self._connect()
-            cursor = conn.cursor()
-            
-            # 查询所有图表文件路径，以便删除文件
-            cursor.execute(
-                "SELECT chart_path FROM chat_history WHERE has_chart = 1"
-            )
-            chart_paths = cursor.fetchall()
-            
-            # 删除所有聊天记录
-            cursor.execute("DELETE FROM chat_history")
-            
-            # 可选：删除所有会话记录
-            # cursor.execute("DELETE FROM sessions")
-            
-            conn.commit()
-            conn.close()
-            
-            # 删除所有图表文件
-            for path_row in chart_paths:
-                chart_path = path_row[0]
-                if chart_path and os.path.exists(chart_path):
-                    try:
-                        os.remove(chart_path)
-                    except Exception as e:
-                        print(f"删除图表文件失败: {chart_path}, 错误: {str(e)}")
-            
+            for _ in self.iter_delete_history():
+                pass
             return True
         except Exception as e:
             print(f"删除所有历史记录失败: {str(e)}")
             return False
             
-    def get_session_id_by_details(self, timestamp, question_prefix):
-        """
-        根据时间戳和问题前缀获取会话ID
-        
-        Args:
-            timestamp: 时间戳，格式为"YYYY-MM-DD HH:MM"
-            question_prefix: 问题的前缀（可能被截断）
-            
-        Returns:
-            str: 会话ID或空字符串
-        """
-        try:
-            conn = self._connect()
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # 构建模糊查询
-            time_pattern = f"{timestamp}%"
-            question_pattern = f"{question_prefix}%"
-            
-            # 查询匹配的记录
-            cursor.execute(
-                '''
-                SELECT 
-                    session_id
-                FROM 
-                    chat_history 
-                WHERE 
-                    created_at LIKE ? AND
-                    question LIKE ?
-                ORDER BY 
-                    created_at DESC
-                LIMIT 1
-                ''',
-                (time_pattern, question_pattern)
-            )
-            
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                return row['session_id']
-            return ""
-        except Exception as e:
-            print(f"根据详情获取会话ID时出错: {str(e)}")
-            return ""
-    
     def delete_record(self, record_id):
         """
         删除单条聊天记录
@@ -828,29 +1019,32 @@ class DBManager:
             return False
         
         try:
-            conn = self._connect()
-            cursor = conn.cursor()
+            conn = self._connect(wait_for_writes=True)
+            try:
+                cursor = conn.cursor()
             
-            # 获取记录信息，查看是否有图表
-            cursor.execute(
-                "SELECT has_chart, chart_path FROM chat_history WHERE id = ?",
-                (record_id,)
-            )
-            record = cursor.fetchone()
+                # 获取记录信息，查看是否有图表
+                cursor.execute(
+                    "SELECT has_chart, chart_path, result_id FROM chat_history WHERE id = ?",
+                    (record_id,)
+                )
+                record = cursor.fetchone()
             
-            # 删除记录
-            cursor.execute("DELETE FROM chat_history WHERE id = ?", (record_id,))
-            deleted = cursor.rowcount > 0
+                # 删除记录
+                cursor.execute("DELETE FROM chat_history WHERE id = ?", (record_id,))
+                deleted = cursor.rowcount > 0
             
-            conn.commit()
-            conn.close()
+                conn.commit()
+            finally:
+                conn.close()
             
             # 如果有图表，删除图表文件
-            if record and record[0] and record[1] and os.path.exists(record[1]):
-                try:
-                    os.remove(record[1])
-                except Exception as e:
-                    print(f"删除图表文件失败: {record[1]}, 错误: {str(e)}")
+            if record and record[0]:
+                self._remove_chart_files([record[1]])
+            
+            # 如果有单独存储的表格结果，清理不再被引用的结果
+            if record and record[2]:
+                self.result_store.prune_orphans()
             
             return deleted
         except Exception as e:
@@ -868,16 +1062,18 @@ class DBManager:
             str: 会话ID或空字符串
         """
         try:
-            conn = self._connect()
-            cursor = conn.cursor()
+            conn = self._connect(wait_for_writes=True)
+            try:
+                cursor = conn.cursor()
             
-            cursor.execute(
-                "SELECT session_id FROM chat_history WHERE id = ?",
-                (record_id,)
-            )
+                cursor.execute(
+                    "SELECT session_id FROM chat_history WHERE id = ?",
+                    (record_id,)
+                )
             
-            result = cursor.fetchone()
-            conn.close()
+                result = cursor.fetchone()
+            finally:
+                conn.close()
             
             if result:
                 return result[0]
@@ -886,71 +1082,54 @@ class DBManager:
             print(f"通过记录ID获取会话ID时出错: {str(e)}")
             return ""
     
-    def get_record_by_time_and_question(self, time_question_info):
+    def get_record_info(self, record_id):
         """
-        通过时间和问题信息获取记录ID
-        
+        通过记录ID获取记录的会话和图表信息（主键查询）
+    
         Args:
-            time_question_info: 格式为"时间信息|问题信息"的字符串
-            
+            record_id: 记录ID
+    
         Returns:
-            str: 记录ID或空字符串
+            dict: session_id, record_id, has_chart, chart_path, question；记录不存在时返回None
         """
+        conn = self._connect(wait_for_writes=True)
         try:
-            if not time_question_info or '|' not in time_question_info:
-                return ""
-                
-            parts = time_question_info.split('|', 1)
-            time_info = parts[0]
-            question_info = parts[1]
-            
-            # 提取时间戳部分（去掉模型信息）
-            if '(' in time_info:
-                timestamp = time_info.split('(')[0].strip()
-            else:
-                timestamp = time_info.strip()
-            
-            # 如果问题以"..."结尾，说明被截断了，需要用模糊匹配
-            if question_info.endswith("..."):
-                question_prefix = question_info[:-3]  # 去掉"..."
-                is_truncated = True
-            else:
-                question_prefix = question_info
-                is_truncated = False
-            
-            conn = self._connect()
-            cursor = conn.cursor()
-            
-            if is_truncated:
-                # 模糊匹配
-                cursor.execute(
-                    '''
-                    SELECT id FROM chat_history 
-                    WHERE created_at LIKE ? AND question LIKE ?
-                    ORDER BY created_at DESC LIMIT 1
-                    ''',
-                    (f"{timestamp}%", f"{question_prefix}%")
-                )
-            else:
-                # 精确匹配
-                cursor.execute(
-                    '''
-                    SELECT id FROM chat_history 
-                    WHERE created_at LIKE ? AND question = ?
-                    ORDER BY created_at DESC LIMIT 1
-                    ''',
-                    (f"{timestamp}%", question_prefix)
-                )
-            
-            result = cursor.fetchone()
+            row = conn.execute(
+                "SELECT session_id, has_chart, chart_path, question FROM chat_history WHERE id = ?",
+                (record_id,)
+            ).fetchone()
+        finally:
             conn.close()
-            
-            if result:
-                return str(result[0])
-            return ""
-        except Exception as e:
-            print(f"通过时间和问题获取记录ID时出错: {str(e)}")
-            return ""
+    
+        if not row:
+            return None
+        return {
+            'session_id': row[0],
+            'record_id': record_id,
+            'has_chart': row[1],
+            'chart_path': row[2],
+            'question': row[3]
+        }
+    
+    def get_chart_record(self, record_id):
+        """
+        获取记录的图表字段
+    
+        Args:
+            record_id: 记录ID
+    
+        Returns:
+            tuple: (chart_id, chart_path, display_path, created_at, chart_spec)；记录不存在时返回None
+        """
+        conn = self._connect(wait_for_writes=True)
+        try:
+            row = conn.execute(
+                "SELECT chart_id, chart_path, display_path, created_at, chart_spec FROM chat_history WHERE id = ?",
+                (record_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return tuple(row) if row else None
     
     def get_all_referenced_chart_paths(self):
         """
@@ -960,27 +1139,28 @@ class DBManager:
             set: 包含所有被引用图表路径的集合
         """
         try:
-            conn = self._connect()
-            cursor = conn.cursor()
-            
-            # 查询所有有图表的记录
-            cursor.execute('''
-                SELECT DISTINCT chart_path 
-                FROM chat_history 
-                WHERE has_chart = 1 AND chart_path IS NOT NULL AND chart_path != ''
-            ''')
-            
-            results = cursor.fetchall()
-            referenced_charts = set()
-            
-            for result in results:
-                chart_path = result[0]
-                if chart_path:
-                    # 标准化路径
-                    normalized_path = os.path.relpath(chart_path).replace('\\', '/')
-                    referenced_charts.add(normalized_path)
-            
-            conn.close()
+            conn = self._connect(wait_for_writes=True)
+            try:
+                cursor = conn.cursor()
+            
+                # 查询所有有图表的记录
+                cursor.execute('''
+                    SELECT DISTINCT chart_path 
+                    FROM chat_history 
+                    WHERE has_chart = 1 AND chart_path IS NOT NULL AND chart_path != ''
+                ''')
+            
+                results = cursor.fetchall()
+                referenced_charts = set()
+            
+                for result in results:
+                    chart_path = result[0]
+                    if chart_path:
+                        # 标准化路径
+                        normalized_path = os.path.relpath(chart_path).replace('\\', '/')
+                        referenced_charts.add(normalized_path)
+            finally:
+                conn.close()
             return referenced_charts
             
         except Exception as e:
@@ -0,0 +1,349 @@
+"""
+聊天历史的批量导出与导入
+导出包是一个zip文件，包含 manifest.json、sessions / chat_history / result_blobs 三张表的数据
+（gzip压缩的JSONL或Parquet）以及记录引用的原始图表文件（charts/...）。
+导出时逐批从游标读取并追加写入，导入时逐批读取并用executemany写入同一个事务，
+内存占用只与批大小有关，与历史记录总数无关
+"""
+import os
+import gzip
+import json
+import base64
+import shutil
+import zipfile
+import tempfile
+from datetime import datetime
+
+from src.database.record_fields import build_record_fields, cjk_bigrams
+from src.storage.chart_optimizer import chart_optimizer
+
+# 导出/导入时每批处理的记录数
+HISTORY_TRANSFER_BATCH_SIZE = int(os.getenv("HISTORY_TRANSFER_BATCH_SIZE", "1000"))
+# 导出包的保存目录
+HISTORY_EXPORT_DIR = os.getenv("HISTORY_EXPORT_DIR", "exports/history")
+
+# 导出的表，按导入顺序排列
+TRANSFER_TABLES = ("sessions", "result_blobs", "chat_history")
+
+# 导出包格式版本
+_BUNDLE_VERSION = 1
+
+# pyarrow是可选依赖，没有时只能使用JSONL格式
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+def _arrow_schema(columns):
+    """根据列的声明类型生成Parquet的表结构"""
+    fields = []
+    for name, declared_type in columns:
+        if "INT" in declared_type or declared_type == "BOOLEAN":
+            arrow_type = pa.int64()
+        elif "REAL" in declared_type or "FLOA" in declared_type:
+            arrow_type = pa.float64()
+        elif "BLOB" in declared_type:
+            arrow_type = pa.binary()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+class _TableWriter:
+    """把一张表的数据逐批写入导出文件"""
+
+    def __init__(self, path, data_format, columns):
+        self.path = path
+        self.data_format = data_format
+        self.names = [name for name, _ in columns]
+        self._blob_columns = {name for name, declared_type in columns if "BLOB" in declared_type}
+        if data_format == "parquet":
+            self._schema = _arrow_schema(columns)
+            self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+        else:
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, rows):
+        """追加一批数据库行"""
+        if self.data_format == "parquet":
+            table = pa.Table.from_arrays(
+                [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(self._schema)],
+                schema=self._schema
+            )
+            self._writer.write_table(table)
+            return
+        for row in rows:
+            record = dict(zip(self.names, row))
+            # JSONL中的二进制列使用base64编码
+            for name in self._blob_columns:
+                if record[name] is not None:
+                    record[name] = base64.b64encode(record[name]).decode("ascii")
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def close(self):
+        if self.data_format == "parquet":
+            self._writer.close()
+        else:
+            self._file.close()
+
+
+def _iter_table_records(bundle, name, data_format, blob_columns, batch_size):
+    """从导出包中逐批读取一张表的记录"""
+    if data_format == "parquet":
+        with bundle.open(f"{name}.parquet") as f:
+            parquet_file = pq.ParquetFile(f)
+            for batch in parquet_file.iter_batches(batch_size=batch_size):
+                yield batch.to_pylist()
+        return
+
+    with bundle.open(f"{name}.jsonl.gz") as raw, gzip.open(raw, "rt", encoding="utf-8") as f:
+        records = []
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for column in blob_columns:
+                if record.get(column) is not None:
+                    record[column] = base64.b64decode(record[column])
+            records.append(record)
+            if len(records) >= batch_size:
+                yield records
+                records = []
+        if records:
+            yield records
+
+
+class HistoryTransfer:
+    """聊天历史的流式导出和批量导入"""
+
+    def __init__(self, backend, allocate_record_ids, batch_size=HISTORY_TRANSFER_BATCH_SIZE):
+        """
+        初始化导出/导入器
+
+        Args:
+            backend: 数据库后端（见backends.py）
+            allocate_record_ids: 分配记录ID的函数 allocate_record_ids(count) -> ID序列
+            batch_size: 每批处理的记录数
+        """
+        self._backend = backend
+        self._allocate_record_ids = allocate_record_ids
+        self._batch_size = batch_size
+
+    def iter_export(self, output_path=None, data_format="jsonl", include_charts=True):
+        """
+        把全部会话、聊天记录、表格结果和图表文件导出为zip包
+
+        Args:
+            output_path: 导出包路径，None表示保存到HISTORY_EXPORT_DIR下
+            data_format: jsonl 或 parquet（需要pyarrow）
+            include_charts: 是否打包记录引用的图表文件
+
+        Yields:
+            tuple: (表名, 已导出行数, 总行数)；最后一项为 ("done", 导出包路径, 总记录数)
+        """
+        if data_format == "parquet" and not PARQUET_AVAILABLE:
+            print("警告: 未安装pyarrow，历史记录导出改用JSONL格式")
+            data_format = "jsonl"
+        if output_path is None:
+            os.makedirs(HISTORY_EXPORT_DIR, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_path = os.path.join(HISTORY_EXPORT_DIR, f"history_{timestamp}.zip")
+
+        ext = ".parquet" if data_format == "parquet" else ".jsonl.gz"
+        counts = {}
+        # 生成器可能在不同的线程中恢复执行，使用独立连接；
+        # 每张表由一个游标逐批读取（同一个读快照），不阻塞写入
+        with tempfile.TemporaryDirectory() as tmp_dir, self._backend.dedicated() as conn, \
+                zipfile.ZipFile(output_path, "w", zipfile.ZIP_STORED, allowZip64=True) as bundle:
+            schema_version = self._backend.schema_version(conn)
+            totals = {
+                table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in TRANSFER_TABLES
+            }
+
+            for table in TRANSFER_TABLES:
+                columns = self._backend.table_columns(conn, table)
+                names = [name for name, _ in columns]
+                chart_index = names.index("chart_path") if include_charts and "chart_path" in names else None
+                table_path = os.path.join(tmp_dir, table + ext)
+                writer = _TableWriter(table_path, data_format, columns)
+                try:
+                    cursor = conn.execute(f"SELECT {', '.join(names)} FROM {table} ORDER BY id")
+                    done = 0
+                    while True:
+                        rows = cursor.fetchmany(self._batch_size)
+                        if not rows:
+                            break
+                        writer.write(rows)
+                        if chart_index is not None:
+                            self._add_charts(bundle, [row[chart_index] for row in rows])
+                        done += len(rows)
+                        yield table, done, max(totals[table], done)
+                finally:
+                    writer.close()
+
+                counts[table] = done
+                bundle.write(table_path, table + ext)
+                os.remove(table_path)
+
+            manifest = {
+                "version": _BUNDLE_VERSION,
+                "schema_version": schema_version,
+                "format": data_format,
+                "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "counts": counts,
+            }
+            bundle.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+
+        print(f"历史记录已导出: {output_path} ({counts.get('chat_history', 0)} 条记录, 格式 {data_format})")
+        yield "done", output_path, counts.get("chat_history", 0)
+
+    @staticmethod
+    def _add_charts(bundle, chart_paths):
+        """把图表文件加入导出包（只打包相对路径的原始图表，展示图和缩略图导入时重新生成）"""
+        for chart_path in chart_paths:
+            if not chart_path or os.path.isabs(chart_path) or ".." in chart_path.split(os.sep):
+                continue
+            arcname = chart_path.replace(os.sep, "/")
+            if arcname in bundle.NameToInfo or not os.path.exists(chart_path):
+                continue
+            bundle.write(chart_path, arcname)
+
+    def iter_import(self, bundle_path):
+        """
+        从导出包导入会话、聊天记录、表格结果和图表文件
+
+        全部数据在同一个事务中写入，失败时整体回滚；会话和表格结果按ID去重，
+        会话、时间和问题都相同的聊天记录视为已存在，重复导入同一个包不会产生重复记录
+
+        Args:
+            bundle_path: 导出包路径
+
+        Yields:
+            tuple: (表名, 已处理行数, 总行数)；最后一项为 ("done", 导入的记录数, 跳过的记录数)
+        """
+        with zipfile.ZipFile(bundle_path) as bundle:
+            manifest = json.loads(bundle.read("manifest.json"))
+            data_format = manifest.get("format", "jsonl")
+            if data_format == "parquet" and not PARQUET_AVAILABLE:
+                raise RuntimeError("导入Parquet格式的导出包需要安装pyarrow")
+            totals = manifest.get("counts", {})
+
+            # 先解压图表文件（已存在的文件不覆盖），写入记录时需要据此生成缩略图
+            for info in bundle.infolist():
+                if info.is_dir() or not info.filename.startswith("charts/") or ".." in info.filename.split("/"):
+                    continue
+                target = os.path.join(*info.filename.split("/"))
+                if os.path.exists(target):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with bundle.open(info) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+
+            imported = 0
+            skipped = 0
+            # 本次导入新建的会话，其中的记录不可能已存在，无需逐条检查重复
+            new_sessions = set()
+            with self._backend.dedicated() as conn:
+                self._backend.begin_write(conn)
+                try:
+                    for table in TRANSFER_TABLES:
+                        target_columns = self._backend.table_columns(conn, table)
+                        blob_columns = [name for name, declared_type in target_columns if "BLOB" in declared_type]
+                        names = {name for name, _ in target_columns}
+                        done = 0
+                        for records in _iter_table_records(bundle, table, data_format, blob_columns, self._batch_size):
+                            if table == "chat_history":
+                                added = self._insert_history(conn, records, names, new_sessions)
+                                imported += added
+                                skipped += len(records) - added
+                            elif table == "sessions":
+                                new_sessions.update(self._insert_sessions(conn, records, names))
+                            else:
+                                self._insert_ignore(conn, table, records, names)
+                            done += len(records)
+                            yield table, done, max(totals.get(table, 0), done)
+                    conn.commit()
+                except BaseException:
+                    # 包括生成器被提前关闭（GeneratorExit）的情况
+                    conn.rollback()
+                    raise
+
+        print(f"历史记录已导入: {imported} 条记录，跳过已存在的 {skipped} 条")
+        yield "done", imported, skipped
+
+    def _insert_ignore(self, conn, table, records, names):
+        """按主键去重写入一批记录"""
+        columns = [name for name in records[0] if name in names]
+        conn.executemany(
+            self._backend.insert_ignore_sql(table, columns),
+            [tuple(record.get(name) for name in columns) for record in records]
+        )
+
+    def _insert_sessions(self, conn, records, names):
+        """
+        写入一批会话，已存在的会话保持不变
+
+        Returns:
+            set: 本批新建的会话ID
+        """
+        session_ids = [record["id"] for record in records]
+        placeholders = ",".join("?" * len(session_ids))
+        existing = {row[0] for row in conn.execute(f"SELECT id FROM sessions WHERE id IN ({placeholders})", session_ids)}
+        self._insert_ignore(conn, "sessions", records, names)
+        return set(session_ids) - existing
+
+    def _existing_keys(self, conn, records, new_sessions):
+        """
+        查询一批记录中已存在于数据库的（会话、时间、问题）
+
+        每个会话只查询一次本批记录的时间范围，利用 (session_id, created_at) 索引
+        """
+        time_ranges = {}
+        for record in records:
+            session_id, created_at = record.get("session_id"), record.get("created_at")
+            if session_id in new_sessions or created_at is None:
+                continue
+            first, last = time_ranges.get(session_id, (created_at, created_at))
+            time_ranges[session_id] = (min(first, created_at), max(last, created_at))
+
+        keys = set()
+        for session_id, (first, last) in time_ranges.items():
+            rows = conn.execute(
+                f"SELECT created_at, question FROM chat_history "
+                f"WHERE session_id {self._backend.null_safe_eq} ? AND created_at BETWEEN ? AND ?",
+                (session_id, first, last)
+            )
+            keys.update((session_id, created_at, question) for created_at, question in rows)
+        return keys
+
+    def _insert_history(self, conn, records, names, new_sessions):
+        """写入一批聊天记录，分配新的记录ID并重新生成图表相关字段"""
+        existing = self._existing_keys(conn, records, new_sessions)
+        new_records = []
+        for record in records:
+            if (record.get("session_id"), record.get("created_at"), record.get("question")) in existing:
+                continue
+            if record.get("has_chart"):
+                # 图表内容ID、展示图和缩略图在本机重新生成
+                chart_optimizer.optimize(record.get("chart_path"))
+                record.update(build_record_fields(record.get("answer"), record.get("chart_path")))
+            # 旧版本导出的记录没有双字词列
+            record["search_bigrams"] = cjk_bigrams(record.get("question"), record.get("answer"))
+            new_records.append(record)
+        if not new_records:
+            return 0
+
+        for record_id, record in zip(self._allocate_record_ids(len(new_records)), new_records):
+            record["id"] = record_id
+
+        columns = ["id"] + [name for name in new_records[0] if name in names and name != "id"]
+        conn.executemany(
+            f"INSERT INTO chat_history ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [tuple(record.get(name) for name in columns) for record in new_records]
+        )
+        return len(new_records)
@@ -0,0 +1,199 @@
+import os
+import queue
+import atexit
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 是否使用后台线程异步写入聊天记录
+HISTORY_WRITER_ASYNC = os.getenv("HISTORY_WRITER_ASYNC", "true").lower() == "true"
+# 每次组提交最多合并的记录数
+HISTORY_WRITER_BATCH_SIZE = int(os.getenv("HISTORY_WRITER_BATCH_SIZE", "100"))
+# 收到第一条记录后等待更多记录合并提交的时间（毫秒）
+HISTORY_WRITER_FLUSH_MS = int(os.getenv("HISTORY_WRITER_FLUSH_MS", "50"))
+# 保留的写入失败记录数（供调用方查询某条记录是否写入失败）
+HISTORY_WRITER_MAX_FAILURES = 1000
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    后台组提交写入线程
+
+    调用方把记录放入队列后立即返回；写入线程把短时间内到达的多条记录合并到一个事务中提交，
+    一次fsync覆盖整批记录。应用退出时会把队列中剩余的记录全部写完
+    """
+
+    def __init__(self, backend, write_batch, name="history-writer", key=None):
+        """
+        初始化写入线程
+
+        Args:
+            backend: 数据库后端，写入线程使用其中属于自己的连接
+            write_batch: 写入函数 write_batch(conn, items)，在同一事务中写入一批记录
+            name: 线程名称
+            key: 从记录中取出标识的函数，设置后记录写入失败的原因，可通过failure(标识)查询
+        """
+        self._backend = backend
+        self._write_batch = write_batch
+        self._key = key
+        # 写入失败的记录: 标识 -> 失败原因（只保留最近的HISTORY_WRITER_MAX_FAILURES条）
+        self._failures = OrderedDict()
+        self._failures_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._pending_lock = threading.Condition()
+        self._closed = False
+        self._thread = None
+        # 提交写入时持有，hold()期间写入线程暂停提交，记录留在队列中
+        self._commit_lock = threading.Lock()
+        self._held = False
+
+        if HISTORY_WRITER_ASYNC:
+            self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def submit(self, item):
+        """
+        提交一条记录
+
+        Args:
+            item: 传给write_batch的记录
+        """
+        if self._thread is None or self._closed:
+            # 同步模式或已关闭时直接写入
+            self._commit([item])
+            return
+
+        with self._pending_lock:
+            self._pending += 1
+        self._queue.put(item)
+
+    def wait_for_pending(self, timeout=5.0):
+        """
+        等待已提交的记录全部写入（需要读到刚提交的记录时调用）
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            bool: 是否已全部写入
+        """
+        if self._thread is None or threading.current_thread() is self._thread:
+            return True
+        if self._held:
+            # 暂停期间记录不会写入，不必等待
+            return False
+        with self._pending_lock:
+            return self._pending_lock.wait_for(lambda: self._pending == 0, timeout)
+
+    def failure(self, key):
+        """
+        查询记录的写入失败原因（调用前先wait_for_pending，否则尚未写入的记录也返回None）
+
+        Args:
+            key: 记录标识
+
+        Returns:
+            str: 失败原因，记录已写入或未知时返回None
+        """
+        with self._failures_lock:
+            return self._failures.get(key)
+
+    def _record_failure(self, item, error):
+        """记录写入失败的记录"""
+        if self._key is None:
+            return
+        with self._failures_lock:
+            self._failures[self._key(item)] = str(error)
+            while len(self._failures) > HISTORY_WRITER_MAX_FAILURES:
+                self._failures.popitem(last=False)
+
+    @contextmanager
+    def hold(self):
+        """
+        暂停提交写入（例如批量导入在一个长事务中持有写锁时），退出后继续写入队列中的记录
+
+        暂停期间submit仍然立即返回；同步模式下submit会等待暂停结束
+        """
+        with self._commit_lock:
+            self._held = True
+            try:
+                yield
+            finally:
+                self._held = False
+
+    def close(self):
+        """写完队列中剩余的记录并停止写入线程"""
+        if self._thread is None or self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        print("聊天记录写入线程已停止")
+
+    def _run(self):
+        """写入线程主循环"""
+        flush_interval = HISTORY_WRITER_FLUSH_MS / 1000.0
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            # 合并在等待时间内到达的记录
+            batch = [item]
+            while len(batch) < HISTORY_WRITER_BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=flush_interval)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            with self._pending_lock:
+                self._pending -= len(batch)
+                self._pending_lock.notify_all()
+
+    def _commit(self, batch):
+        """在一个事务中写入一批记录，失败时逐条重试以免一条坏记录影响整批"""
+        with self._commit_lock:
+            try:
+                conn = self._backend.connection()
+            except Exception as e:
+                print(f"保存聊天记录失败，无法获取数据库连接: {str(e)}")
+                for item in batch:
+                    self._record_failure(item, e)
+                return
+            try:
+                self._commit_batch(conn, batch)
+            finally:
+                conn.close()
+
+    def _commit_batch(self, conn, batch):
+        """_commit的实现，调用时已持有提交锁"""
+        try:
+            self._write_batch(conn, batch)
+            conn.commit()
+            return
+        except Exception as e:
+            conn.rollback()
+            if len(batch) == 1:
+                print(f"保存聊天记录失败: {str(e)}")
+                self._record_failure(batch[0], e)
+                return
+            print(f"批量保存聊天记录失败，改为逐条写入: {str(e)}")
+
+        for item in batch:
+            try:
+                self._write_batch(conn, [item])
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"保存聊天记录失败: {str(e)}")
+                self._record_failure(item, e)
@@ -0,0 +1,446 @@
+"""
+数据库版本化迁移模块
+使用 SQLite 的 PRAGMA user_version 记录当前结构版本，按顺序执行尚未应用的迁移。
+每个迁移在独立的 BEGIN IMMEDIATE 事务中执行并同时更新版本号，失败时整体回滚；
+WAL模式下迁移期间读操作不受影响，因此可以在线升级表结构。
+新增迁移时只需在 MIGRATIONS 末尾追加，已发布的迁移不要修改。
+"""
+import sqlite3
+
+from src.database.record_fields import build_record_fields, cjk_bigrams
+
+CHAT_HISTORY_COLUMNS_SQL = '''
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    session_file TEXT,
+    client_id TEXT,
+    question TEXT,
+    answer TEXT,
+    created_at TIMESTAMP,
+    llm_type TEXT,
+    model_name TEXT,
+    has_chart BOOLEAN DEFAULT 0,
+    chart_path TEXT,
+    chart_spec TEXT,
+    FOREIGN KEY (session_id) REFERENCES sessions(id)
+'''
+
+
+def _table_columns(cursor, table):
+    """获取表的列名列表"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _migrate_from_old_structure(cursor):
+    """将旧版（question_id/timestamp/model列）的chat_history重建为新结构"""
+    print("需要从question_id迁移到client_id，将创建新表...")
+    cursor.execute(f"CREATE TABLE chat_history_new ({CHAT_HISTORY_COLUMNS_SQL})")
+
+    # 从旧表复制数据到新表
+    cursor.execute('''
+    INSERT INTO chat_history_new (
+        session_id, session_file, client_id, question, answer, created_at, llm_type, model_name
+    )
+    SELECT
+        session_id,
+        session_file,
+        question_id as client_id,
+        question,
+        answer,
+        timestamp as created_at,
+        model as llm_type,
+        model_name
+    FROM
+        chat_history
+    ''')
+
+    cursor.execute("DROP TABLE chat_history")
+    cursor.execute("ALTER TABLE chat_history_new RENAME TO chat_history")
+    print("数据库结构迁移成功")
+
+
+def _create_base_schema(cursor):
+    """版本1：基础表结构，并补齐引入版本化迁移之前的旧数据库缺少的列"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        client_id TEXT,
+        session_file TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS chat_history ({CHAT_HISTORY_COLUMNS_SQL})")
+
+    columns = _table_columns(cursor, "chat_history")
+    if 'client_id' not in columns and 'question_id' in columns:
+        _migrate_from_old_structure(cursor)
+        return
+
+    missing_columns = []
+    if 'has_chart' not in columns:
+        missing_columns.append('has_chart BOOLEAN DEFAULT 0')
+    if 'chart_path' not in columns:
+        missing_columns.append('chart_path TEXT')
+    if 'llm_type' not in columns and 'model' not in columns:
+        missing_columns.append('llm_type TEXT')
+    if 'model_name' not in columns:
+        missing_columns.append('model_name TEXT')
+    if 'chart_spec' not in columns:
+        missing_columns.append('chart_spec TEXT')
+    for column_def in missing_columns:
+        cursor.execute(f"ALTER TABLE chat_history ADD COLUMN {column_def}")
+        print(f"数据库表已添加新列: {column_def}")
+
+
+def _create_history_indexes(cursor):
+    """版本2：为常用的过滤和排序条件创建复合索引"""
+    # 按会话加载历史、按会话删除
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_chat_history_session_created
+    ON chat_history(session_id, created_at)
+    ''')
+    # 全部历史按时间倒序展示；id作为同一时间内的次序
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_chat_history_created_id
+    ON chat_history(created_at, id)
+    ''')
+    # 按客户端筛选历史
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_chat_history_client_created
+    ON chat_history(client_id, created_at)
+    ''')
+    # 查找被引用的图表文件（覆盖索引，无需回表）
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_chat_history_chart
+    ON chat_history(has_chart, chart_path)
+    ''')
+    # 按客户端列出会话
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sessions_client_created
+    ON sessions(client_id, created_at)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sessions_created
+    ON sessions(created_at)
+    ''')
+    # 为查询优化器收集统计信息
+    cursor.execute("ANALYZE")
+
+
+def _create_history_fts(cursor):
+    """版本3：问题和回答的FTS5全文索引（trigram分词，支持中文），由触发器与chat_history保持同步"""
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5(
+            question,
+            answer,
+            content='chat_history',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite 3.34 之前没有trigram分词器，搜索回退为LIKE；每次启动时重新检查（见_ensure_fulltext_tables）
+        print(f"当前SQLite不支持FTS5 trigram分词，历史搜索将使用LIKE: {str(e)}")
+        return
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS chat_history_fts_ai AFTER INSERT ON chat_history BEGIN
+        INSERT INTO chat_history_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS chat_history_fts_ad AFTER DELETE ON chat_history BEGIN
+        INSERT INTO chat_history_fts(chat_history_fts, rowid, question, answer)
+        VALUES ('delete', old.id, old.question, old.answer);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS chat_history_fts_au AFTER UPDATE OF question, answer ON chat_history BEGIN
+        INSERT INTO chat_history_fts(chat_history_fts, rowid, question, answer)
+        VALUES ('delete', old.id, old.question, old.answer);
+        INSERT INTO chat_history_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+    END
+    ''')
+    # 为已有的历史记录建立索引
+    cursor.execute("INSERT INTO chat_history_fts(chat_history_fts) VALUES ('rebuild')")
+
+
+# 版本4新增的结构化列
+_RECORD_FIELD_COLUMNS = [
+    ("answer_text", "TEXT"),
+    ("answer_summary", "TEXT"),
+    ("chart_id", "TEXT"),
+    ("display_path", "TEXT"),
+    ("thumbnail_path", "TEXT"),
+    ("thumbnail_id", "TEXT"),
+]
+
+# 回填时每批更新的记录数
+_BACKFILL_BATCH_SIZE = 500
+
+
+def _add_record_fields(cursor):
+    """版本4：回答正文、图表内容ID、缩略图和摘要存为独立的列，并一次性回填已有记录"""
+    columns = _table_columns(cursor, "chat_history")
+    for name, column_type in _RECORD_FIELD_COLUMNS:
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE chat_history ADD COLUMN {name} {column_type}")
+
+    # 按id分批回填，旧记录的图表检测只在这里执行一次
+    last_id = 0
+    total = 0
+    while True:
+        cursor.execute(
+            "SELECT id, answer, has_chart, chart_path FROM chat_history WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, _BACKFILL_BATCH_SIZE)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        for record_id, answer, has_chart, chart_path in rows:
+            fields = build_record_fields(answer, chart_path if has_chart else None)
+            updates.append((
+                fields["has_chart"], fields["chart_path"], fields["answer_text"], fields["answer_summary"],
+                fields["chart_id"], fields["display_path"], fields["thumbnail_path"], fields["thumbnail_id"],
+                record_id
+            ))
+        cursor.executemany(
+            '''
+            UPDATE chat_history SET
+                has_chart = ?, chart_path = ?, answer_text = ?, answer_summary = ?,
+                chart_id = ?, display_path = ?, thumbnail_path = ?, thumbnail_id = ?
+            WHERE id = ?
+            ''',
+            updates
+        )
+        last_id = rows[-1][0]
+        total += len(rows)
+    if total:
+        print(f"已回填 {total} 条聊天记录的结构化字段")
+
+
+def _create_result_blobs(cursor):
+    """版本5：大型表格结果单独存储在result_blobs表中，聊天记录通过result_id引用"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS result_blobs (
+        id TEXT PRIMARY KEY,
+        format TEXT,
+        row_count INTEGER,
+        columns TEXT,
+        size INTEGER,
+        data BLOB,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    if 'result_id' not in _table_columns(cursor, "chat_history"):
+        cursor.execute("ALTER TABLE chat_history ADD COLUMN result_id TEXT")
+    # 清理未被引用的结果时使用
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_chat_history_result
+    ON chat_history(result_id) WHERE result_id IS NOT NULL
+    ''')
+
+
+def _create_request_metrics(cursor):
+    """版本6：请求遥测明细表和按小时汇总的直方图表"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS request_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        record_id INTEGER,
+        created_at TIMESTAMP,
+        llm_type TEXT,
+        model_name TEXT,
+        status TEXT,
+        queue_ms REAL,
+        llm_ms REAL,
+        exec_ms REAL,
+        chart_ms REAL,
+        upload_ms REAL,
+        total_ms REAL,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        retries INTEGER
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_request_metrics_created ON request_metrics(created_at)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS request_metrics_hourly (
+        hour TEXT,
+        llm_type TEXT,
+        model_name TEXT,
+        metric TEXT,
+        count INTEGER,
+        total REAL,
+        max REAL,
+        histogram TEXT,
+        PRIMARY KEY (hour, llm_type, model_name, metric)
+    )
+    ''')
+
+
+def _create_session_snapshots(cursor):
+    """版本7：会话快照（缓存数据集引用、列概况、Agent对话记忆和模型选择），用于重启后快速恢复会话"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS session_snapshots (
+        session_id TEXT PRIMARY KEY,
+        dataset_id TEXT,
+        column_profile TEXT,
+        agent_memory TEXT,
+        llm_type TEXT,
+        model_name TEXT,
+        updated_at TIMESTAMP
+    )
+    ''')
+
+
+def backfill_search_bigrams(cursor):
+    """按id分批为已有记录计算search_bigrams列（SQLite与PostgreSQL的迁移共用）"""
+    last_id = 0
+    total = 0
+    while True:
+        cursor.execute(
+            "SELECT id, question, answer FROM chat_history WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, _BACKFILL_BATCH_SIZE)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany(
+            "UPDATE chat_history SET search_bigrams = ? WHERE id = ?",
+            [(cjk_bigrams(question, answer), record_id) for record_id, question, answer in rows]
+        )
+        last_id = rows[-1][0]
+        total += len(rows)
+    if total:
+        print(f"已回填 {total} 条聊天记录的双字词索引")
+
+
+def _create_bigram_fts(cursor):
+    """search_bigrams列的FTS5索引（unicode61分词，每个双字词是一个词元），由触发器与chat_history保持同步"""
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_bigram_fts USING fts5(
+            search_bigrams,
+            content='chat_history',
+            content_rowid='id',
+            tokenize='unicode61'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"无法创建双字词全文索引，两个字的中文关键词将使用LIKE: {str(e)}")
+        return
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS chat_history_bigram_fts_ai AFTER INSERT ON chat_history BEGIN
+        INSERT INTO chat_history_bigram_fts(rowid, search_bigrams) VALUES (new.id, new.search_bigrams);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS chat_history_bigram_fts_ad AFTER DELETE ON chat_history BEGIN
+        INSERT INTO chat_history_bigram_fts(chat_history_bigram_fts, rowid, search_bigrams)
+        VALUES ('delete', old.id, old.search_bigrams);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS chat_history_bigram_fts_au AFTER UPDATE OF search_bigrams ON chat_history BEGIN
+        INSERT INTO chat_history_bigram_fts(chat_history_bigram_fts, rowid, search_bigrams)
+        VALUES ('delete', old.id, old.search_bigrams);
+        INSERT INTO chat_history_bigram_fts(rowid, search_bigrams) VALUES (new.id, new.search_bigrams);
+    END
+    ''')
+    cursor.execute("INSERT INTO chat_history_bigram_fts(chat_history_bigram_fts) VALUES ('rebuild')")
+
+
+def _add_search_bigrams(cursor):
+    """版本8：问题和回答中的中文双字词存为search_bigrams列并建立全文索引，两个字的关键词不再全表扫描"""
+    if 'search_bigrams' not in _table_columns(cursor, "chat_history"):
+        cursor.execute("ALTER TABLE chat_history ADD COLUMN search_bigrams TEXT")
+    backfill_search_bigrams(cursor)
+    _create_bigram_fts(cursor)
+
+
+# (版本号, 描述, 迁移函数)
+MIGRATIONS = [
+    (1, "基础表结构", _create_base_schema),
+    (2, "chat_history与sessions复合索引", _create_history_indexes),
+    (3, "历史记录全文索引", _create_history_fts),
+    (4, "聊天记录结构化字段", _add_record_fields),
+    (5, "大型结果单独存储", _create_result_blobs),
+    (6, "请求遥测", _create_request_metrics),
+    (7, "会话快照", _create_session_snapshots),
+    (8, "中文双字词索引", _add_search_bigrams),
+]
+
+# 依赖SQLite编译选项的全文索引表: (表名, 创建它的迁移版本, 创建函数)
+# 迁移时不支持对应的分词器只会跳过建表，版本号照常记录；每次启动时重新检查，升级SQLite后自动创建
+_FULLTEXT_TABLES = [
+    ("chat_history_fts", 3, _create_history_fts),
+    ("chat_history_bigram_fts", 8, _create_bigram_fts),
+]
+
+
+def has_table(conn, name):
+    """检查数据库中是否存在指定的表（包括虚拟表）"""
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+    return row is not None
+
+
+def get_schema_version(conn):
+    """获取数据库当前的结构版本"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn):
+    """
+    执行所有尚未应用的迁移
+
+    Args:
+        conn: 数据库连接
+
+    Returns:
+        int: 迁移后的结构版本
+    """
+    for version, description, migrate in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # 获取写锁后再次确认版本，避免多个进程重复执行同一迁移
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            migrate(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+            print(f"数据库迁移完成: v{version} {description}")
+        except Exception as e:
+            conn.rollback()
+            print(f"数据库迁移失败: v{version} {description}: {str(e)}")
+            break
+
+    _ensure_fulltext_tables(conn)
+    return get_schema_version(conn)
+
+
+def _ensure_fulltext_tables(conn):
+    """创建迁移时因SQLite不支持而跳过的全文索引表"""
+    version = get_schema_version(conn)
+    for table, table_version, create in _FULLTEXT_TABLES:
+        if version < table_version or has_table(conn, table):
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            if not has_table(conn, table):
+                create(cursor)
+            conn.commit()
+            if has_table(conn, table):
+                print(f"已创建全文索引表: {table}")
+        except Exception as e:
+            conn.rollback()
+            print(f"创建全文索引表失败: {table}: {str(e)}")
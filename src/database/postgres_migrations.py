@@ -0,0 +1,195 @@
+"""
+PostgreSQL数据库的版本化迁移
+版本号与SQLite的迁移（migrations.MIGRATIONS）保持一致，记录在schema_version表中。
+PostgreSQL后端是在SQLite v6之后加入的，v6一次性创建与其等价的完整结构；
+之后新增迁移时，在两个列表末尾追加同一版本号的迁移。
+"""
+from src.database.migrations import MIGRATIONS as SQLITE_MIGRATIONS, backfill_search_bigrams
+
+# 迁移使用的咨询锁编号
+_MIGRATION_LOCK_ID = 0x7061_6931
+
+# 双字词索引的表达式（双字词数组，不依赖数据库的分词和区域设置），搜索条件必须使用完全相同的表达式才能走索引
+BIGRAM_ARRAY_SQL = "string_to_array(COALESCE(search_bigrams, ''), ' ')"
+
+
+def _create_schema(cursor):
+    """版本6：与SQLite v1-v6等价的完整表结构"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        client_id TEXT,
+        session_file TEXT,
+        created_at TEXT DEFAULT to_char(now(), 'YYYY-MM-DD HH24:MI:SS')
+    )
+    ''')
+    # created_at保存为与SQLite一致的文本时间，键集分页和保留策略的比较方式不变
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id BIGSERIAL PRIMARY KEY,
+        session_id TEXT REFERENCES sessions(id),
+        session_file TEXT,
+        client_id TEXT,
+        question TEXT,
+        answer TEXT,
+        created_at TEXT,
+        llm_type TEXT,
+        model_name TEXT,
+        has_chart INTEGER DEFAULT 0,
+        chart_path TEXT,
+        chart_spec TEXT,
+        answer_text TEXT,
+        answer_summary TEXT,
+        chart_id TEXT,
+        display_path TEXT,
+        thumbnail_path TEXT,
+        thumbnail_id TEXT,
+        result_id TEXT
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_session_created ON chat_history(session_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_created_id ON chat_history(created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_client_created ON chat_history(client_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_chart ON chat_history(has_chart, chart_path)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_client_created ON sessions(client_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions(created_at)")
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_chat_history_result
+    ON chat_history(result_id) WHERE result_id IS NOT NULL
+    ''')
+
+    # 历史搜索的LIKE条件使用三元组索引（与SQLite的FTS5 trigram对应），扩展不可用时退化为顺序扫描
+    cursor.execute("SAVEPOINT trigram")
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_question_trgm ON chat_history USING gin (question gin_trgm_ops)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_answer_trgm ON chat_history USING gin (answer gin_trgm_ops)")
+        cursor.execute("RELEASE SAVEPOINT trigram")
+    except Exception as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT trigram")
+        print(f"无法启用pg_trgm扩展，历史搜索将不使用索引: {str(e)}")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS result_blobs (
+        id TEXT PRIMARY KEY,
+        format TEXT,
+        row_count INTEGER,
+        columns TEXT,
+        size INTEGER,
+        data BYTEA,
+        created_at TEXT DEFAULT to_char(now(), 'YYYY-MM-DD HH24:MI:SS')
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS request_metrics (
+        id BIGSERIAL PRIMARY KEY,
+        record_id BIGINT,
+        created_at TEXT,
+        llm_type TEXT,
+        model_name TEXT,
+        status TEXT,
+        queue_ms DOUBLE PRECISION,
+        llm_ms DOUBLE PRECISION,
+        exec_ms DOUBLE PRECISION,
+        chart_ms DOUBLE PRECISION,
+        upload_ms DOUBLE PRECISION,
+        total_ms DOUBLE PRECISION,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        retries INTEGER
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_request_metrics_created ON request_metrics(created_at)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS request_metrics_hourly (
+        hour TEXT,
+        llm_type TEXT,
+        model_name TEXT,
+        metric TEXT,
+        count INTEGER,
+        total DOUBLE PRECISION,
+        max DOUBLE PRECISION,
+        histogram TEXT,
+        PRIMARY KEY (hour, llm_type, model_name, metric)
+    )
+    ''')
+
+
+def _create_session_snapshots(cursor):
+    """版本7：会话快照"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS session_snapshots (
+        session_id TEXT PRIMARY KEY,
+        dataset_id TEXT,
+        column_profile TEXT,
+        agent_memory TEXT,
+        llm_type TEXT,
+        model_name TEXT,
+        updated_at TEXT
+    )
+    ''')
+
+
+def _add_search_bigrams(cursor):
+    """版本8：中文双字词列及其数组上的GIN索引（与SQLite的双字词FTS5索引对应）"""
+    cursor.execute("ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS search_bigrams TEXT")
+    backfill_search_bigrams(cursor)
+    cursor.execute(f'''
+    CREATE INDEX IF NOT EXISTS idx_chat_history_bigrams
+    ON chat_history USING gin ({BIGRAM_ARRAY_SQL})
+    ''')
+
+
+# (版本号, 描述, 迁移函数)
+MIGRATIONS = [
+    (6, "完整表结构", _create_schema),
+    (7, "会话快照", _create_session_snapshots),
+    (8, "中文双字词索引", _add_search_bigrams),
+]
+
+# 两种数据库的结构版本必须一致
+assert MIGRATIONS[-1][0] == SQLITE_MIGRATIONS[-1][0], "PostgreSQL迁移与SQLite迁移的版本不一致"
+
+
+def get_schema_version(conn):
+    """获取数据库当前的结构版本"""
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    conn.commit()
+    return row[0] or 0
+
+
+def run_migrations(conn):
+    """
+    执行所有尚未应用的迁移
+
+    每个迁移在独立事务中执行，并用事务级咨询锁避免多个应用实例同时迁移
+
+    Args:
+        conn: 数据库连接
+
+    Returns:
+        int: 迁移后的结构版本
+    """
+    for version, description, migrate in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT pg_advisory_xact_lock(?)", (_MIGRATION_LOCK_ID,))
+            # 获取锁后再次确认版本
+            if cursor.execute("SELECT 1 FROM schema_version WHERE version >= ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            migrate(cursor)
+            cursor.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+            conn.commit()
+            print(f"数据库迁移完成: v{version} {description}")
+        except Exception as e:
+            conn.rollback()
+            print(f"数据库迁移失败: v{version} {description}: {str(e)}")
+            break
+
+    return get_schema_version(conn)
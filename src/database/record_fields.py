@@ -0,0 +1,189 @@
+"""
+聊天记录的结构化字段
+在写入记录时（以及迁移回填旧记录时）一次性解析回答中的图表信息，得到去除图表路径后的回答正文、
+图表内容ID、展示图/缩略图路径和历史表格用的摘要。读取历史时直接使用这些列，不再做正则匹配或文件检查
+"""
+import os
+import re
+
+from src.storage.chart_optimizer import chart_optimizer
+from src.storage.chart_registry import chart_registry
+
+# 历史表格中回答摘要的最大长度
+SUMMARY_MAX_LENGTH = 120
+
+# 连续的中日韩文字（汉字、假名、谚文），搜索索引中切分为双字词
+_CJK_RUN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]{2,}')
+
+# 回答文本中图表路径相关的内容，提取正文时移除
+_CHART_TEXT_PATTERNS = [
+    re.compile(r'本地图片路径:\s*[^\n]+'),
+    re.compile(r'图片URL链接:\s*[^\n]+'),
+    re.compile(r'file://[^\n]+'),
+    re.compile(r'<img[^>]*>'),
+    re.compile(r'<br><small>图片路径:[^<]*</small>'),
+    re.compile(r'!\[.*?\]\([^)]+\)'),
+    re.compile(r'[A-Za-z]:\\[^<>:|?*\n]+\.(png|jpg|jpeg|svg)'),  # Windows绝对路径
+    re.compile(r'(exports/)?charts/[^<>:|?*\n]+\.(png|jpg|jpeg|svg)'),  # charts目录路径
+    re.compile(r'/[^<>:|?*\n]+\.(png|jpg|jpeg|svg)'),  # Unix绝对路径
+]
+
+
+def detect_chart(answer, chart_path):
+    """
+    确定记录关联的图表文件（优先使用传入的路径，否则从回答文本中检测）
+
+    Args:
+        answer: AI回答
+        chart_path: 调用方传入的图表路径（可能为None）
+
+    Returns:
+        tuple: (has_chart, final_chart_path)
+    """
+    # 如果直接传入了图表路径，使用它
+    has_chart = bool(chart_path and os.path.exists(chart_path))
+    # 使用相对路径存储，而不是绝对路径
+    final_chart_path = os.path.relpath(chart_path) if has_chart else None
+
+    if has_chart or not answer:
+        return has_chart, final_chart_path
+
+    # 没有直接传入图表路径，尝试从回答文本中检测
+    has_img = False
+    img_path = None
+
+    # 1. 检查是否有图片URL链接
+    if "图片URL链接:" in answer:
+        has_img = True
+
+    # 2. 检查是否有本地图片路径
+    elif "本地图片路径:" in answer:
+        has_img = True
+        path_matches = re.findall(r'本地图片路径:\s+(.+?)(?:\n|$)', answer)
+        if path_matches:
+            original_path = path_matches[0].strip()
+            img_path = os.path.relpath(original_path) if os.path.isabs(original_path) else original_path
+
+    # 3. 检查Markdown图片格式 ![Chart](file://...) 或 ![Chart](charts/...)
+    elif re.search(r'!\[.*?\]\((file://)?(.+?\.(png|jpg|jpeg|svg))\)', answer):
+        has_img = True
+        markdown_matches = re.findall(r'!\[.*?\]\((file://)?(.+?\.(png|jpg|jpeg|svg))\)', answer)
+        if markdown_matches:
+            file_protocol, path_part, ext = markdown_matches[0]
+            original_path = path_part.strip()
+            img_path = os.path.relpath(original_path) if os.path.isabs(original_path) else original_path
+
+    # 4. 检查是否有图片文件路径行 (单独的路径行)
+    elif re.search(r'charts/\d+_[a-zA-Z0-9]+\.(png|jpg|jpeg|svg)(?:\n|$)', answer):
+        has_img = True
+        path_matches = re.findall(r'(charts/\d+_[a-zA-Z0-9]+\.(png|jpg|jpeg|svg))(?:\n|$)', answer)
+        if path_matches:
+            img_path = path_matches[0][0].strip()
+
+    # 5. 检查新格式：[数据分析图表: filename.png]
+    elif re.search(r'\[.*?图表.*?:\s*(.+?\.(png|jpg|jpeg|svg))\]', answer):
+        has_img = True
+        chart_matches = re.findall(r'\[.*?图表.*?:\s*(.+?\.(png|jpg|jpeg|svg))\]', answer)
+        if chart_matches:
+            filename = chart_matches[0][0].strip()
+            # 在可能的目录中查找这个文件
+            for dir_path in ["charts", "exports/charts", "."]:
+                full_path = os.path.join(dir_path, filename)
+                if os.path.exists(full_path):
+                    img_path = os.path.relpath(full_path)
+                    break
+
+    has_chart = bool(has_img and img_path and os.path.exists(img_path))
+    return has_chart, img_path if has_chart else None
+
+
+def strip_chart_text(answer):
+    """
+    移除回答中的图表路径、图片标签等内容，只保留正文
+
+    Args:
+        answer: AI回答
+
+    Returns:
+        str: 回答正文
+    """
+    if not answer:
+        return ""
+    text = answer
+    for pattern in _CHART_TEXT_PATTERNS:
+        text = pattern.sub('', text)
+    # 清理多余的空行和<br>标签
+    text = re.sub(r'(<br>\s*){3,}', '<br><br>', text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+def summarize_answer(text):
+    """截断回答正文作为历史表格中的摘要"""
+    if not text:
+        return ""
+    if len(text) > SUMMARY_MAX_LENGTH:
+        return text[:SUMMARY_MAX_LENGTH] + "..."
+    return text
+
+
+def build_record_fields(answer, chart_path):
+    """
+    计算一条记录的结构化字段
+
+    Args:
+        answer: AI回答
+        chart_path: 调用方传入的图表路径（可能为None）
+
+    Returns:
+        dict: has_chart, chart_path, answer_text, answer_summary, chart_id, display_path, thumbnail_path, thumbnail_id
+    """
+    has_chart, final_chart_path = detect_chart(answer, chart_path)
+
+    fields = {
+        # 以整数保存，各数据库后端的列类型一致
+        "has_chart": int(has_chart),
+        "chart_path": final_chart_path,
+        "answer_text": answer or "",
+        "chart_id": None,
+        "display_path": None,
+        "thumbnail_path": None,
+        "thumbnail_id": None,
+    }
+
+    if has_chart:
+        fields["answer_text"] = strip_chart_text(answer)
+        fields["chart_id"] = chart_registry.register(final_chart_path)
+        display_path = chart_optimizer.get_display(final_chart_path)
+        fields["display_path"] = os.path.relpath(display_path)
+        thumbnail_path = chart_optimizer.get_thumbnail(final_chart_path)
+        if thumbnail_path:
+            fields["thumbnail_path"] = os.path.relpath(thumbnail_path)
+            fields["thumbnail_id"] = chart_registry.register(thumbnail_path)
+
+    fields["answer_summary"] = summarize_answer(fields["answer_text"])
+    return fields
+
+
+def cjk_bigrams(*texts):
+    """
+    把文本中连续的中日韩文字切分为相邻的双字词，写入search_bigrams列
+
+    trigram索引无法匹配少于3个字符的关键词，而中文关键词大多只有两个字，
+    这些关键词通过search_bigrams列上的双字词索引搜索
+
+    Args:
+        texts: 问题、回答等文本（可以为None）
+
+    Returns:
+        str: 空格分隔的双字词（去重）
+    """
+    bigrams = []
+    for text in texts:
+        for run in _CJK_RUN.findall(text or ""):
+            bigrams.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return " ".join(dict.fromkeys(bigrams))
+
+
+def is_cjk_bigram(term):
+    """关键词是否为两个中日韩文字（可以通过双字词索引搜索）"""
+    return len(term) == 2 and _CJK_RUN.fullmatch(term) is not None
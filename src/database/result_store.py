@@ -0,0 +1,275 @@
+"""
+大型表格结果存储
+agent.chat 返回的DataFrame或较大的字典/列表不再以JSON文本存入chat_history.answer，
+而是压缩后按内容哈希存入result_blobs表，记录中只保留简短摘要和result_id，查看时按页读取
+"""
+import os
+import io
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# 超过该行数的表格结果单独存储
+RESULT_INLINE_MAX_ROWS = int(os.getenv("RESULT_INLINE_MAX_ROWS", "20"))
+# 超过该字符数的字典/列表结果单独存储
+RESULT_INLINE_MAX_CHARS = int(os.getenv("RESULT_INLINE_MAX_CHARS", "2000"))
+# 结果查看区每页显示的行数
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "50"))
+# 清理未被引用的结果时跳过最近保存的结果（秒）：结果先于引用它的聊天记录写入
+RESULT_ORPHAN_GRACE_SECONDS = int(os.getenv("RESULT_ORPHAN_GRACE_SECONDS", "600"))
+
+# Parquet行组大小，按页读取时只解码需要的行组
+_ROW_GROUP_SIZE = 1000
+
+# pyarrow已在requirements.txt中声明；未安装时（如精简环境）退回gzip压缩的JSON
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+    print("警告: 未安装pyarrow，大型结果将以gzip压缩的JSON格式存储")
+
+
+def extract_table(result):
+    """
+    从agent.chat的返回值中提取需要单独存储的表格
+
+    Args:
+        result: agent.chat的返回值
+
+    Returns:
+        DataFrame: 需要单独存储的表格，结果较小或不是表格时返回None
+    """
+    if isinstance(result, dict) and result.get("type") == "dataframe" and "value" in result:
+        result = result["value"]
+
+    if isinstance(result, pd.Series):
+        result = result.to_frame()
+    if isinstance(result, pd.DataFrame):
+        return result if len(result) > RESULT_INLINE_MAX_ROWS else None
+
+    if not isinstance(result, (dict, list)) or not result:
+        return None
+    try:
+        text_length = len(json.dumps(result, ensure_ascii=False, default=str))
+    except (TypeError, ValueError):
+        return None
+    if text_length <= RESULT_INLINE_MAX_CHARS:
+        return None
+
+    # 记录列表、列字典或普通键值字典
+    try:
+        if isinstance(result, list):
+            if not all(isinstance(item, dict) for item in result):
+                result = [{"value": item} for item in result]
+            return pd.DataFrame(result)
+        if all(isinstance(value, list) for value in result.values()):
+            return pd.DataFrame(result)
+        return pd.DataFrame({"key": list(result.keys()), "value": [str(value) for value in result.values()]})
+    except ValueError:
+        return None
+
+
+def summarize_table(df, max_rows=5):
+    """
+    生成表格结果的简短摘要（规模、列名和前几行）
+
+    Args:
+        df: 表格结果
+        max_rows: 摘要中显示的行数
+
+    Returns:
+        str: 摘要文本
+    """
+    columns = ", ".join(str(column) for column in df.columns[:20])
+    if len(df.columns) > 20:
+        columns += ", ..."
+    preview = df.head(max_rows).to_string(max_colwidth=40)
+    return f"{len(df)} × {len(df.columns)}: {columns}\n```\n{preview}\n```"
+
+
+class ResultStore:
+    """表格结果的存取，数据保存在result_blobs表中，最近读取的结果缓存在内存中"""
+
+    def __init__(self, backend, cache_size=4):
+        """
+        初始化结果存储
+
+        Args:
+            backend: 数据库后端（见backends.py）
+            cache_size: 内存中缓存的已解码结果数（JSON格式需要整体解码）
+        """
+        self._backend = backend
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def save(self, df):
+        """
+        保存表格结果，相同内容只存储一次
+
+        Args:
+            df: 表格结果
+
+        Returns:
+            str: 结果ID，表格无法序列化时返回None（调用方只保留摘要）
+        """
+        try:
+            df = self._flatten(df)
+        except ValueError as e:
+            print(f"表格结果无法存储，只保留摘要: {str(e)}")
+            return None
+
+        data_format, data = None, None
+        if PARQUET_AVAILABLE:
+            try:
+                buffer = io.BytesIO()
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                pq.write_table(table, buffer, compression="zstd", row_group_size=_ROW_GROUP_SIZE)
+                data_format, data = "parquet", buffer.getvalue()
+            except (pa.ArrowException, ValueError, TypeError) as e:
+                # 混合类型的object列等无法转换为Arrow类型，改用JSON
+                print(f"表格结果无法保存为Parquet，改用JSON格式: {str(e)}")
+        if data is None:
+            try:
+                text = df.to_json(orient="split", index=False, date_format="iso", default_handler=str)
+            except (ValueError, TypeError, OverflowError) as e:
+                print(f"表格结果无法存储，只保留摘要: {str(e)}")
+                return None
+            data_format, data = "json.gz", gzip.compress(text.encode("utf-8"))
+
+        result_id = hashlib.sha1(data).hexdigest()[:20]
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = self._backend.connection()
+        try:
+            conn.execute(
+                self._backend.insert_ignore_sql("result_blobs", ["id", "format", "row_count", "columns", "size", "data", "created_at"]),
+                (result_id, data_format, len(df), json.dumps(list(df.columns), ensure_ascii=False), len(data), data, created_at)
+            )
+            # 内容相同的结果已存在时更新保存时间，避免其在被新记录引用前作为孤立结果清理
+            conn.execute("UPDATE result_blobs SET created_at = ? WHERE id = ?", (created_at, result_id))
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"表格结果已单独存储: {result_id} ({len(df)}行, {len(data)} 字节, {data_format})")
+        return result_id
+
+    @staticmethod
+    def _flatten(df):
+        """列名统一为字符串、有意义的索引转为普通列，保证Parquet和JSON都能序列化"""
+        df = df.copy()
+        df.columns = [str(column) for column in df.columns]
+        if isinstance(df.index, pd.RangeIndex) and df.index.name is None:
+            return df.reset_index(drop=True)
+        # 索引名与已有列名相同时加后缀，reset_index不允许重复的列名
+        names = []
+        for position, name in enumerate(df.index.names):
+            name = str(name) if name is not None else ("index" if df.index.nlevels == 1 else f"level_{position}")
+            while name in df.columns or name in names:
+                name = f"{name}_index"
+            names.append(name)
+        df.index = df.index.set_names(names)
+        return df.reset_index()
+
+    def get_info(self, result_id):
+        """
+        获取结果的行数和列名（不读取数据）
+
+        Returns:
+            dict: {"row_count": 行数, "columns": 列名列表}，结果不存在时返回None
+        """
+        conn = self._backend.connection()
+        try:
+            row = conn.execute("SELECT row_count, columns FROM result_blobs WHERE id = ?", (result_id,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        return {"row_count": row[0], "columns": json.loads(row[1])}
+
+    def load_page(self, result_id, page=1, page_size=RESULT_PAGE_SIZE):
+        """
+        读取结果的一页数据
+
+        Args:
+            result_id: 结果ID
+            page: 页码（从1开始）
+            page_size: 每页行数
+
+        Returns:
+            tuple: (当前页DataFrame, 总行数)，结果不存在时返回(None, 0)
+        """
+        start = max(page - 1, 0) * page_size
+        stop = start + page_size
+
+        with self._lock:
+            cached = self._cache.get(result_id)
+            if cached is not None:
+                self._cache.move_to_end(result_id)
+        if cached is not None:
+            return cached.iloc[start:stop], len(cached)
+
+        conn = self._backend.connection()
+        try:
+            row = conn.execute("SELECT format, row_count, data FROM result_blobs WHERE id = ?", (result_id,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None, 0
+        data_format, row_count, data = row
+
+        if data_format == "parquet":
+            if not PARQUET_AVAILABLE:
+                print("无法读取Parquet格式的结果：未安装pyarrow")
+                return None, row_count
+            # 只解码覆盖当前页的行组
+            parquet_file = pq.ParquetFile(io.BytesIO(data))
+            first_group = start // _ROW_GROUP_SIZE
+            last_group = min((stop - 1) // _ROW_GROUP_SIZE, parquet_file.num_row_groups - 1)
+            if first_group > last_group:
+                return parquet_file.schema_arrow.empty_table().to_pandas(), row_count
+            table = parquet_file.read_row_groups(list(range(first_group, last_group + 1)))
+            offset = start - first_group * _ROW_GROUP_SIZE
+            return table.slice(offset, page_size).to_pandas(), row_count
+
+        df = pd.read_json(io.StringIO(gzip.decompress(data).decode("utf-8")), orient="split")
+        with self._lock:
+            self._cache[result_id] = df
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return df.iloc[start:stop], row_count
+
+    def prune_orphans(self, grace_seconds=RESULT_ORPHAN_GRACE_SECONDS):
+        """
+        删除已没有任何聊天记录引用的结果
+
+        结果在引用它的聊天记录之前保存，聊天记录还在后台写入队列中时结果暂时没有引用，
+        因此只删除保存时间早于grace_seconds的结果
+
+        Args:
+            grace_seconds: 跳过最近多少秒内保存的结果
+
+        Returns:
+            int: 删除的结果数
+        """
+        cutoff = (datetime.now() - timedelta(seconds=grace_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+        conn = self._backend.connection()
+        try:
+            cursor = conn.execute('''
+                DELETE FROM result_blobs
+                WHERE created_at < ?
+                    AND NOT EXISTS (SELECT 1 FROM chat_history WHERE chat_history.result_id = result_blobs.id)
+            ''', (cutoff,))
+            deleted = cursor.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._cache.clear()
+        return deleted
@@ -0,0 +1,349 @@
+"""
+聊天历史保留策略
+按保存天数、总记录数和每个客户端的记录数上限清理旧记录：过期记录先归档到压缩的JSONL（或Parquet）文件，
+再分批删除，每批一个短事务，不会长时间占用写锁。清理和incremental_vacuum由后台线程在低峰时段每天执行一次
+"""
+import os
+import gzip
+import json
+import time
+import atexit
+import threading
+from datetime import datetime, timedelta
+
+# 记录最多保留的天数，0表示不按时间清理
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+# 最多保留的记录总数，0表示不限制
+HISTORY_MAX_RECORDS = int(os.getenv("HISTORY_MAX_RECORDS", "0"))
+# 每个客户端最多保留的记录数，0表示不限制
+HISTORY_MAX_RECORDS_PER_CLIENT = int(os.getenv("HISTORY_MAX_RECORDS_PER_CLIENT", "0"))
+# 删除前是否归档过期记录
+HISTORY_ARCHIVE_ENABLED = os.getenv("HISTORY_ARCHIVE_ENABLED", "true").lower() == "true"
+# 归档文件目录
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", "data/archive")
+# 归档格式 (jsonl=gzip压缩的JSONL, parquet=需要pyarrow)
+HISTORY_ARCHIVE_FORMAT = os.getenv("HISTORY_ARCHIVE_FORMAT", "jsonl").lower()
+# 每批删除的记录数
+HISTORY_RETENTION_BATCH_SIZE = int(os.getenv("HISTORY_RETENTION_BATCH_SIZE", "500"))
+# 执行清理的低峰时段（小时，含起止），例如 2-5
+HISTORY_MAINTENANCE_WINDOW = os.getenv("HISTORY_MAINTENANCE_WINDOW", "2-5")
+# 每次incremental_vacuum释放的页数
+HISTORY_VACUUM_STEP_PAGES = int(os.getenv("HISTORY_VACUUM_STEP_PAGES", "1000"))
+
+# 后台线程检查是否进入低峰时段的间隔（秒）
+_CHECK_INTERVAL = 600
+# 两批删除之间的间隔（秒），让出写锁给正常的读写
+_BATCH_PAUSE = 0.05
+
+
+def _parse_window(window):
+    """解析低峰时段配置，返回(开始小时, 结束小时)"""
+    try:
+        start, end = (int(part) for part in window.split("-", 1))
+        return start % 24, end % 24
+    except ValueError:
+        print(f"无效的维护时段配置: {window}，使用默认值 2-5")
+        return 2, 5
+
+
+class ArchiveWriter:
+    """把删除前的记录追加写入归档文件，首次写入时才创建文件"""
+
+    def __init__(self, archive_dir=HISTORY_ARCHIVE_DIR, archive_format=HISTORY_ARCHIVE_FORMAT):
+        """
+        初始化归档写入器
+
+        Args:
+            archive_dir: 归档文件目录
+            archive_format: 归档格式 jsonl 或 parquet
+        """
+        self.archive_dir = archive_dir
+        self.archive_format = archive_format
+        self.path = None
+        self.count = 0
+        self._file = None
+        self._parquet_writer = None
+
+        if self.archive_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print("警告: 未安装pyarrow，历史记录归档改用JSONL格式")
+                self.archive_format = "jsonl"
+
+    def _open(self):
+        """创建本次清理的归档文件"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        ext = ".parquet" if self.archive_format == "parquet" else ".jsonl.gz"
+        self.path = os.path.join(self.archive_dir, f"chat_history_{timestamp}{ext}")
+        if self.archive_format != "parquet":
+            self._file = gzip.open(self.path, "wt", encoding="utf-8")
+
+    def write(self, records):
+        """
+        追加一批记录
+
+        Args:
+            records: 记录字典列表
+        """
+        if not records:
+            return
+        if self.path is None:
+            self._open()
+
+        if self.archive_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pylist(records)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+            else:
+                table = table.cast(self._parquet_writer.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            for record in records:
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            # 保证记录在删除前已写入磁盘
+            self._file.flush()
+        self.count += len(records)
+
+    def close(self):
+        """关闭归档文件"""
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class HistoryRetention:
+    """
+    聊天历史保留策略执行器
+
+    run_once() 可随时手动调用；start() 启动后台线程，在低峰时段每天执行一次
+    """
+
+    def __init__(self, backend, remove_charts, prune_results=None):
+        """
+        初始化保留策略执行器
+
+        Args:
+            backend: 数据库后端，后台线程使用其中属于自己的连接
+            remove_charts: 删除图表文件的函数 remove_charts(chart_paths)
+            prune_results: 清理不再被引用的表格结果的函数（可选）
+        """
+        self._backend = backend
+        self._remove_charts = remove_charts
+        self._prune_results = prune_results
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_run_date = None
+
+    @property
+    def enabled(self):
+        """是否配置了任何保留策略"""
+        return bool(HISTORY_RETENTION_DAYS or HISTORY_MAX_RECORDS or HISTORY_MAX_RECORDS_PER_CLIENT)
+
+    def start(self):
+        """启动后台维护线程（未配置保留策略时不启动）"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="history-retention", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        print(f"历史记录保留策略已启用，维护时段: {HISTORY_MAINTENANCE_WINDOW} 点")
+
+    def stop(self):
+        """停止后台维护线程"""
+        self._stop_event.set()
+
+    def _in_window(self, now):
+        """当前时间是否处于低峰时段"""
+        start, end = _parse_window(HISTORY_MAINTENANCE_WINDOW)
+        if start <= end:
+            return start <= now.hour <= end
+        # 跨越午夜的时段，例如 23-4
+        return now.hour >= start or now.hour <= end
+
+    def _run(self):
+        """后台线程主循环"""
+        while not self._stop_event.wait(_CHECK_INTERVAL):
+            now = datetime.now()
+            if self._in_window(now) and self._last_run_date != now.date():
+                self._last_run_date = now.date()
+                self.run_once()
+
+    def _stages(self, conn):
+        """
+        根据保留策略生成删除条件
+
+        计数类策略在开始时确定一次边界（第N条最新记录的(created_at, id)），
+        之后新写入的记录都比边界新，不影响本次清理
+
+        Returns:
+            list: [(描述, WHERE条件, 参数)]
+        """
+        stages = []
+        if HISTORY_RETENTION_DAYS > 0:
+            cutoff = (datetime.now() - timedelta(days=HISTORY_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+            stages.append((f"超过{HISTORY_RETENTION_DAYS}天", "created_at < ?", [cutoff]))
+
+        if HISTORY_MAX_RECORDS > 0:
+            row = conn.execute(
+                "SELECT created_at, id FROM chat_history ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?",
+                (HISTORY_MAX_RECORDS - 1,)
+            ).fetchone()
+            if row:
+                stages.append((f"超过{HISTORY_MAX_RECORDS}条", "(created_at, id) < (?, ?)", list(row)))
+
+        if HISTORY_MAX_RECORDS_PER_CLIENT > 0:
+            boundaries = conn.execute(
+                '''
+                SELECT client_id, created_at, id FROM (
+                    SELECT client_id, created_at, id,
+                        ROW_NUMBER() OVER (PARTITION BY client_id ORDER BY created_at DESC, id DESC) AS rn
+                    FROM chat_history
+                ) AS ranked
+                WHERE rn = ?
+                ''',
+                (HISTORY_MAX_RECORDS_PER_CLIENT,)
+            ).fetchall()
+            for client_id, created_at, record_id in boundaries:
+                stages.append((
+                    f"客户端 {str(client_id)[:8]} 超过{HISTORY_MAX_RECORDS_PER_CLIENT}条",
+                    f"client_id {self._backend.null_safe_eq} ? AND (created_at, id) < (?, ?)",
+                    [client_id, created_at, record_id]
+                ))
+        return stages
+
+    def run_once(self):
+        """
+        执行一次清理：归档并分批删除过期记录，删除已无记录的会话，然后回收空闲页
+
+        Returns:
+            dict: 清理统计 {"deleted": 删除记录数, "sessions": 删除会话数, "archive": 归档文件路径, "vacuumed_pages": 回收页数}
+        """
+        stats = {"deleted": 0, "sessions": 0, "archive": None, "vacuumed_pages": 0}
+        if not self._run_lock.acquire(blocking=False):
+            print("历史记录清理正在进行中，跳过本次执行")
+            return stats
+
+        archive = ArchiveWriter() if HISTORY_ARCHIVE_ENABLED else None
+        conn = self._backend.connection()
+        try:
+            started = time.time()
+            touched_sessions = set()
+            for description, where, params in self._stages(conn):
+                deleted = self._delete_batches(conn, where, params, archive, touched_sessions)
+                if deleted:
+                    print(f"历史记录清理（{description}）: 删除 {deleted} 条")
+                stats["deleted"] += deleted
+
+            stats["sessions"] = self._delete_empty_sessions(conn, touched_sessions)
+            if stats["deleted"] and self._prune_results is not None:
+                self._prune_results()
+            # 服务器数据库由自身的autovacuum回收空间
+            if self._backend.name == "sqlite":
+                stats["vacuumed_pages"] = self.incremental_vacuum(conn)
+            if archive is not None:
+                stats["archive"] = archive.path
+            print(f"历史记录清理完成: 删除 {stats['deleted']} 条记录、{stats['sessions']} 个会话，"
+                  f"回收 {stats['vacuumed_pages']} 页，耗时 {time.time() - started:.1f}s")
+        except Exception as e:
+            print(f"历史记录清理失败: {str(e)}")
+        finally:
+            if archive is not None:
+                archive.close()
+            conn.close()
+            self._run_lock.release()
+        return stats
+
+    def _delete_batches(self, conn, where, params, archive, touched_sessions):
+        """按条件分批归档并删除记录，每批一个事务"""
+        total = 0
+        while True:
+            cursor = conn.execute(
+                f"SELECT * FROM chat_history WHERE {where} ORDER BY created_at, id LIMIT ?",
+                params + [HISTORY_RETENTION_BATCH_SIZE]
+            )
+            columns = [column[0] for column in cursor.description]
+            records = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            if not records:
+                return total
+
+            # 先归档，确认写入后再删除
+            if archive is not None:
+                archive.write(records)
+
+            conn.executemany("DELETE FROM chat_history WHERE id = ?", [(record["id"],) for record in records])
+            conn.commit()
+
+            touched_sessions.update(record["session_id"] for record in records)
+            self._remove_charts([record["chart_path"] for record in records
+                                 if record.get("has_chart") and record.get("chart_path")])
+            total += len(records)
+
+            if len(records) < HISTORY_RETENTION_BATCH_SIZE:
+                return total
+            time.sleep(_BATCH_PAUSE)
+
+    def _delete_empty_sessions(self, conn, session_ids):
+        """删除本次清理后已没有任何记录的会话"""
+        session_ids = [session_id for session_id in session_ids if session_id]
+        deleted = 0
+        for start in range(0, len(session_ids), HISTORY_RETENTION_BATCH_SIZE):
+            batch = session_ids[start:start + HISTORY_RETENTION_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            cursor = conn.execute(
+                f'''
+                DELETE FROM sessions
+                WHERE id IN ({placeholders})
+                    AND NOT EXISTS (SELECT 1 FROM chat_history WHERE chat_history.session_id = sessions.id)
+                ''',
+                batch
+            )
+            deleted += cursor.rowcount
+            # 会话快照随会话一起删除
+            conn.execute(
+                f"DELETE FROM session_snapshots WHERE session_id IN ({placeholders}) "
+                f"AND NOT EXISTS (SELECT 1 FROM sessions WHERE sessions.id = session_snapshots.session_id)",
+                batch
+            )
+            conn.commit()
+        return deleted
+
+    def incremental_vacuum(self, conn):
+        """
+        回收空闲页，缩小数据库文件
+
+        数据库尚未启用auto_vacuum=INCREMENTAL时先执行一次完整VACUUM进行转换（只发生一次），
+        之后每次只按步长释放空闲页，每步一个短事务
+
+        Returns:
+            int: 回收的页数
+        """
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not freelist:
+            return 0
+
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("数据库启用增量回收（auto_vacuum=INCREMENTAL），执行一次完整VACUUM...")
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            return freelist
+
+        reclaimed = 0
+        while freelist > 0:
+            # executescript会逐步执行到完成，execute只会释放一页
+            conn.executescript(f"PRAGMA incremental_vacuum({HISTORY_VACUUM_STEP_PAGES});")
+            remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if remaining >= freelist:
+                break
+            reclaimed += freelist - remaining
+            freelist = remaining
+            time.sleep(_BATCH_PAUSE)
+        return reclaimed
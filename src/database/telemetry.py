@@ -0,0 +1,231 @@
+"""
+请求遥测存储
+每个问题的阶段耗时、token用量和重试次数写入request_metrics表，同时在同一事务中累加到
+request_metrics_hourly按小时汇总表。汇总表为每个（小时、提供方、模型、指标）保存对数分桶的直方图，
+统计页面合并直方图计算P50/P95/P99，查询量与请求数无关。原始明细只保留最近一段时间
+"""
+import os
+import json
+import math
+from datetime import datetime, timedelta
+
+from src.database.history_writer import HistoryWriter
+
+# 原始明细保留天数（按小时汇总的数据不受影响）
+TELEMETRY_RAW_RETENTION_DAYS = int(os.getenv("TELEMETRY_RAW_RETENTION_DAYS", "30"))
+
+# 汇总的指标
+METRICS = (
+    "queue_ms", "llm_ms", "exec_ms", "chart_ms", "upload_ms", "total_ms",
+    "prompt_tokens", "completion_tokens", "retries",
+)
+# 计算的分位数
+PERCENTILES = (50, 95, 99)
+
+# 按小时汇总表的列，前四列为主键
+_HOURLY_COLUMNS = ["hour", "llm_type", "model_name", "metric", "count", "total", "max", "histogram"]
+
+# 直方图分桶的增长系数，分位数的相对误差不超过约12%
+_BUCKET_BASE = 1.25
+_LOG_BASE = math.log(_BUCKET_BASE)
+# 最小的非零桶下界，更小的值都计入0号桶
+_BUCKET_MIN = 0.01
+
+
+def bucket_index(value):
+    """数值所在的直方图桶"""
+    if value < _BUCKET_MIN:
+        return 0
+    return int(math.log(value / _BUCKET_MIN) / _LOG_BASE) + 1
+
+
+def bucket_value(index):
+    """直方图桶的代表值（桶上下界的几何中点）"""
+    if index <= 0:
+        return 0.0
+    return _BUCKET_MIN * _BUCKET_BASE ** (index - 0.5)
+
+
+def histogram_percentile(histogram, percentile, maximum=None):
+    """
+    根据直方图计算分位数
+
+    Args:
+        histogram: {桶序号: 计数}
+        percentile: 分位数（0-100）
+        maximum: 实际最大值，用于限制最高桶的代表值
+
+    Returns:
+        float: 分位数的近似值，没有数据时返回None
+    """
+    count = sum(histogram.values())
+    if not count:
+        return None
+    rank = math.ceil(count * percentile / 100)
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= rank:
+            value = bucket_value(index)
+            return min(value, maximum) if maximum is not None else value
+    return maximum
+
+
+class RequestTelemetry:
+    """请求遥测的写入（后台组提交）与统计查询"""
+
+    def __init__(self, backend):
+        """
+        初始化遥测存储
+
+        Args:
+            backend: 数据库后端（见backends.py）
+        """
+        self._backend = backend
+        self._last_prune_hour = None
+        self._writer = HistoryWriter(backend, self._write_batch, name="telemetry-writer")
+
+    def close(self):
+        """写完待保存的遥测数据并停止写入线程"""
+        self._writer.close()
+
+    def hold(self):
+        """暂停写入遥测数据（见HistoryWriter.hold）"""
+        return self._writer.hold()
+
+    def record(self, llm_type, model_name, metrics, record_id=None, status="ok"):
+        """
+        记录一个请求的遥测数据（立即返回，由后台线程写入）
+
+        Args:
+            llm_type: LLM提供方
+            model_name: 模型名称
+            metrics: RequestTimer.to_metrics() 返回的指标字典
+            record_id: 对应的聊天记录ID（请求失败时为None）
+            status: "ok" 或 "error"
+        """
+        item = {metric: metrics.get(metric, 0) for metric in METRICS}
+        item.update({
+            "record_id": record_id,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "llm_type": llm_type or "",
+            "model_name": model_name or llm_type or "",
+            "status": status,
+        })
+        self._writer.submit(item)
+
+    def _write_batch(self, conn, items):
+        """写入一批明细并累加到按小时汇总表（由后台写入线程调用）"""
+        conn.executemany(
+            f'''
+            INSERT INTO request_metrics (record_id, created_at, llm_type, model_name, status, {", ".join(METRICS)})
+            VALUES (?, ?, ?, ?, ?, {", ".join("?" * len(METRICS))})
+            ''',
+            [
+                (item["record_id"], item["created_at"], item["llm_type"], item["model_name"], item["status"])
+                + tuple(item[metric] for metric in METRICS)
+                for item in items
+            ]
+        )
+
+        # 先在内存中合并本批数据，每个汇总行只读写一次
+        rollups = {}
+        for item in items:
+            hour = item["created_at"][:13] + ":00"
+            for metric in METRICS:
+                value = float(item[metric] or 0)
+                key = (hour, item["llm_type"], item["model_name"], metric)
+                rollup = rollups.setdefault(key, {"count": 0, "total": 0.0, "max": 0.0, "histogram": {}})
+                rollup["count"] += 1
+                rollup["total"] += value
+                rollup["max"] = max(rollup["max"], value)
+                index = bucket_index(value)
+                rollup["histogram"][index] = rollup["histogram"].get(index, 0) + 1
+
+        for key, rollup in rollups.items():
+            row = conn.execute(
+                '''
+                SELECT count, total, max, histogram FROM request_metrics_hourly
+                WHERE hour = ? AND llm_type = ? AND model_name = ? AND metric = ?
+                ''',
+                key
+            ).fetchone()
+            if row:
+                histogram = {int(index): count for index, count in json.loads(row[3]).items()}
+                for index, count in rollup["histogram"].items():
+                    histogram[index] = histogram.get(index, 0) + count
+                rollup = {
+                    "count": row[0] + rollup["count"],
+                    "total": row[1] + rollup["total"],
+                    "max": max(row[2], rollup["max"]),
+                    "histogram": histogram,
+                }
+            conn.execute(
+                self._backend.upsert_sql("request_metrics_hourly", _HOURLY_COLUMNS, _HOURLY_COLUMNS[:4]),
+                key + (rollup["count"], rollup["total"], rollup["max"], json.dumps(rollup["histogram"]))
+            )
+
+        # 每小时清理一次过期的原始明细
+        current_hour = items[-1]["created_at"][:13]
+        if current_hour != self._last_prune_hour:
+            self._last_prune_hour = current_hour
+            cutoff = (datetime.now() - timedelta(days=TELEMETRY_RAW_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+            conn.execute("DELETE FROM request_metrics WHERE created_at < ?", (cutoff,))
+
+    def get_stats(self, hours=24 * 7, metrics=METRICS):
+        """
+        按提供方和模型统计最近一段时间的指标分位数
+
+        Args:
+            hours: 统计最近多少小时
+            metrics: 需要统计的指标
+
+        Returns:
+            list: 每个（提供方、模型、指标）一项：
+                {"llm_type", "model_name", "metric", "count", "avg", "max", "p50", "p95", "p99"}
+        """
+        self._writer.wait_for_pending()
+        since = (datetime.now() - timedelta(hours=hours)).strftime("%Y-%m-%d %H:00")
+        placeholders = ",".join("?" * len(metrics))
+        conn = self._backend.connection()
+        try:
+            rows = conn.execute(
+                f'''
+                SELECT llm_type, model_name, metric, count, total, max, histogram
+                FROM request_metrics_hourly
+                WHERE hour >= ? AND metric IN ({placeholders})
+                ''',
+                (since,) + tuple(metrics)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        merged = {}
+        for llm_type, model_name, metric, count, total, maximum, histogram in rows:
+            entry = merged.setdefault(
+                (llm_type, model_name, metric), {"count": 0, "total": 0.0, "max": 0.0, "histogram": {}}
+            )
+            entry["count"] += count
+            entry["total"] += total
+            entry["max"] = max(entry["max"], maximum)
+            for index, bucket_count in json.loads(histogram).items():
+                index = int(index)
+                entry["histogram"][index] = entry["histogram"].get(index, 0) + bucket_count
+
+        metric_order = {metric: position for position, metric in enumerate(metrics)}
+        stats = []
+        for (llm_type, model_name, metric), entry in sorted(
+            merged.items(), key=lambda item: (item[0][0], item[0][1], metric_order[item[0][2]])
+        ):
+            stat = {
+                "llm_type": llm_type,
+                "model_name": model_name,
+                "metric": metric,
+                "count": entry["count"],
+                "avg": entry["total"] / entry["count"] if entry["count"] else 0.0,
+                "max": entry["max"],
+            }
+            for percentile in PERCENTILES:
+                stat[f"p{percentile}"] = histogram_percentile(entry["histogram"], percentile, entry["max"])
+            stats.append(stat)
+        return stats
@@ -0,0 +1,108 @@
+import os
+import threading
+from collections import OrderedDict
+
+from .llm_factory import LLMFactory
+
+# 最多保留的已初始化Agent数量，超出时淘汰最久未使用的Agent
+AGENT_REGISTRY_MAX_AGENTS = int(os.getenv("AGENT_REGISTRY_MAX_AGENTS", "4"))
+
+
+class AgentRegistry:
+    """
+    已初始化的LLM与Agent注册表
+
+    LLM实例按 (LLM类型, 模型标识) 缓存，创建时的网络探测只执行一次；
+    Agent按 (数据集指纹, LLM类型, 模型标识) 缓存，来回切换模型或重新上传相同的文件时直接复用。
+    Agent持有数据集的引用，数量按LRU限制。
+    """
+
+    def __init__(self, max_agents=AGENT_REGISTRY_MAX_AGENTS):
+        """
+        初始化注册表
+
+        Args:
+            max_agents: 最多保留的Agent数量，0表示不缓存Agent
+        """
+        self.max_agents = max_agents
+        self._llms = {}
+        self._agents = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _llm_key(llm_type):
+        """LLM实例的缓存键"""
+        return (llm_type, LLMFactory.get_model_key(llm_type))
+
+    def get_llm(self, llm_type, language="zh"):
+        """
+        获取LLM实例，未缓存时通过LLMFactory创建
+
+        Args:
+            llm_type: LLM类型
+            language: 语言代码，用于错误消息
+
+        Returns:
+            tuple: (LLM实例, 成功标志, 错误消息)
+        """
+        key = self._llm_key(llm_type)
+        with self._lock:
+            llm = self._llms.get(key)
+        if llm is not None:
+            return llm, True, ""
+
+        # 创建失败不缓存，下次重新探测
+        llm, success, error_msg = LLMFactory.create_llm(llm_type, language)
+        if success:
+            with self._lock:
+                llm = self._llms.setdefault(key, llm)
+        return llm, success, error_msg
+
+    def get_agent(self, dataset_id, llm_type):
+        """
+        获取已初始化的Agent
+
+        Args:
+            dataset_id: 数据集指纹
+            llm_type: LLM类型
+
+        Returns:
+            Agent: 已缓存的Agent，没有时返回None
+        """
+        if not dataset_id:
+            return None
+        key = (dataset_id,) + self._llm_key(llm_type)
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is not None:
+                self._agents.move_to_end(key)
+            return agent
+
+    def put_agent(self, dataset_id, llm_type, agent):
+        """
+        缓存Agent，超出数量上限时淘汰最久未使用的Agent
+
+        Args:
+            dataset_id: 数据集指纹
+            llm_type: LLM类型
+            agent: 已初始化的Agent
+        """
+        if not dataset_id or self.max_agents <= 0:
+            return
+        key = (dataset_id,) + self._llm_key(llm_type)
+        with self._lock:
+            self._agents[key] = agent
+            self._agents.move_to_end(key)
+            while len(self._agents) > self.max_agents:
+                (evicted_dataset, evicted_type, _), _ = self._agents.popitem(last=False)
+                print(f"♻️ 已淘汰最久未使用的 Agent: {evicted_type} / 数据集 {evicted_dataset[:8]}")
+
+    def clear(self):
+        """清空所有缓存的LLM和Agent"""
+        with self._lock:
+            self._llms.clear()
+            self._agents.clear()
+
+
+# Create a singleton instance
+agent_registry = AgentRegistry()
@@ -3,6 +3,7 @@ import json
 import re
 import ast
 from pandasai.llm.base import LLM
+from ..utils.request_timing import record_tokens
 
 class CustomOllamaLLM(LLM):
     """
@@ -40,6 +41,8 @@ class CustomOllamaLLM(LLM):
                 try:
                     # 尝试解析JSON响应
                     json_response = response.json()
+                    # 记录本次调用的token用量
+                    record_tokens(json_response.get("prompt_eval_count", 0), json_response.get("eval_count", 0))
                     # 从完整响应中提取文本部分
                     return json_response.get("response", "")
                 except json.JSONDecodeError as e:
@@ -101,7 +104,8 @@ Your Python code:
                             full_response += chunk['response']
                         # 确保不要将整个JSON块纳入代码
                         if 'done' in chunk and chunk.get('done') == True:
-                            # 最后一个响应块，跳出循环
+                            # 最后一个响应块带有token用量，记录后跳出循环
+                            record_tokens(chunk.get("prompt_eval_count", 0), chunk.get("eval_count", 0))
                             break
                     except json.JSONDecodeError:
                         continue
@@ -5,6 +5,7 @@ from pandasai.llm.openai import OpenAI
 from pandasai.llm.azure_openai import AzureOpenAI
 from .custom_ollama import CustomOllamaLLM
 from ..utils.language_utils import LanguageUtils
+from ..utils.request_timing import instrument_llm
 
 # 加载环境变量
 load_dotenv()
@@ -22,6 +23,26 @@ class LLMFactory:
         except:
             return False
     
+    @staticmethod
+    def get_model_key(llm_type):
+        """
+        获取指定类型LLM当前配置的模型标识（不创建实例，不访问网络）
+        
+        Args:
+            llm_type: LLM类型
+            
+        Returns:
+            str: 模型标识，配置相同的LLM实例可以复用
+        """
+        if llm_type == "OpenAI":
+            # 使用PandasAI默认的OpenAI模型
+            return "default"
+        if llm_type == "Azure":
+            return f"{os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')}@{os.getenv('AZURE_OPENAI_ENDPOINT')}"
+        if llm_type == "Ollama":
+            return f"{os.getenv('OLLAMA_MODEL', 'llama3')}@{os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')}"
+        return ""
+    
     @staticmethod
     def create_llm(llm_type, language="zh"):
         """
@@ -130,4 +151,8 @@ class LLMFactory:
         else:
             error_msg = LanguageUtils.get_text(language, "unsupported_llm_type", llm_type)
         
+        if success and llm_type in ("OpenAI", "Azure"):
+            # 从OpenAI响应中记录token用量
+            instrument_llm(llm)
+        
         return llm, success, error_msg 
\ No newline at end of file
@@ -0,0 +1,114 @@
+import os
+import html
+import zipfile
+from datetime import datetime
+
+# Directory holding batch report bundles
+BATCH_EXPORT_DIR = os.getenv("BATCH_EXPORT_DIR", "exports/batch")
+# Rows of each table result shown inline in the HTML report (the full table is included as CSV)
+BATCH_REPORT_TABLE_ROWS = int(os.getenv("BATCH_REPORT_TABLE_ROWS", "50"))
+
+_STYLE = """
+body { font-family: -apple-system, "Segoe UI", "Microsoft YaHei", sans-serif; margin: 2em auto; max-width: 1000px; color: #222; }
+h1 { font-size: 1.5em; }
+.meta { color: #666; font-size: 0.9em; }
+.item { border-top: 1px solid #ddd; padding: 1em 0; }
+.question { font-weight: bold; }
+.answer { white-space: pre-wrap; }
+.error { color: #b00020; }
+table.data { border-collapse: collapse; font-size: 0.85em; margin: 0.5em 0; }
+table.data th, table.data td { border: 1px solid #ccc; padding: 2px 6px; }
+img { max-width: 100%; }
+"""
+
+
+class BatchReport:
+    """Writes the combined report of a batch run as a ZIP bundle.
+
+    The bundle holds a self-contained ``report.html`` with every question and
+    answer, the charts it references under ``charts/`` and each table result as
+    a full CSV under ``tables/`` (the HTML only shows the first rows).
+    """
+
+    def __init__(self, output_dir=BATCH_EXPORT_DIR, table_rows=BATCH_REPORT_TABLE_ROWS):
+        """Initialize the report writer.
+
+        Args:
+            output_dir: Directory holding report bundles
+            table_rows: Rows of each table shown inline in the HTML report
+        """
+        self.output_dir = output_dir
+        self.table_rows = table_rows
+
+    def write(self, items, labels, meta=None, output_path=None):
+        """Write a report bundle.
+
+        Args:
+            items: Batch results in question order; dicts with ``question``,
+                ``answer``, ``status``, ``elapsed`` and optional ``table``
+                (DataFrame) and ``chart`` (image path)
+            labels: Translated texts: ``title``, ``failed``, ``elapsed``,
+                ``full_table`` and ``generated_at``
+            meta: Extra ``(label, value)`` pairs shown under the title
+            output_path: Bundle path, None to create one in output_dir
+
+        Returns:
+            str: Path of the ZIP bundle
+        """
+        if output_path is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_path = os.path.join(self.output_dir, f"batch_{timestamp}.zip")
+
+        generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        meta_lines = [(labels["generated_at"], generated_at)] + list(meta or [])
+        sections = []
+        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for number, item in enumerate(items, start=1):
+                sections.append(self._write_item(bundle, number, item, labels))
+
+            body = "\n".join(sections)
+            meta_html = "<br>".join(f"{html.escape(str(k))}: {html.escape(str(v))}" for k, v in meta_lines)
+            document = (
+                "<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+                f"<title>{html.escape(labels['title'])}</title><style>{_STYLE}</style></head><body>"
+                f"<h1>{html.escape(labels['title'])}</h1><div class=\"meta\">{meta_html}</div>"
+                f"{body}</body></html>"
+            )
+            bundle.writestr("report.html", document)
+
+        print(f"Batch report written: {output_path} ({len(items)} questions)")
+        return output_path
+
+    def _write_item(self, bundle, number, item, labels):
+        """Add one result's files to the bundle and return its HTML section"""
+        parts = [
+            f"<div class=\"item\"><div class=\"question\">{number}. {html.escape(item['question'])}</div>",
+            f"<div class=\"meta\">{html.escape(labels['elapsed'])}: {item.get('elapsed', 0):.1f}s</div>",
+        ]
+        if item.get("status") != "ok":
+            parts.append(f"<p class=\"error\">{html.escape(labels['failed'])}: {html.escape(str(item.get('answer', '')))}</p>")
+            parts.append("</div>")
+            return "\n".join(parts)
+
+        parts.append(f"<div class=\"answer\">{html.escape(str(item.get('answer', '')))}</div>")
+
+        table = item.get("table")
+        if table is not None:
+            csv_name = f"tables/{number:03d}.csv"
+            bundle.writestr(csv_name, table.to_csv(index=False))
+            parts.append(table.head(self.table_rows).to_html(index=False, classes="data", border=0))
+            parts.append(f"<p><a href=\"{csv_name}\">{html.escape(labels['full_table'])} ({len(table)})</a></p>")
+
+        chart = item.get("chart")
+        if chart and os.path.exists(chart):
+            chart_name = f"charts/{number:03d}{os.path.splitext(chart)[1] or '.png'}"
+            bundle.write(chart, chart_name)
+            parts.append(f"<p><img src=\"{chart_name}\" alt=\"{html.escape(item['question'])}\"></p>")
+
+        parts.append("</div>")
+        return "\n".join(parts)
+
+
+# Create a singleton instance
+batch_report = BatchReport()
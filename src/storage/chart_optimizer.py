@@ -0,0 +1,159 @@
+import os
+
+from .chart_registry import chart_registry
+
+# Suffixes used for the derived images stored next to the original chart
+DISPLAY_SUFFIX = ".display"
+THUMBNAIL_SUFFIX = ".thumb"
+
+
+class ChartOptimizer:
+    """Produces compact display images and thumbnails for rendered charts.
+
+    The variants are stored side by side with the original chart, e.g.
+    ``charts/20250101_ab12cd34.png`` gets ``charts/20250101_ab12cd34.display.webp``
+    and ``charts/20250101_ab12cd34.thumb.webp``.
+    """
+
+    def __init__(self):
+        """Initialize the chart optimizer."""
+        self.display_format = os.getenv("CHART_DISPLAY_FORMAT", "webp").lower()
+        self.display_max_width = int(os.getenv("CHART_DISPLAY_MAX_WIDTH", "1200"))
+        self.thumbnail_size = int(os.getenv("CHART_THUMBNAIL_SIZE", "240"))
+        self.quality = int(os.getenv("CHART_IMAGE_QUALITY", "80"))
+
+        # Pillow is optional; without it the original chart is used everywhere
+        try:
+            from PIL import Image, features
+            self.pil_available = True
+            self.webp_available = bool(features.check("webp"))
+        except ImportError:
+            self.pil_available = False
+            self.webp_available = False
+            print("Warning: Pillow not installed. Chart thumbnails and compact images are disabled.")
+
+        if self.display_format == "webp" and not self.webp_available:
+            self.display_format = "png"
+
+    @property
+    def extension(self):
+        """File extension used for the derived images."""
+        return ".webp" if self.display_format == "webp" else ".png"
+
+    def variant_paths(self, chart_path):
+        """Get the display and thumbnail paths derived from a chart path.
+
+        Args:
+            chart_path: Path to the original chart image
+
+        Returns:
+            tuple: (display_path, thumbnail_path)
+        """
+        stem = os.path.splitext(chart_path)[0]
+        return (
+            f"{stem}{DISPLAY_SUFFIX}{self.extension}",
+            f"{stem}{THUMBNAIL_SUFFIX}{self.extension}",
+        )
+
+    def is_variant(self, path):
+        """Check whether a file is a derived display image or thumbnail."""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return stem.endswith(DISPLAY_SUFFIX) or stem.endswith(THUMBNAIL_SUFFIX)
+
+    def optimize(self, chart_path):
+        """Create the display image and thumbnail for a chart.
+
+        Existing variants that are newer than the chart are reused.
+
+        Args:
+            chart_path: Path to the original chart image
+
+        Returns:
+            dict: {"display": path, "thumbnail": path}; values fall back to the
+            original chart path when the variant could not be produced
+        """
+        result = {"display": chart_path, "thumbnail": chart_path}
+        if not self.pil_available or not chart_path or not os.path.exists(chart_path):
+            return result
+        if chart_path.lower().endswith(".svg") or self.is_variant(chart_path):
+            return result
+
+        display_path, thumbnail_path = self.variant_paths(chart_path)
+        chart_mtime = os.path.getmtime(chart_path)
+
+        try:
+            from PIL import Image
+
+            if self._is_fresh(display_path, chart_mtime) and self._is_fresh(thumbnail_path, chart_mtime):
+                return {"display": display_path, "thumbnail": thumbnail_path}
+
+            with Image.open(chart_path) as img:
+                img.load()
+                image = img.convert("RGBA") if img.mode in ("P", "LA", "RGBA") else img.convert("RGB")
+
+            display = image
+            if display.width > self.display_max_width:
+                ratio = self.display_max_width / display.width
+                display = display.resize((self.display_max_width, int(display.height * ratio)), Image.LANCZOS)
+            self._save(display, display_path)
+
+            thumbnail = image.copy()
+            thumbnail.thumbnail((self.thumbnail_size, self.thumbnail_size), Image.LANCZOS)
+            self._save(thumbnail, thumbnail_path)
+
+            chart_registry.mark_available(display_path)
+            chart_registry.mark_available(thumbnail_path)
+
+            original_size = os.path.getsize(chart_path)
+            display_size = os.path.getsize(display_path)
+            print(f"Chart optimized: {os.path.basename(chart_path)} {original_size} -> {display_size} bytes "
+                  f"(thumbnail {os.path.getsize(thumbnail_path)} bytes)")
+            return {"display": display_path, "thumbnail": thumbnail_path}
+        except Exception as e:
+            print(f"Error optimizing chart {chart_path}: {str(e)}")
+            return result
+
+    def get_thumbnail(self, chart_path):
+        """Get the thumbnail for a chart, or None if it has not been generated."""
+        if not chart_path:
+            return None
+        thumbnail_path = self.variant_paths(chart_path)[1]
+        return thumbnail_path if os.path.exists(thumbnail_path) else None
+
+    def get_display(self, chart_path):
+        """Get the compact display image for a chart, falling back to the chart itself."""
+        if not chart_path:
+            return chart_path
+        display_path = self.variant_paths(chart_path)[0]
+        return display_path if os.path.exists(display_path) else chart_path
+
+    def remove_variants(self, chart_path):
+        """Delete the derived images of a chart and drop them from the chart registry."""
+        if not chart_path:
+            return
+        chart_registry.forget(chart_path)
+        for path in self.variant_paths(chart_path):
+            chart_registry.forget(path)
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except Exception as e:
+                    print(f"Error removing chart variant {path}: {str(e)}")
+
+    def _is_fresh(self, path, source_mtime):
+        """Check whether a derived image exists and is newer than its source."""
+        return os.path.exists(path) and os.path.getmtime(path) >= source_mtime
+
+    def _save(self, image, path):
+        """Encode an image in the configured compact format."""
+        if self.display_format == "webp":
+            image.save(path, "WEBP", quality=self.quality, method=6)
+        else:
+            # Charts use few colors, so a 256-color palette is visually lossless
+            from PIL import Image
+            quantized = image.convert("RGB").quantize(colors=256, method=Image.FASTOCTREE)
+            quantized.save(path, "PNG", optimize=True)
+
+
+# Create a singleton instance
+chart_optimizer = ChartOptimizer()
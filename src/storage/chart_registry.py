@@ -0,0 +1,312 @@
+import os
+import queue
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+# URL prefix under which registered charts are served
+CHART_ROUTE_PREFIX = "/charts"
+
+# Content-addressed URLs never change, so browsers may cache them for a year
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.svg': 'image/svg+xml',
+    '.webp': 'image/webp',
+    '.bmp': 'image/bmp'
+}
+
+
+class ChartRegistry:
+    """Registers chart images by content hash and serves them by stable URLs.
+
+    A chart file is hashed once; afterwards lookups only ``stat`` the file and
+    compare its mtime/size with the cached entry. Data URIs are memoized the
+    same way, so re-rendering history does not re-read image files.
+
+    The registry also keeps an availability index of chart files. Each chart
+    directory is listed once on first use; after that the index is updated by
+    register()/mark_available() and forget(), so history rendering can check
+    whether a chart still exists without touching the filesystem.
+    """
+
+    def __init__(self, max_data_uris=64):
+        """Initialize the chart registry.
+
+        Args:
+            max_data_uris: Maximum number of memoized data URIs kept in memory
+        """
+        self._lock = threading.Lock()
+        self._by_path = {}  # abs_path -> (mtime_ns, size, chart_id)
+        self._by_id = {}  # chart_id -> abs_path
+        self._data_uris = OrderedDict()  # (abs_path, mtime_ns, size) -> data URI
+        self.max_data_uris = max_data_uris
+        self.routes_mounted = False
+        self._available = set()  # abs paths of chart files known to exist
+        self._indexed_dirs = set()  # directories already listed into _available
+        self._removals = queue.Queue()  # chart files waiting to be deleted
+        self._remover = None
+
+    def register(self, image_path):
+        """Register a chart image and get its content-addressed ID.
+
+        Args:
+            image_path: Path to the chart image
+
+        Returns:
+            str: Chart ID (content hash plus extension), or None if the file is missing
+        """
+        abs_path = os.path.abspath(image_path)
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            with self._lock:
+                self._available.discard(abs_path)
+            return None
+
+        with self._lock:
+            self._available.add(abs_path)
+            cached = self._by_path.get(abs_path)
+            if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                return cached[2]
+
+        # Hash outside the lock; only happens once per file version
+        digest = hashlib.sha1()
+        with open(abs_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        ext = os.path.splitext(abs_path)[1].lower()
+        chart_id = f"{digest.hexdigest()[:20]}{ext}"
+
+        with self._lock:
+            self._by_path[abs_path] = (stat.st_mtime_ns, stat.st_size, chart_id)
+            self._by_id[chart_id] = abs_path
+        return chart_id
+
+    def is_available(self, image_path):
+        """Check whether a chart file exists, using the availability index.
+
+        The first lookup in a directory lists it once; later lookups are pure
+        in-memory checks.
+
+        Args:
+            image_path: Path to the chart image
+
+        Returns:
+            bool: True if the chart file is known to exist
+        """
+        if not image_path:
+            return False
+        abs_path = os.path.abspath(image_path)
+        directory = os.path.dirname(abs_path)
+        with self._lock:
+            if directory in self._indexed_dirs:
+                return abs_path in self._available
+
+        try:
+            with os.scandir(directory) as entries:
+                files = {entry.path for entry in entries if entry.is_file()}
+        except OSError:
+            files = set()
+
+        with self._lock:
+            if directory not in self._indexed_dirs:
+                self._available.update(files)
+                self._indexed_dirs.add(directory)
+            return abs_path in self._available
+
+    def mark_available(self, image_path):
+        """Record that a chart file was just written (e.g. a derived thumbnail).
+
+        Args:
+            image_path: Path to the chart image
+        """
+        with self._lock:
+            self._available.add(os.path.abspath(image_path))
+
+    def rebuild_index(self):
+        """Drop the availability index so directories are listed again on next use.
+
+        Call this after chart files were removed outside the registry.
+        """
+        with self._lock:
+            self._available.clear()
+            self._indexed_dirs.clear()
+
+    def resolve(self, chart_id):
+        """Get the file path registered for a chart ID.
+
+        Args:
+            chart_id: Chart ID returned by register()
+
+        Returns:
+            str: Absolute path to the chart, or None if unknown
+        """
+        with self._lock:
+            return self._by_id.get(chart_id)
+
+    def url_for(self, image_path):
+        """Get a stable URL for a chart image.
+
+        Falls back to Gradio's file route when the chart routes are not mounted.
+
+        Args:
+            image_path: Path to the chart image
+
+        Returns:
+            str: URL of the image, or None if the file is missing
+        """
+        if not self.routes_mounted:
+            if not os.path.exists(image_path):
+                return None
+            return f"/file={os.path.abspath(image_path).replace(chr(92), '/')}"
+
+        chart_id = self.register(image_path)
+        if not chart_id:
+            return None
+        return f"{CHART_ROUTE_PREFIX}/{chart_id}"
+
+    def url_for_id(self, chart_id, image_path):
+        """Get the URL for a chart whose ID was computed earlier, e.g. stored with a record.
+
+        Unlike url_for() this does not touch the file; the ID is trusted and
+        remembered so the chart route can serve it.
+
+        Args:
+            chart_id: Chart ID previously returned by register()
+            image_path: Path the chart was registered from
+
+        Returns:
+            str: URL of the image
+        """
+        abs_path = os.path.abspath(image_path)
+        if not self.routes_mounted:
+            return f"/file={abs_path.replace(chr(92), '/')}"
+
+        with self._lock:
+            self._by_id.setdefault(chart_id, abs_path)
+        return f"{CHART_ROUTE_PREFIX}/{chart_id}"
+
+    def data_uri(self, image_path):
+        """Get a base64 data URI for a chart image, memoized by mtime and size.
+
+        Args:
+            image_path: Path to the chart image
+
+        Returns:
+            str: Data URI, or None if the file is missing
+        """
+        abs_path = os.path.abspath(image_path)
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            return None
+
+        key = (abs_path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._data_uris.get(key)
+            if cached is not None:
+                self._data_uris.move_to_end(key)
+                return cached
+
+        with open(abs_path, 'rb') as f:
+            encoded = base64.b64encode(f.read()).decode('utf-8')
+        mime_type = MIME_TYPES.get(os.path.splitext(abs_path)[1].lower(), 'image/png')
+        data_uri = f"data:{mime_type};base64,{encoded}"
+
+        with self._lock:
+            self._data_uris[key] = data_uri
+            while len(self._data_uris) > self.max_data_uris:
+                self._data_uris.popitem(last=False)
+        return data_uri
+
+    def forget(self, image_path):
+        """Drop all cached entries for a chart image and mark it unavailable (e.g. after it was deleted).
+
+        Args:
+            image_path: Path to the chart image
+        """
+        abs_path = os.path.abspath(image_path)
+        with self._lock:
+            self._available.discard(abs_path)
+            cached = self._by_path.pop(abs_path, None)
+            if cached and self._by_id.get(cached[2]) == abs_path:
+                del self._by_id[cached[2]]
+            for key in [k for k in self._data_uris if k[0] == abs_path]:
+                del self._data_uris[key]
+
+    def remove_async(self, image_paths):
+        """Forget chart files now and delete them on a background thread.
+
+        The charts stop being served and show as unavailable immediately, so
+        callers such as bulk history deletion do not wait on file I/O.
+
+        Args:
+            image_paths: Paths of the chart images (and derived images) to delete
+        """
+        paths = [path for path in image_paths if path]
+        if not paths:
+            return
+        for path in paths:
+            self.forget(path)
+
+        with self._lock:
+            if self._remover is None:
+                self._remover = threading.Thread(target=self._remove_files, name="chart-remover", daemon=True)
+                self._remover.start()
+        for path in paths:
+            self._removals.put(path)
+
+    def wait_for_removals(self):
+        """Block until all queued chart files have been deleted."""
+        self._removals.join()
+
+    def _remove_files(self):
+        """Background loop deleting queued chart files."""
+        while True:
+            path = self._removals.get()
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error removing chart file {path}: {str(e)}")
+            finally:
+                self._removals.task_done()
+
+    def mount(self, app):
+        """Add the chart delivery route to the FastAPI app behind Gradio.
+
+        Args:
+            app: FastAPI application returned by ``Blocks.launch``
+        """
+        from fastapi import HTTPException, Request
+        from fastapi.responses import FileResponse, Response
+
+        registry = self
+
+        async def serve_chart(chart_id: str, request: Request):
+            path = registry.resolve(chart_id)
+            if not path or not os.path.exists(path):
+                raise HTTPException(status_code=404, detail="Chart not found")
+
+            etag = f'"{os.path.splitext(chart_id)[0]}"'
+            headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag}
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers=headers)
+
+            media_type = MIME_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+            return FileResponse(path, media_type=media_type, headers=headers)
+
+        app.add_api_route(f"{CHART_ROUTE_PREFIX}/{{chart_id}}", serve_chart, methods=["GET"])
+        self.routes_mounted = True
+        print(f"Chart delivery route mounted at {CHART_ROUTE_PREFIX}/<id>")
+
+
+# Create a singleton instance
+chart_registry = ChartRegistry()
@@ -3,6 +3,8 @@ import uuid
 from datetime import datetime
 
 from src.config.settings import settings
+from src.storage.chart_optimizer import chart_optimizer
+from src.utils.request_timing import timed_stage
 
 class ChartStorage:
     """Handles chart image storage in both local filesystem and OSS."""
@@ -55,10 +57,15 @@ class ChartStorage:
         # Convert to absolute path for display
         local_display_path = os.path.abspath(local_path).replace('\\', '/')
         
-        # Upload to OSS if enabled and available
+        # Produce the compact display image and thumbnail next to the chart
+        variants = chart_optimizer.optimize(local_path)
+        
+        # Upload to OSS if enabled and available (the compact image is uploaded when present)
         oss_url = None
         if self.oss_enabled and self.oss_available:
-            oss_url = self._upload_to_oss(local_path, filename)
+            upload_path = variants["display"]
+            with timed_stage("upload"):
+                oss_url = self._upload_to_oss(upload_path, os.path.basename(upload_path))
         
         return local_display_path, oss_url
     
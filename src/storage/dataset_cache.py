@@ -0,0 +1,169 @@
+import os
+import glob
+import uuid
+import hashlib
+import threading
+
+import pandas as pd
+
+# pyarrow is listed in requirements.txt; if it is missing, datasets are cached as pickles (no memory mapping)
+try:
+    import pyarrow.feather as feather
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+# Directory holding cached datasets
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", "data/datasets")
+# Total size limit of the cache; least recently used datasets are evicted first
+DATASET_CACHE_MAX_MB = int(os.getenv("DATASET_CACHE_MAX_MB", "2048"))
+
+_EXTENSIONS = (".arrow", ".pkl")
+
+
+class DatasetCache:
+    """Keeps uploaded dataframes as content-addressed columnar files.
+
+    Datasets are written once as uncompressed Arrow IPC (Feather v2) files so a
+    resumed session can memory-map them instead of re-parsing the original
+    CSV/Excel upload. Identical uploads share one file. Loading a dataset
+    touches its mtime, which is the recency used for size-based eviction.
+    """
+
+    def __init__(self, cache_dir=DATASET_CACHE_DIR, max_bytes=DATASET_CACHE_MAX_MB * 1024 * 1024):
+        """Initialize the dataset cache.
+
+        Args:
+            cache_dir: Directory holding cached datasets
+            max_bytes: Total size limit of the cache, 0 disables eviction
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._warned = False
+
+    @staticmethod
+    def fingerprint(df):
+        """Content hash of a dataframe (values, index, column names and dtypes).
+
+        Args:
+            df: Dataframe to hash
+
+        Returns:
+            str: Hex digest, or a random ID if the data cannot be hashed
+        """
+        try:
+            digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        except TypeError:
+            # Unhashable cell values (lists, dicts); such a dataset is cached without de-duplication
+            return uuid.uuid4().hex
+        digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode("utf-8"))
+        return digest.hexdigest()[:24]
+
+    def _path(self, dataset_id):
+        """Existing file of a dataset, or None"""
+        for ext in _EXTENSIONS:
+            path = os.path.join(self.cache_dir, dataset_id + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def exists(self, dataset_id):
+        """Whether a dataset is still in the cache"""
+        return bool(dataset_id) and self._path(dataset_id) is not None
+
+    def save(self, df):
+        """Cache a dataframe.
+
+        Args:
+            df: Dataframe to cache
+
+        Returns:
+            str: Dataset ID, or None if the dataframe could not be written
+        """
+        dataset_id = self.fingerprint(df)
+        if self._path(dataset_id):
+            return dataset_id
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = os.path.join(self.cache_dir, f".{dataset_id}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            path = None
+            if ARROW_AVAILABLE:
+                try:
+                    # Uncompressed so the file can be memory-mapped on load
+                    feather.write_feather(df, tmp_path, compression="uncompressed")
+                    path = os.path.join(self.cache_dir, dataset_id + ".arrow")
+                except Exception as e:
+                    # Mixed-type object columns cannot be converted to Arrow
+                    print(f"Dataset {dataset_id} cannot be stored as Arrow, using pickle: {str(e)}")
+            elif not self._warned:
+                self._warned = True
+                print("Warning: pyarrow not installed (see requirements.txt). Cached datasets are stored as pickles and cannot be memory-mapped.")
+            if path is None:
+                df.to_pickle(tmp_path)
+                path = os.path.join(self.cache_dir, dataset_id + ".pkl")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error caching dataset {dataset_id}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+        print(f"Dataset cached: {os.path.basename(path)} ({os.path.getsize(path)} bytes)")
+        self._evict(keep=path)
+        return dataset_id
+
+    def load(self, dataset_id):
+        """Load a cached dataset.
+
+        Args:
+            dataset_id: ID returned by save()
+
+        Returns:
+            pandas.DataFrame: The dataset, or None if it is no longer cached
+        """
+        path = self._path(dataset_id) if dataset_id else None
+        if path is None:
+            return None
+        try:
+            if path.endswith(".arrow"):
+                df = feather.read_table(path, memory_map=True).to_pandas()
+            else:
+                df = pd.read_pickle(path)
+        except Exception as e:
+            print(f"Error loading cached dataset {dataset_id}: {str(e)}")
+            return None
+        # Mark as recently used
+        os.utime(path)
+        return df
+
+    def _evict(self, keep=None):
+        """Remove least recently used datasets until the cache fits its size limit"""
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            files = []
+            for ext in _EXTENSIONS:
+                for path in glob.glob(os.path.join(self.cache_dir, "*" + ext)):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                    print(f"Evicted cached dataset: {os.path.basename(path)}")
+                except OSError as e:
+                    print(f"Error evicting cached dataset {path}: {str(e)}")
+
+
+# Create a singleton instance
+dataset_cache = DatasetCache()
@@ -2,6 +2,7 @@ import os
 import gradio as gr
 from ..utils.language_utils import LanguageUtils
 from ..utils.data_loader import DataLoader
+from ..utils.batch_runner import BATCH_MAX_WORKERS
 
 # 尝试导入pandas，如果失败则设置为None
 try:
@@ -14,6 +15,28 @@ ROBOT_AVATAR = "avatar/robot.jpg"
 if not os.path.exists(ROBOT_AVATAR):
     ROBOT_AVATAR = "🤖"
 
+# 历史记录表格滚动到底部时自动点击“加载更多”按钮，实现无限滚动
+HISTORY_INFINITE_SCROLL_JS = """
+() => {
+    let loading = false;
+    document.addEventListener('scroll', (event) => {
+        const target = event.target;
+        if (loading || !target.closest || !target.closest('.history-table')) {
+            return;
+        }
+        if (target.scrollTop + target.clientHeight < target.scrollHeight - 40) {
+            return;
+        }
+        const button = document.getElementById('history-load-more');
+        if (button && button.offsetParent !== null) {
+            loading = true;
+            button.click();
+            setTimeout(() => { loading = false; }, 1000);
+        }
+    }, true);
+}
+"""
+
 class AppUI:
     """UI应用类，负责Gradio界面的创建和交互"""
     
@@ -36,6 +59,7 @@ class AppUI:
         """创建Gradio界面"""
         with gr.Blocks(
             title=self.get_text("title"),
+            js=HISTORY_INFINITE_SCROLL_JS,
             css="""
             /* 全局页面滚动样式 */
             html, body {
@@ -667,6 +691,15 @@ class AppUI:
                             label=self.get_text("model_status"), 
                             value=self.get_text("model_will_initialize", self.controller.llm_type)
                         )
+                        chart_mode_choice = gr.Radio(
+                            label=self.get_text("chart_output_mode"),
+                            choices=[
+                                (self.get_text("chart_mode_image"), "image"),
+                                (self.get_text("chart_mode_spec"), "spec")
+                            ],
+                            value=self.controller.chart_output_mode,
+                            interactive=True
+                        )
                     
                     with gr.Group():
                         data_upload_header = gr.Markdown(self.get_text("data_upload"))
@@ -707,6 +740,15 @@ class AppUI:
                                 show_share_button=False,
                                 interactive=False
                             )
+                            # 交互式图表区域（浏览器端渲染声明式图表规格）
+                            chart_plot = gr.Plot(
+                                label=self.get_text("interactive_chart"),
+                                show_label=False
+                            )
+                            export_png_btn = gr.Button(
+                                value=self.get_text("export_png_button"),
+                                size="sm"
+                            )
                             chart_info = gr.Textbox(
                                 label=self.get_text("chart_info"),
                                 value=self.get_text("no_chart"),
@@ -723,6 +765,17 @@ class AppUI:
                         )
                         ask_button = gr.Button(value=self.get_text("ask_button"), scale=1)
                         clear_button = gr.Button(value=self.get_text("clear_button"), scale=1)
+                    
+                    # 结果数据区：大型表格结果按页从数据库读取
+                    with gr.Accordion(self.get_text("result_data"), open=False) as result_accordion:
+                        result_table = gr.Dataframe(
+                            interactive=False,
+                            wrap=True
+                        )
+                        with gr.Row():
+                            result_prev_btn = gr.Button(value=self.get_text("prev_page"), size="sm", scale=1)
+                            result_page_info = gr.Markdown(self.get_text("no_result_table"))
+                            result_next_btn = gr.Button(value=self.get_text("next_page"), size="sm", scale=1)
             
             # 移到提问框下方：会话历史和对话记录
             with gr.Row():
@@ -781,6 +834,7 @@ class AppUI:
                                         self.get_text("delete_action")
                                     ],
                                     col_count=(6, "fixed"),
+                                    datatype=["str", "str", "str", "markdown", "str", "str"],  # 回答列显示图表缩略图
                                     interactive=True,
                                     wrap=False,
                                     column_widths=["16%", "16%", "22%", "25%", "11%", "10%"],
@@ -788,14 +842,140 @@ class AppUI:
                                     row_count=5
                                 )
                                 
+                                # 加载下一页历史记录（表格滚动到底部时自动点击）
+                                load_more_btn = gr.Button(
+                                    self.get_text("load_more_history"),
+                                    variant="secondary",
+                                    size="sm",
+                                    elem_id="history-load-more",
+                                    elem_classes="control-button",
+                                    visible=False
+                                )
+                                
                                 # 存储当前选中的行信息（隐藏元素）
                                 selected_row_info = gr.Textbox(visible=False, value="")
                                 
                                 # 存储当前搜索关键词（隐藏元素）
                                 current_search_keywords = gr.Textbox(visible=False, value="")
+                                
+                                # 本会话表格的分页状态：已加载的记录、对应的记录ID和下一页游标
+                                history_state = gr.State(self.controller.new_history_state())
+                                
+                                # 本会话最近一次问题的提交时间和问答保存的记录ID
+                                question_submitted_at = gr.State(None)
+                                last_record_id = gr.State(None)
+                                
+                                # 本会话结果数据区显示的表格结果ID和页码
+                                result_state = gr.State(self.controller.new_result_state())
+                                
+                                # 对话记录的批量导出和导入
+                                with gr.Accordion(self.get_text("history_transfer"), open=False) as transfer_accordion:
+                                    with gr.Row():
+                                        export_format = gr.Radio(
+                                            choices=[("JSONL", "jsonl"), ("Parquet", "parquet")],
+                                            value="jsonl",
+                                            label=self.get_text("export_format"),
+                                            scale=2
+                                        )
+                                        export_history_btn = gr.Button(
+                                            self.get_text("export_history_button"),
+                                            variant="secondary",
+                                            size="sm",
+                                            elem_classes="control-button",
+                                            scale=1
+                                        )
+                                    export_file = gr.File(
+                                        label=self.get_text("export_bundle_file"),
+                                        interactive=False
+                                    )
+                                    with gr.Row():
+                                        import_file = gr.File(
+                                            label=self.get_text("import_bundle_file"),
+                                            file_count="single",
+                                            file_types=[".zip"],
+                                            type="filepath",
+                                            scale=2
+                                        )
+                                        import_history_btn = gr.Button(
+                                            self.get_text("import_history_button"),
+                                            variant="secondary",
+                                            size="sm",
+                                            elem_classes="control-button",
+                                            scale=1
+                                        )
+                                    transfer_status = gr.Markdown("")
+                        
+                        # 按提供方和模型统计的请求耗时分位数
+                        with gr.TabItem(label=self.get_text("request_stats")) as stats_tab:
+                            with gr.Row():
+                                stats_period = gr.Radio(
+                                    choices=[
+                                        (self.get_text("stats_period_24h"), "24h"),
+                                        (self.get_text("stats_period_7d"), "7d"),
+                                        (self.get_text("stats_period_30d"), "30d")
+                                    ],
+                                    value="7d",
+                                    label=self.get_text("stats_period"),
+                                    scale=3
+                                )
+                                refresh_stats_btn = gr.Button(
+                                    self.get_text("refresh_stats"),
+                                    variant="secondary",
+                                    size="sm",
+                                    elem_classes="control-button",
+                                    scale=1
+                                )
+                            request_stats_display = gr.Dataframe(
+                                headers=self.controller.get_request_stats_headers(),
+                                interactive=False,
+                                wrap=True
+                            )
+                        
+                        # 批量运行问题清单，完成后生成汇总报告
+                        with gr.TabItem(label=self.get_text("batch_tab")) as batch_tab:
+                            batch_questions = gr.Textbox(
+                                label=self.get_text("batch_questions_input"),
+                                placeholder=self.get_text("batch_questions_placeholder"),
+                                lines=6
+                            )
+                            with gr.Row():
+                                batch_questions_file = gr.File(
+                                    label=self.get_text("batch_questions_file"),
+                                    file_count="single",
+                                    file_types=[".txt", ".csv"],
+                                    type="filepath",
+                                    scale=2
+                                )
+                                with gr.Column(scale=1):
+                                    batch_parallelism = gr.Slider(
+                                        minimum=1,
+                                        maximum=max(8, BATCH_MAX_WORKERS),
+                                        step=1,
+                                        value=BATCH_MAX_WORKERS,
+                                        label=self.get_text("batch_parallelism")
+                                    )
+                                    batch_run_btn = gr.Button(
+                                        self.get_text("batch_run_button"),
+                                        variant="primary",
+                                        size="sm",
+                                        elem_classes="control-button"
+                                    )
+                            batch_status = gr.Markdown("")
+                            batch_progress_display = gr.Dataframe(
+                                headers=self.controller.get_batch_headers(),
+                                interactive=False,
+                                wrap=True
+                            )
+                            batch_report_file = gr.File(
+                                label=self.get_text("batch_report_file"),
+                                interactive=False
+                            )
             
             # 初始化对话记录显示 - 确保使用正确的语言
-            chat_history_display.value = self.controller.refresh_current_history()
+            initial_history_state = self.controller.new_history_state()
+            chat_history_display.value = self.controller.refresh_current_history(initial_history_state)
+            history_state.value = initial_history_state
+            load_more_btn.visible = self.controller.has_more_history(initial_history_state)
             
             # 事件处理
             
@@ -866,26 +1046,71 @@ class AppUI:
                             self.get_text("history_answer"),
                             self.get_text("load_record_action"),
                             self.get_text("delete_action")
-                        ],
-                        value=self.controller.refresh_current_history()
-                    ),                                                  # chat_history_display
+                        ]
+                    ),                                                  # chat_history_display - 内容随后由smart_refresh按新语言重新加载
                     gr.update(placeholder=self.get_text("search_placeholder"), interactive=True, container=False),   # search_input
                     gr.update(value=self.get_text("search_button")),   # search_btn
                     gr.update(value=self.get_text("refresh_history")),   # refresh_history_btn
                     gr.update(value=self.get_text("delete_all_button")),   # delete_all_btn
                     gr.update(label=self.get_text("chat_history")),        # TabItem - 对话记录
-                    gr.update()   # current_search_keywords - 保持不变
+                    gr.update(),  # current_search_keywords - 保持不变
+                    gr.update(
+                        label=self.get_text("chart_output_mode"),
+                        choices=[
+                            (self.get_text("chart_mode_image"), "image"),
+                            (self.get_text("chart_mode_spec"), "spec")
+                        ]
+                    ),            # chart_mode_choice
+                    gr.update(value=self.get_text("export_png_button")),  # export_png_btn
+                    gr.update(value=self.get_text("load_more_history")),  # load_more_btn
+                    gr.update(label=self.get_text("result_data")),        # result_accordion
+                    gr.update(value=self.get_text("prev_page")),          # result_prev_btn
+                    gr.update(value=self.get_text("next_page")),          # result_next_btn
+                    gr.update(),  # result_page_info - 随后按新语言重新生成
+                    gr.update(label=self.get_text("request_stats")),      # stats_tab
+                    gr.update(
+                        label=self.get_text("stats_period"),
+                        choices=[
+                            (self.get_text("stats_period_24h"), "24h"),
+                            (self.get_text("stats_period_7d"), "7d"),
+                            (self.get_text("stats_period_30d"), "30d")
+                        ],
+                        value="7d"
+                    ),                                                  # stats_period
+                    gr.update(value=self.get_text("refresh_stats")),     # refresh_stats_btn
+                    gr.update(value=self.controller.get_request_stats("7d")),  # request_stats_display
+                    gr.update(label=self.get_text("history_transfer")),   # transfer_accordion
+                    gr.update(label=self.get_text("export_format")),      # export_format
+                    gr.update(value=self.get_text("export_history_button")),  # export_history_btn
+                    gr.update(label=self.get_text("export_bundle_file")),     # export_file
+                    gr.update(label=self.get_text("import_bundle_file")),     # import_file
+                    gr.update(value=self.get_text("import_history_button")),  # import_history_btn
+                    gr.update(label=self.get_text("batch_tab")),              # batch_tab
+                    gr.update(
+                        label=self.get_text("batch_questions_input"),
+                        placeholder=self.get_text("batch_questions_placeholder")
+                    ),                                                  # batch_questions
+                    gr.update(label=self.get_text("batch_questions_file")),   # batch_questions_file
+                    gr.update(label=self.get_text("batch_parallelism")),      # batch_parallelism
+                    gr.update(value=self.get_text("batch_run_button")),       # batch_run_btn
+                    gr.update(headers=self.controller.get_batch_headers()),   # batch_progress_display
+                    gr.update(label=self.get_text("batch_report_file"))       # batch_report_file
                 )
             
             # 智能刷新功能：根据当前搜索状态决定显示内容
-            def smart_refresh(search_keywords):
-                """根据当前搜索状态智能刷新表格"""
-                if search_keywords and search_keywords.strip():
-                    # 如果当前有搜索关键词，重新执行搜索
-                    return self.controller.search_history(search_keywords)
-                else:
-                    # 否则显示所有记录
-                    return self.controller.refresh_current_history()
+            def smart_refresh(search_keywords, state):
+                """根据当前搜索状态智能刷新表格，保留已加载的页数（短时间内的重复刷新会被合并）"""
+                rows = self.controller.reload_history(search_keywords, state)
+                return (gr.update() if rows is None else rows), state
+            
+            # 问答完成后把新记录插入表格顶部，不重新查询整个表格
+            def append_new_record(search_keywords, state, record_id, chatbot):
+                """增量更新对话记录表格；记录写入失败时不插入，在回答末尾提示"""
+                failed_chatbot = self.controller.confirm_record_saved(chatbot, record_id)
+                if failed_chatbot is not None:
+                    return gr.update(), state, failed_chatbot
+                rows = self.controller.append_history_record(search_keywords, state, record_id)
+                return (gr.update() if rows is None else rows), state, gr.update()
             
             # 在事件处理程序中注册新文件组件的上传事件
             def register_new_upload_event(file_input):
@@ -901,10 +1126,10 @@ class AppUI:
                         inputs=[],
                         outputs=[chatbot, chart_display, chart_info]
                     ).then(
-                        # 刷新历史记录显示
-                        fn=self.controller.refresh_current_history,
-                        inputs=[],
-                        outputs=[chat_history_display]
+                        # 刷新历史记录显示，清空搜索状态
+                        fn=load_all_records,
+                        inputs=[history_state],
+                        outputs=[chat_history_display, current_search_keywords, history_state]
                     )
                 return None
             
@@ -939,7 +1164,31 @@ class AppUI:
                     refresh_history_btn,
                     delete_all_btn,
                     chat_tab,
-                    current_search_keywords
+                    current_search_keywords,
+                    chart_mode_choice,
+                    export_png_btn,
+                    load_more_btn,
+                    result_accordion,
+                    result_prev_btn,
+                    result_next_btn,
+                    result_page_info,
+                    stats_tab,
+                    stats_period,
+                    refresh_stats_btn,
+                    request_stats_display,
+                    transfer_accordion,
+                    export_format,
+                    export_history_btn,
+                    export_file,
+                    import_file,
+                    import_history_btn,
+                    batch_tab,
+                    batch_questions,
+                    batch_questions_file,
+                    batch_parallelism,
+                    batch_run_btn,
+                    batch_progress_display,
+                    batch_report_file
                 ]
             ).then(
                 fn=register_new_upload_event,
@@ -948,8 +1197,13 @@ class AppUI:
             ).then(
                 # 语言切换后根据当前搜索状态智能刷新历史数据
                 fn=smart_refresh,
-                inputs=[current_search_keywords],
-                outputs=[chat_history_display]
+                inputs=[current_search_keywords, history_state],
+                outputs=[chat_history_display, history_state]
+            ).then(
+                # 按新语言更新结果数据区的分页信息
+                fn=self.controller.get_result_page,
+                inputs=[result_state],
+                outputs=[result_table, result_page_info, result_state]
             )
             
             # 自动处理模型切换
@@ -959,6 +1213,20 @@ class AppUI:
                 outputs=[model_status]
             )
             
+            # 切换图表输出模式
+            chart_mode_choice.change(
+                fn=self.controller.set_chart_output_mode,
+                inputs=[chart_mode_choice],
+                outputs=[]
+            )
+            
+            # 按需将交互式图表导出为PNG
+            export_png_btn.click(
+                fn=self.controller.export_chart_png,
+                inputs=[],
+                outputs=[chart_display, chart_info]
+            )
+            
             # 刷新后重置选择状态并更新表头的函数
             def reset_selection_and_update_headers():
                 """刷新后重置选择状态并更新表头语言"""
@@ -976,16 +1244,16 @@ class AppUI:
                 )
 
             # 加载所有记录功能
-            def load_all_records():
+            def load_all_records(state):
                 """加载所有记录并清空搜索状态"""
-                all_records = self.controller.refresh_current_history()
-                return all_records, ""  # 清空搜索关键词
+                all_records = self.controller.refresh_current_history(state)
+                return all_records, "", state  # 清空搜索关键词
             
             # 刷新对话记录
             refresh_history_btn.click(
                 fn=load_all_records,
-                inputs=[],
-                outputs=[chat_history_display, current_search_keywords]
+                inputs=[history_state],
+                outputs=[chat_history_display, current_search_keywords, history_state]
             ).then(
                 # 刷新后重置选择状态并更新表头
                 fn=reset_selection_and_update_headers,
@@ -994,7 +1262,7 @@ class AppUI:
             )
             
             # 优化行选择处理
-            def handle_table_selection(current_keywords, evt: gr.SelectData):
+            def handle_table_selection(current_keywords, state, result_state, evt: gr.SelectData):
                 """处理表格行选择事件"""
                 try:
                     if evt is None:
@@ -1006,35 +1274,33 @@ class AppUI:
                     row_index = evt.index[0] if isinstance(evt.index, (list, tuple)) else evt.index
                     col_index = evt.index[1] if isinstance(evt.index, (list, tuple)) and len(evt.index) > 1 else None
                     
-                    # 根据当前搜索状态获取对应的历史记录
-                    if current_keywords and current_keywords.strip():
-                        # 如果有搜索关键词，获取搜索结果
-                        current_history = self.controller.search_history(current_keywords)
-                        print(f"使用搜索结果，关键词: {current_keywords}")
-                    else:
-                        # 否则获取所有记录
-                        current_history = self.controller.refresh_current_history()
-                        print(f"使用所有记录")
+                    # 使用本会话表格中当前已加载的记录（包括通过“加载更多”追加的页）
+                    current_history = state["rows"]
                     
-                    if current_history and 0 <= row_index < len(current_history):
+                    # 按事件携带的行内容确认点击的记录，表格已过期时不按行索引猜测
+                    row_value = getattr(evt, "row_value", None)
+                    resolved_index = self.controller.resolve_history_row(state, row_index, row_value)
+                    if resolved_index is None and row_value is not None and current_history:
+                        print(f"点击的行与已加载的记录不一致: 行索引 {row_index}")
+                        return "", gr.update(visible=False), None, self.get_text("record_changed"), []
+                    row_index = resolved_index if resolved_index is not None else -1
+                    
+                    # 每行对应的记录ID与表格行一起保存，按主键查找记录
+                    record_id = self.controller.get_history_record_id(state, row_index)
+                    
+                    if current_history and record_id is not None and 0 <= row_index < len(current_history):
                         # 获取选中行的数据
                         selected_row = current_history[row_index]
+                        time_info = selected_row[0]  # 第1列：时间
+                        question_info = selected_row[2]  # 第3列：问题
                         
                         # 检查是否点击的是第5列（点击加载数据列）
                         if col_index == 4 and len(selected_row) > 4 and selected_row[4]:
-                            # 通过行数据获取时间和问题信息来查找对应的数据库记录
-                            time_info = selected_row[0]  # 第1列：时间
-                            question_info = selected_row[2]  # 第3列：问题
-                            
-                            # 调用控制器方法通过时间和问题查找记录
                             try:
-                                # 构建查询信息
-                                time_question_info = f"{time_info}|{question_info}"
+                                print(f"🔍 点击加载数据: 行索引 {row_index}, 记录ID: {record_id}, 问题: {question_info[:50]}...")
                                 
-                                print(f"🔍 点击加载数据: 行索引 {row_index}, 时间: {time_info}, 问题: {question_info[:50]}...")
-                                
-                                # 通过时间和问题信息获取记录信息
-                                record_info = self.controller.get_record_by_time_question(time_question_info)
+                                # 通过记录ID获取记录信息
+                                record_info = self.controller.get_record_info(record_id)
                                 
                                 if record_info:
                                     session_id = record_info.get('session_id')
@@ -1042,7 +1308,9 @@ class AppUI:
                                     has_chart = record_info.get('has_chart', 0)
                                     
                                     # 调用控制器的加载记录方法
-                                    new_chatbot, status, chart_file, chart_info = self.controller.load_history_record(session_id, [], record_id)
+                                    new_chatbot, status, chart_file, chart_info = self.controller.load_history_record(
+                                        session_id, [], record_id, result_state
+                                    )
                                     
                                     print(f"✅ 点击加载数据: 会话ID {session_id}, 记录ID {record_id}, 包含图表: {bool(has_chart)}, 状态: {status}")
                                     
@@ -1117,40 +1385,26 @@ class AppUI:
                         
                         # 检查是否点击的是第6列（删除操作列）
                         elif col_index == 5 and len(selected_row) > 5 and selected_row[5]:
-                            # 通过行数据获取时间和问题信息来查找对应的数据库记录
-                            time_info = selected_row[0]  # 第1列：时间
-                            question_info = selected_row[2]  # 第3列：问题
-                            
-                            # 调用控制器方法通过时间和问题查找记录
                             try:
-                                # 构建查询信息
-                                time_question_info = f"{time_info}|{question_info}"
-                                
-                                # 删除记录
-                                status = self.delete_selected_record(time_question_info)
+                                # 删除记录，先确认数据库中的记录就是该行显示的记录
+                                success, status = self.delete_selected_record(record_id, state, question_info)
                                 
-                                print(f"✅ 删除记录: {time_question_info}, 状态: {status}")
+                                print(f"{'✅' if success else '❌'} 删除记录: {record_id}, 状态: {status}")
                                 
                                 # 返回删除结果，不修改聊天记录和图表
-                                return "", gr.update(visible=False), None, None, []
+                                return "", gr.update(visible=False), None, None if success else status, []
                                 
                             except Exception as e:
                                 print(f"❌ 删除记录失败: {str(e)}")
                                 return "", gr.update(visible=False), None, f"删除记录失败: {str(e)}", []
                         else:
-                            # 普通行选择逻辑
-                            # 构建行标识信息：时间|问题
-                            time_info = selected_row[0]  # 第1列：时间
-                            question_info = selected_row[2]  # 第3列：问题
-                            row_info = f"{time_info}|{question_info}"
-                            
-                            # 构建状态显示文本
+                            # 普通行选择逻辑：记录选中行的记录ID
                             status_text = f"已选择: {time_info[:10]} - {question_info[:20]}..."
                             
-                            print(f"选中行 {row_index}: {row_info}")
+                            print(f"选中行 {row_index}: 记录ID {record_id}")
                             
                             return (
-                                row_info,
+                                str(record_id),
                                 gr.update(value=status_text, visible=True),
                                 None,  # 不修改图表显示
                                 None,  # 不修改图表信息
@@ -1167,40 +1421,134 @@ class AppUI:
             # 选择对话记录行
             chat_history_display.select(
                 fn=handle_table_selection,
-                inputs=[current_search_keywords],
+                inputs=[current_search_keywords, history_state, result_state],
                 outputs=[selected_row_info, selection_status, chart_display, chart_info, chatbot]
+            ).then(
+                # 加载记录后显示其交互式图表（如果有）
+                fn=self.controller.get_current_chart_plot,
+                inputs=[],
+                outputs=[chart_plot]
+            ).then(
+                # 显示记录的表格结果（如果有）
+                fn=self.controller.get_result_page,
+                inputs=[result_state],
+                outputs=[result_table, result_page_info, result_state]
             ).then(
                 # 根据当前搜索状态智能刷新表格
                 fn=smart_refresh,
-                inputs=[current_search_keywords],
-                outputs=[chat_history_display]
+                inputs=[current_search_keywords, history_state],
+                outputs=[chat_history_display, history_state]
+            )
+            
+            # 性能统计：切换到统计页、修改统计范围或点击刷新时重新计算
+            stats_tab.select(
+                fn=self.controller.get_request_stats,
+                inputs=[stats_period],
+                outputs=[request_stats_display]
+            )
+            stats_period.change(
+                fn=self.controller.get_request_stats,
+                inputs=[stats_period],
+                outputs=[request_stats_display]
+            )
+            refresh_stats_btn.click(
+                fn=self.controller.get_request_stats,
+                inputs=[stats_period],
+                outputs=[request_stats_display]
+            )
+            
+            # 导出对话记录：逐批显示进度，完成后提供下载
+            export_history_btn.click(
+                fn=self.controller.export_history,
+                inputs=[export_format],
+                outputs=[transfer_status, export_file]
+            )
+            
+            # 导入对话记录：逐批显示进度，完成后刷新对话记录显示
+            import_history_btn.click(
+                fn=self.controller.import_history,
+                inputs=[import_file],
+                outputs=[transfer_status]
+            ).then(
+                fn=load_all_records,
+                inputs=[history_state],
+                outputs=[chat_history_display, current_search_keywords, history_state]
+            )
+            
+            # 批量运行：逐个显示完成进度，完成后提供汇总报告下载并刷新对话记录显示
+            batch_run_btn.click(
+                fn=lambda: gr.update(interactive=False),
+                inputs=None,
+                outputs=[batch_run_btn]
+            ).then(
+                fn=self.controller.run_batch,
+                inputs=[batch_questions, batch_questions_file, batch_parallelism],
+                outputs=[batch_status, batch_progress_display, batch_report_file]
+            ).then(
+                fn=lambda: gr.update(interactive=True),
+                inputs=None,
+                outputs=[batch_run_btn]
+            ).then(
+                fn=load_all_records,
+                inputs=[history_state],
+                outputs=[chat_history_display, current_search_keywords, history_state]
+            )
+            
+            # 结果数据翻页
+            result_prev_btn.click(
+                fn=self.controller.prev_result_page,
+                inputs=[result_state],
+                outputs=[result_table, result_page_info, result_state]
+            )
+            result_next_btn.click(
+                fn=self.controller.next_result_page,
+                inputs=[result_state],
+                outputs=[result_table, result_page_info, result_state]
+            )
+            
+            # 加载下一页历史记录
+            def load_more_records(search_keywords, state):
+                """加载下一页历史记录"""
+                return self.controller.load_more_history(search_keywords, state), state
+            
+            load_more_btn.click(
+                fn=load_more_records,
+                inputs=[current_search_keywords, history_state],
+                outputs=[chat_history_display, history_state]
+            )
+            
+            # 表格内容变化后（刷新、搜索、翻页）更新“加载更多”按钮的显示状态
+            chat_history_display.change(
+                fn=lambda state: gr.update(visible=self.controller.has_more_history(state)),
+                inputs=[history_state],
+                outputs=[load_more_btn]
             )
             
             # 搜索功能
-            def search_history(search_keywords):
+            def search_history(search_keywords, state):
                 """搜索历史记录"""
-                results = self.controller.search_history(search_keywords)
-                return results, search_keywords  # 同时返回搜索结果和关键词
+                results = self.controller.search_history(search_keywords, state)
+                return results, search_keywords, state  # 同时返回搜索结果和关键词
             
             # 搜索按钮点击事件
             search_btn.click(
                 fn=search_history,
-                inputs=[search_input],
-                outputs=[chat_history_display, current_search_keywords]
+                inputs=[search_input, history_state],
+                outputs=[chat_history_display, current_search_keywords, history_state]
             )
             
             # 搜索输入框回车事件
             search_input.submit(
                 fn=search_history,
-                inputs=[search_input],
-                outputs=[chat_history_display, current_search_keywords]
+                inputs=[search_input, history_state],
+                outputs=[chat_history_display, current_search_keywords, history_state]
             )
             
             # 聊天交互
             ask_button.click(
                 fn=self.controller.ask_question,  # 先只显示用户问题
                 inputs=[question_input, chatbot],
-                outputs=[chatbot, chart_display, chart_info]
+                outputs=[chatbot, chart_display, chart_info, question_submitted_at]
             ).then(
                 # 禁用按钮
                 fn=lambda: (gr.update(interactive=False), gr.update(interactive=False)),
@@ -1208,26 +1556,31 @@ class AppUI:
                 outputs=[ask_button, clear_button]
             ).then(
                 fn=self.controller.process_question,  # 然后处理AI回复
-                inputs=[question_input, chatbot],
-                outputs=[chatbot, chart_display, chart_info],
+                inputs=[question_input, chatbot, question_submitted_at],
+                outputs=[chatbot, chart_display, chart_info, chart_plot, last_record_id, result_state],
                 show_progress=True  # 显示加载进度
+            ).then(
+                # 表格结果显示第一页
+                fn=self.controller.get_result_page,
+                inputs=[result_state],
+                outputs=[result_table, result_page_info, result_state]
             ).then(
                 # 重新启用按钮并清空输入框
                 fn=lambda: (gr.update(interactive=True), gr.update(interactive=True), ""),
                 inputs=None,
                 outputs=[ask_button, clear_button, question_input]
             ).then(
-                # 更新对话记录显示，根据当前搜索状态智能刷新
-                fn=smart_refresh,
-                inputs=[current_search_keywords],
-                outputs=[chat_history_display]
+                # 把新记录插入对话记录表格
+                fn=append_new_record,
+                inputs=[current_search_keywords, history_state, last_record_id, chatbot],
+                outputs=[chat_history_display, history_state, chatbot]
             )
             
             # 按Enter键发送
             question_input.submit(
                 fn=self.controller.ask_question,  # 先只显示用户问题
                 inputs=[question_input, chatbot],
-                outputs=[chatbot, chart_display, chart_info]
+                outputs=[chatbot, chart_display, chart_info, question_submitted_at]
             ).then(
                 # 禁用按钮
                 fn=lambda: (gr.update(interactive=False), gr.update(interactive=False)),
@@ -1235,28 +1588,39 @@ class AppUI:
                 outputs=[ask_button, clear_button]
             ).then(
                 fn=self.controller.process_question,  # 然后处理AI回复
-                inputs=[question_input, chatbot],
-                outputs=[chatbot, chart_display, chart_info],
+                inputs=[question_input, chatbot, question_submitted_at],
+                outputs=[chatbot, chart_display, chart_info, chart_plot, last_record_id, result_state],
                 show_progress=True  # 显示加载进度
+            ).then(
+                # 表格结果显示第一页
+                fn=self.controller.get_result_page,
+                inputs=[result_state],
+                outputs=[result_table, result_page_info, result_state]
             ).then(
                 # 重新启用按钮并清空输入框
                 fn=lambda: (gr.update(interactive=True), gr.update(interactive=True), ""),
                 inputs=None,
                 outputs=[ask_button, clear_button, question_input]
+            ).then(
+                # 把新记录插入对话记录表格
+                fn=append_new_record,
+                inputs=[current_search_keywords, history_state, last_record_id, chatbot],
+                outputs=[chat_history_display, history_state, chatbot]
             )
             
             # 清空聊天
             clear_button.click(
                 fn=self.controller.clear_chat,
                 inputs=[chatbot],
-                outputs=[chatbot, chart_display, chart_info]
+                outputs=[chatbot, chart_display, chart_info, chart_plot]
             )
             
             # 删除所有历史记录事件
             delete_all_btn.click(
+                # 分批删除，在状态栏显示删除进度
                 fn=self.controller.delete_all_history,
                 inputs=[],
-                outputs=[]
+                outputs=[upload_status]
             ).then(
                 # 刷新会话列表和历史记录
                 fn=lambda: ([], self.get_text("all_history_deleted"), "", gr.update(visible=False)),
@@ -1265,8 +1629,8 @@ class AppUI:
             ).then(
                 # 更新对话记录显示并重置按钮状态，清空搜索状态
                 fn=load_all_records,
-                inputs=[],
-                outputs=[chat_history_display, current_search_keywords]
+                inputs=[history_state],
+                outputs=[chat_history_display, current_search_keywords, history_state]
             )
             
             file_input.upload(
@@ -1281,74 +1645,66 @@ class AppUI:
             ).then(
                 # 刷新历史记录显示，清空搜索状态
                 fn=load_all_records,
-                inputs=[],
-                outputs=[chat_history_display, current_search_keywords]
+                inputs=[history_state],
+                outputs=[chat_history_display, current_search_keywords, history_state]
             )
             
 
             
         return interface 
 
-    def load_selected_history(self, time_question_info, chatbot):
+    def load_selected_history(self, record_id, chatbot):
         """
         加载选中的会话历史记录
         
         Args:
-            time_question_info: 选中行的时间和问题信息
+            record_id: 选中行的记录ID
             chatbot: 当前对话框内容
             
         Returns:
             tuple: 更新后的对话框内容、状态消息、图表文件、图表信息
         """
         try:
-            print(f"尝试通过时间和问题信息加载会话: {time_question_info}")
-            
-            if not time_question_info:
-                return chatbot, self.get_text("no_row_selected"), None, self.get_text("no_chart")
-            
-            # 先通过时间和问题信息获取记录ID
-            record_id = self.controller.db_manager.get_record_by_time_and_question(time_question_info)
+            print(f"尝试通过记录ID加载会话: {record_id}")
             
             if not record_id:
                 return chatbot, self.get_text("no_row_selected"), None, self.get_text("no_chart")
             
-            # 然后获取记录ID对应的会话ID
+            # 获取记录ID对应的会话ID
             session_id = self.controller.get_session_id_by_record_id(record_id)
             
             if not session_id:
                 return chatbot, self.get_text("no_session_selected"), None, self.get_text("no_chart")
                 
-            # 最后加载会话（现在返回4个值）
-            return self.controller.load_history_record(session_id, chatbot)
+            # 加载会话（返回4个值）
+            return self.controller.load_history_record(session_id, chatbot, record_id)
         except Exception as e:
             print(f"加载会话历史记录时出错: {str(e)}")
             return chatbot, f"加载失败: {str(e)}", None, f"{self.get_text('load_error', str(e))}"
 
-    def delete_selected_record(self, time_question_info):
+    def delete_selected_record(self, record_id, history_state, shown_question=None):
         """
         删除选中的单条记录
         
         Args:
-            time_question_info: 选中行的时间和问题信息
+            record_id: 选中行的记录ID
+            history_state: 本会话历史记录表格的分页状态，删除成功后从中移除该记录
+            shown_question: 该行显示的问题，用于确认删除的就是用户看到的记录
             
         Returns:
-            str: 状态消息
+            tuple: (是否成功, 状态消息)
         """
         try:
-            print(f"尝试通过时间和问题信息删除记录: {time_question_info}")
-            
-            if not time_question_info:
-                return self.get_text("no_row_selected")
-            
-            # 先通过时间和问题信息获取记录ID
-            record_id = self.controller.db_manager.get_record_by_time_and_question(time_question_info)
+            print(f"尝试删除记录: {record_id}")
             
             if not record_id:
-                return self.get_text("no_row_selected")
+                return False, self.get_text("no_row_selected")
             
             # 调用控制器方法删除记录
-            success, message = self.controller.delete_record(record_id)
-            return message
+            success, message = self.controller.delete_record(record_id, shown_question)
+            if success:
+                self.controller.remove_history_rows(history_state, [record_id])
+            return success, message
         except Exception as e:
             print(f"删除记录时出错: {str(e)}")
-            return f"删除失败: {str(e)}" 
\ No newline at end of file
+            return False, f"删除失败: {str(e)}"
@@ -0,0 +1,178 @@
+"""
+PandasAI Agent对话记忆的导出、恢复与压缩
+会话快照保存导出的消息列表，恢复会话时重新创建Agent后写回记忆，后续追问可以继续引用之前的问答。
+每次问答后按记忆策略压缩：最近几轮问答原样保留，更早的问答合并为一条长度有上限的滚动摘要，
+无论会话持续多久，每次提示中的对话记忆长度都基本不变
+"""
+import os
+import re
+
+# 原样保留的最近问答轮数
+AGENT_MEMORY_KEEP_TURNS = int(os.getenv("AGENT_MEMORY_KEEP_TURNS", "4"))
+# 滚动摘要的最大字符数，超出时丢弃最早的摘要条目
+AGENT_MEMORY_SUMMARY_MAX_CHARS = int(os.getenv("AGENT_MEMORY_SUMMARY_MAX_CHARS", "1200"))
+# 摘要中每个问题和回答保留的字符数
+AGENT_MEMORY_SUMMARY_ITEM_CHARS = int(os.getenv("AGENT_MEMORY_SUMMARY_ITEM_CHARS", "80"))
+
+# 摘要消息的开头，用于识别已有的摘要
+SUMMARY_PREFIX = "[Earlier conversation summary]"
+
+
+def get_agent_memory(agent):
+    """
+    获取Agent的对话记忆对象（兼容不同版本PandasAI的属性位置）
+
+    Returns:
+        Memory: 记忆对象，找不到时返回None
+    """
+    if agent is None:
+        return None
+    for owner in (getattr(agent, "context", None), getattr(agent, "_state", None), agent):
+        memory = getattr(owner, "memory", None) if owner is not None else None
+        if memory is not None and hasattr(memory, "add"):
+            return memory
+    return None
+
+
+def export_memory(agent):
+    """
+    导出Agent的对话记忆
+
+    Returns:
+        list: [{"message": 文本, "is_user": 是否为用户消息}]
+    """
+    memory = get_agent_memory(agent)
+    if memory is None:
+        return []
+    messages = memory.all() if hasattr(memory, "all") else getattr(memory, "_messages", [])
+    return [
+        {"message": str(item.get("message", "")), "is_user": bool(item.get("is_user"))}
+        for item in messages
+        if isinstance(item, dict)
+    ]
+
+
+def restore_memory(agent, messages):
+    """
+    用导出的消息替换Agent的对话记忆
+
+    Args:
+        agent: PandasAI Agent
+        messages: export_memory() 返回的消息列表
+
+    Returns:
+        int: 恢复的消息数，Agent不支持记忆时返回0
+    """
+    memory = get_agent_memory(agent)
+    if memory is None or not messages:
+        return 0
+    if hasattr(memory, "clear"):
+        memory.clear()
+    for item in messages:
+        memory.add(item["message"], item["is_user"])
+    return len(messages)
+
+
+def clear_memory(agent):
+    """
+    清空Agent的对话记忆（复用已初始化的Agent开始新会话时调用）
+    """
+    if hasattr(agent, "clear_memory"):
+        agent.clear_memory()
+        return
+    memory = get_agent_memory(agent)
+    if memory is not None and hasattr(memory, "clear"):
+        memory.clear()
+
+
+def memory_size():
+    """
+    创建Agent时使用的记忆大小（消息数）：摘要一条加上保留的问答轮数，保证提示中包含全部保留的记忆
+    """
+    return AGENT_MEMORY_KEEP_TURNS * 2 + 1
+
+
+def _shorten(text, limit):
+    """压缩空白并截断文本"""
+    text = re.sub(r"\s+", " ", str(text or "")).strip()
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def summarize_turns(summary, messages, max_chars=AGENT_MEMORY_SUMMARY_MAX_CHARS,
+                    item_chars=AGENT_MEMORY_SUMMARY_ITEM_CHARS):
+    """
+    把较早的消息合并到滚动摘要中（本地抽取式摘要，不调用模型）
+
+    每轮问答压缩为一行“问题 -> 回答要点”；摘要超过上限时丢弃最早的行
+
+    Args:
+        summary: 已有的摘要正文（不含前缀），没有时为空字符串
+        messages: 需要合并的消息列表
+        max_chars: 摘要的最大字符数
+        item_chars: 每个问题和回答保留的字符数
+
+    Returns:
+        str: 新的摘要正文
+    """
+    lines = [line for line in summary.split("\n") if line.strip()] if summary else []
+    question = None
+    for item in messages:
+        if item["is_user"]:
+            if question is not None:
+                lines.append(f"- Q: {question}")
+            question = _shorten(item["message"], item_chars)
+        else:
+            answer = _shorten(item["message"], item_chars)
+            lines.append(f"- Q: {question} -> A: {answer}" if question is not None else f"- A: {answer}")
+            question = None
+    if question is not None:
+        lines.append(f"- Q: {question}")
+
+    while lines and len("\n".join(lines)) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def compact_messages(messages, keep_turns=AGENT_MEMORY_KEEP_TURNS):
+    """
+    按记忆策略压缩消息列表
+
+    Args:
+        messages: export_memory() 返回的消息列表
+        keep_turns: 原样保留的最近问答轮数
+
+    Returns:
+        list: 压缩后的消息列表，无需压缩时返回None
+    """
+    summary = ""
+    if messages and not messages[0]["is_user"] and messages[0]["message"].startswith(SUMMARY_PREFIX):
+        summary = messages[0]["message"][len(SUMMARY_PREFIX):].strip()
+        messages = messages[1:]
+
+    # 从末尾数出保留的轮数，以用户消息作为每轮的开始
+    keep_from = len(messages)
+    turns = 0
+    while keep_from > 0 and turns < keep_turns:
+        keep_from -= 1
+        if messages[keep_from]["is_user"]:
+            turns += 1
+    if keep_from <= 0:
+        return None
+
+    summary = summarize_turns(summary, messages[:keep_from])
+    return [{"message": f"{SUMMARY_PREFIX}\n{summary}", "is_user": False}] + messages[keep_from:]
+
+
+def compact_memory(agent, keep_turns=AGENT_MEMORY_KEEP_TURNS):
+    """
+    压缩Agent的对话记忆（每次问答后调用）
+
+    Returns:
+        int: 压缩后减少的消息数，未压缩时返回0
+    """
+    messages = export_memory(agent)
+    compacted = compact_messages(messages, keep_turns)
+    if compacted is None:
+        return 0
+    restore_memory(agent, compacted)
+    return len(messages) - len(compacted)
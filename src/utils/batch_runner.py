@@ -0,0 +1,130 @@
+"""
+批量问题运行模块
+分析人员每月拿到新数据后通常有一份固定的问题清单，批量模式把清单中的问题并发交给问答流水线处理：
+- 每个工作线程使用独立的Agent（按需创建、用完放回池中复用），问题之间互不共享对话记忆
+- 调用LLM生成代码的阶段并行进行，生成代码的执行由执行上下文补丁串行化
+- 每完成一个问题返回一次进度，最后按问题顺序汇总结果
+"""
+import os
+import csv
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 默认的并发数
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "3"))
+# 单次批量运行最多处理的问题数
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+
+# 问题清单文件中可能的问题列名
+_QUESTION_COLUMNS = ("question", "questions", "问题")
+
+
+def parse_questions(text=None, file_path=None, limit=BATCH_MAX_QUESTIONS):
+    """
+    从粘贴的文本或上传的文件中解析问题清单
+
+    文本和.txt文件每行一个问题，空行和以#开头的行会被忽略；
+    .csv文件使用名为question/问题的列，没有时使用第一列
+
+    Args:
+        text: 粘贴的问题文本
+        file_path: 上传的问题清单文件路径（.txt 或 .csv）
+        limit: 最多返回的问题数
+
+    Returns:
+        list: 去重后按原顺序排列的问题
+    """
+    lines = []
+    if file_path:
+        if os.path.splitext(file_path)[1].lower() == ".csv":
+            with open(file_path, newline="", encoding="utf-8-sig") as f:
+                rows = list(csv.reader(f))
+            if rows:
+                header = [cell.strip().lower() for cell in rows[0]]
+                column = next((header.index(name) for name in _QUESTION_COLUMNS if name in header), None)
+                if column is None:
+                    column = 0
+                else:
+                    rows = rows[1:]
+                lines.extend(row[column] for row in rows if len(row) > column)
+        else:
+            with open(file_path, encoding="utf-8-sig") as f:
+                lines.extend(f.read().splitlines())
+    if text:
+        lines.extend(text.splitlines())
+
+    questions = []
+    seen = set()
+    for line in lines:
+        question = line.strip()
+        if not question or question.startswith("#") or question in seen:
+            continue
+        seen.add(question)
+        questions.append(question)
+    return questions[:limit]
+
+
+class BatchRunner:
+    """并发运行一组问题，每个工作线程使用独立的Agent"""
+
+    def __init__(self, create_agent, answer, max_workers=BATCH_MAX_WORKERS):
+        """
+        初始化批量运行器
+
+        Args:
+            create_agent: 创建工作线程使用的Agent的函数
+            answer: 回答单个问题的函数 answer(agent, question)，返回结果字典
+            max_workers: 并发数
+        """
+        self._create_agent = create_agent
+        self._answer = answer
+        self.max_workers = max(1, int(max_workers))
+        # 空闲的Agent，工作线程取用后放回
+        self._agents = queue.LifoQueue()
+        self._agent_count = 0
+        self._lock = threading.Lock()
+
+    def _run_one(self, question):
+        """在工作线程上回答一个问题"""
+        started = time.perf_counter()
+        try:
+            agent = self._agents.get_nowait()
+        except queue.Empty:
+            agent = self._create_agent()
+            with self._lock:
+                self._agent_count += 1
+        try:
+            item = self._answer(agent, question)
+        finally:
+            self._agents.put(agent)
+        item.setdefault("question", question)
+        item["elapsed"] = time.perf_counter() - started
+        return item
+
+    def run(self, questions):
+        """
+        运行问题清单，每完成一个问题返回一次进度
+
+        Args:
+            questions: 问题列表
+
+        Yields:
+            tuple: (已完成数, 总数, 按问题顺序排列的结果列表，未完成的位置为None)
+        """
+        results = [None] * len(questions)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(questions), 1)),
+                                thread_name_prefix="batch-question") as executor:
+            futures = {executor.submit(self._run_one, question): index for index, question in enumerate(questions)}
+            done = 0
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    print(f"批量问题执行失败: {questions[index]}: {str(e)}")
+                    results[index] = {"question": questions[index], "status": "error", "answer": str(e), "elapsed": 0.0}
+                done += 1
+                yield done, len(questions), results
+        print(f"批量运行完成: {len(questions)} 个问题, 并发 {self.max_workers}, 创建 {self._agent_count} 个Agent")
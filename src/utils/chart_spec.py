@@ -0,0 +1,303 @@
+"""
+声明式图表规格模块
+将聚合后的数据转换为紧凑的 Vega-Lite JSON 规格，由浏览器端渲染交互式图表，
+服务器端不再需要绘制和传输PNG；需要时仍可将规格导出为PNG
+"""
+import os
+import json
+import uuid
+import logging
+import importlib.util
+from datetime import datetime
+
+# 图表规格中最多携带的数据行数
+SPEC_MAX_ROWS = int(os.getenv("CHART_SPEC_MAX_ROWS", "1000"))
+
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+
+# 交互式图表需要altair生成Gradio Plot组件的值，未安装时图表改为在服务器端导出PNG显示
+ALTAIR_AVAILABLE = importlib.util.find_spec("altair") is not None
+if not ALTAIR_AVAILABLE:
+    logging.warning("未安装altair，交互式图表将改为在服务器端导出PNG显示。请使用 pip install altair 安装。")
+
+# 根据问题中的关键词推断图表类型
+_MARK_KEYWORDS = [
+    ("arc", ['饼图', '饼状图', '占比', 'pie', 'proportion', 'share']),
+    ("line", ['折线', '趋势', '走势', '变化', 'line', 'trend', 'over time']),
+    ("point", ['散点', '相关', '关系', 'scatter', 'correlation', 'relationship']),
+    ("bar", ['柱状图', '条形图', '柱形图', '对比', '比较', 'bar', 'compare', 'comparison']),
+]
+
+
+class ChartSpecBuilder:
+    """图表规格构建工具类，负责生成、转换和导出声明式图表"""
+
+    @staticmethod
+    def build_prompt_hint(is_chinese):
+        """
+        生成附加在问题后的提示，要求LLM返回用于绘图的聚合数据而不是图片
+
+        Args:
+            is_chinese: 是否为中文提问
+
+        Returns:
+            str: 提示文本
+        """
+        if is_chinese:
+            return (f"不要绘制图片，请返回绘制该图表所需的聚合后数据（DataFrame，"
+                    f"第一列为类别或时间，其余列为数值，最多{SPEC_MAX_ROWS}行）。")
+        return (f"Do not draw an image. Return the aggregated data needed for this chart as a DataFrame "
+                f"(first column is the category or time, other columns are numeric, at most {SPEC_MAX_ROWS} rows).")
+
+    @staticmethod
+    def infer_mark(question, x_kind, y_count):
+        """
+        推断图表类型
+
+        Args:
+            question: 用户问题
+            x_kind: x轴数据类型（temporal/quantitative/nominal）
+            y_count: 数值列数量
+
+        Returns:
+            str: Vega-Lite mark类型
+        """
+        question_lower = (question or "").lower()
+        for mark, keywords in _MARK_KEYWORDS:
+            if any(keyword in question_lower for keyword in keywords):
+                if mark == "arc" and y_count > 1:
+                    continue
+                return mark
+
+        if x_kind == "temporal":
+            return "line"
+        if x_kind == "quantitative":
+            return "point"
+        return "bar"
+
+    @staticmethod
+    def _field_kind(series):
+        """获取列在Vega-Lite中的编码类型"""
+        import pandas as pd
+
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return "temporal"
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            return "quantitative"
+        return "nominal"
+
+    @staticmethod
+    def _reduce_rows(df, x_field, y_fields, mark):
+        """将数据行数控制在 SPEC_MAX_ROWS 以内"""
+        if len(df) <= SPEC_MAX_ROWS:
+            return df
+
+        if mark == "line" and len(y_fields) == 1:
+            # 时间序列使用LTTB保留形状
+            from .plot_downsampler import lttb_indices, _to_numeric
+            import numpy as np
+
+            ordered = df.sort_values(x_field).reset_index(drop=True)
+            x_num = _to_numeric(ordered[x_field])
+            y_num = _to_numeric(ordered[y_fields[0]])
+            if x_num is not None and y_num is not None:
+                finite = np.flatnonzero(np.isfinite(x_num) & np.isfinite(y_num))
+                idx = finite[lttb_indices(x_num[finite], y_num[finite], SPEC_MAX_ROWS)]
+                return ordered.iloc[idx]
+            return ordered.iloc[:: max(1, len(ordered) // SPEC_MAX_ROWS)]
+
+        if mark in ("bar", "arc"):
+            # 类别数据保留数值最大的类别
+            return df.nlargest(SPEC_MAX_ROWS, y_fields[0])
+
+        return df.sample(SPEC_MAX_ROWS, random_state=0)
+
+    @staticmethod
+    def from_result(result, question="", title=None):
+        """
+        从Agent返回的结果构建 Vega-Lite 图表规格
+
+        Args:
+            result: DataFrame、Series或包含dataframe的结果字典
+            question: 用户问题（用于推断图表类型）
+            title: 图表标题
+
+        Returns:
+            dict: Vega-Lite规格，无法构建时返回None
+        """
+        import pandas as pd
+
+        if isinstance(result, dict) and result.get("type") == "dataframe":
+            result = result.get("value")
+        # SmartDataframe等包装对象
+        if hasattr(result, "dataframe") and isinstance(getattr(result, "dataframe"), pd.DataFrame):
+            result = result.dataframe
+
+        if isinstance(result, pd.Series):
+            result = result.to_frame(name=result.name or "value")
+        if not isinstance(result, pd.DataFrame) or result.empty:
+            return None
+
+        df = result.copy()
+        if not isinstance(df.index, pd.RangeIndex):
+            df = df.reset_index()
+        df.columns = [str(c) for c in df.columns]
+
+        numeric_cols = [c for c in df.columns if ChartSpecBuilder._field_kind(df[c]) == "quantitative"]
+        if not numeric_cols:
+            return None
+
+        # x轴优先使用非数值列，全部为数值时使用第一列
+        non_numeric = [c for c in df.columns if c not in numeric_cols]
+        x_field = non_numeric[0] if non_numeric else df.columns[0]
+        y_fields = [c for c in numeric_cols if c != x_field]
+        if not y_fields:
+            return None
+
+        x_kind = ChartSpecBuilder._field_kind(df[x_field])
+        mark = ChartSpecBuilder.infer_mark(question, x_kind, len(y_fields))
+        df = ChartSpecBuilder._reduce_rows(df[[x_field] + y_fields], x_field, y_fields, mark)
+
+        # 多个数值列转为长格式，用颜色区分
+        color = None
+        if len(y_fields) > 1:
+            df = df.melt(id_vars=[x_field], value_vars=y_fields, var_name="series", value_name="value")
+            y_field = "value"
+            color = {"field": "series", "type": "nominal"}
+        else:
+            y_field = y_fields[0]
+
+        values = json.loads(df.to_json(orient="records", date_format="iso", force_ascii=False))
+
+        if mark == "arc":
+            encoding = {
+                "theta": {"field": y_field, "type": "quantitative"},
+                "color": {"field": x_field, "type": "nominal"},
+                "tooltip": [{"field": x_field}, {"field": y_field}],
+            }
+        else:
+            encoding = {
+                "x": {"field": x_field, "type": x_kind, "sort": None if mark == "bar" else "ascending"},
+                "y": {"field": y_field, "type": "quantitative"},
+                "tooltip": [{"field": x_field}, {"field": y_field}],
+            }
+            if color:
+                encoding["color"] = color
+                encoding["tooltip"].append({"field": "series"})
+
+        spec = {
+            "$schema": VEGA_LITE_SCHEMA,
+            "title": title or question or "",
+            "width": "container",
+            "mark": {"type": mark, "tooltip": True},
+            "encoding": encoding,
+            "data": {"values": values},
+        }
+        if mark in ("line", "point"):
+            # 连续坐标轴支持浏览器端缩放和平移
+            spec["params"] = [{"name": "zoom", "select": "interval", "bind": "scales"}]
+        return spec
+
+    @staticmethod
+    def to_json(spec):
+        """将规格序列化为紧凑的JSON字符串"""
+        if not spec:
+            return None
+        return json.dumps(spec, ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def from_json(spec_json):
+        """从JSON字符串还原规格"""
+        if not spec_json:
+            return None
+        try:
+            return json.loads(spec_json) if isinstance(spec_json, str) else spec_json
+        except Exception as e:
+            print(f"解析图表规格失败: {str(e)}")
+            return None
+
+    @staticmethod
+    def to_plot(spec):
+        """
+        将规格转换为Gradio Plot组件可渲染的对象（由浏览器端vega-embed渲染）
+
+        Args:
+            spec: Vega-Lite规格
+
+        Returns:
+            altair.Chart，未安装altair或转换失败时返回None（调用方改用render_png）
+        """
+        spec = ChartSpecBuilder.from_json(spec)
+        if not spec or not ALTAIR_AVAILABLE:
+            return None
+        try:
+            import altair as alt
+            # Gradio的Plot组件会自行设置宽度
+            spec = {k: v for k, v in spec.items() if k != "width"}
+            return alt.Chart.from_dict(spec)
+        except Exception as e:
+            print(f"转换交互式图表失败: {str(e)}")
+            return None
+
+    @staticmethod
+    def render_png(spec, output_dir="charts"):
+        """
+        按需将图表规格导出为PNG（服务器端使用matplotlib绘制）
+
+        Args:
+            spec: Vega-Lite规格
+            output_dir: 输出目录
+
+        Returns:
+            str: PNG文件路径，失败时返回None
+        """
+        spec = ChartSpecBuilder.from_json(spec)
+        if not spec:
+            return None
+
+        try:
+            import pandas as pd
+            import matplotlib.pyplot as plt
+            from .font_config import force_chinese_font_config
+
+            force_chinese_font_config()
+
+            df = pd.DataFrame(spec["data"]["values"])
+            encoding = spec["encoding"]
+            mark = spec["mark"]["type"] if isinstance(spec["mark"], dict) else spec["mark"]
+
+            fig, ax = plt.subplots()
+            if mark == "arc":
+                ax.pie(df[encoding["theta"]["field"]], labels=df[encoding["color"]["field"]], autopct="%1.1f%%")
+            else:
+                x_field = encoding["x"]["field"]
+                y_field = encoding["y"]["field"]
+                if encoding["x"]["type"] == "temporal":
+                    df[x_field] = pd.to_datetime(df[x_field])
+                series_field = encoding.get("color", {}).get("field")
+                groups = df.groupby(series_field) if series_field else [(y_field, df)]
+                for name, group in groups:
+                    if mark == "line":
+                        ax.plot(group[x_field], group[y_field], label=str(name))
+                    elif mark == "point":
+                        ax.scatter(group[x_field], group[y_field], label=str(name), s=12)
+                    else:
+                        ax.bar(group[x_field].astype(str), group[y_field], label=str(name))
+                ax.set_xlabel(x_field)
+                ax.set_ylabel(y_field)
+                if series_field:
+                    ax.legend()
+                if mark == "bar":
+                    plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+            ax.set_title(spec.get("title", ""))
+            fig.tight_layout()
+
+            os.makedirs(output_dir, exist_ok=True)
+            filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{str(uuid.uuid4())[:8]}.png"
+            output_path = os.path.join(output_dir, filename)
+            fig.savefig(output_path)
+            plt.close(fig)
+            return output_path
+        except Exception as e:
+            print(f"导出图表PNG失败: {str(e)}")
+            return None
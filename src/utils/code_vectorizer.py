@@ -0,0 +1,692 @@
+"""
+生成代码向量化分析模块
+在PandasAI的代码清理和执行之间插入基于AST的分析：
+- 识别 iterrows/itertuples 循环、逐行 apply(lambda ...)、以及在逐行遍历的循环中追加列表等非向量化写法
+  （分组后的apply和字符串格式化本身无法向量化，不作为命中，避免无谓地请求LLM重写）
+- 对常见写法直接改写为向量化的 pandas/numpy 表达式
+- 无法自动改写时，可将代码连同“请向量化”的指令发回LLM重新生成
+每次分析命中的模式都会被记录，便于统计
+"""
+import os
+import ast
+import copy
+import logging
+import threading
+from collections import Counter
+
+from .request_timing import timed_stage
+
+# 是否启用向量化分析
+VECTORIZE_ENABLED = os.getenv("CODE_VECTORIZE_ENABLED", "true").lower() == "true"
+# 自动改写后仍有非向量化写法时，是否请求LLM重写
+VECTORIZE_LLM_RETRY = os.getenv("CODE_VECTORIZE_LLM_RETRY", "true").lower() == "true"
+
+# 模式名称
+PATTERN_ITERROWS = "iterrows"
+PATTERN_ITERTUPLES = "itertuples"
+PATTERN_APPLY_AXIS1 = "apply_axis1"
+PATTERN_APPLY_LAMBDA = "apply_lambda"
+PATTERN_LIST_APPEND_LOOP = "list_append_loop"
+
+# 可以直接改写为向量化运算的运算符
+_ARITHMETIC_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_COMPARE_OPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+# 行对象上不能当作列名的属性
+_ROW_RESERVED_ATTRS = {"name", "index", "values", "shape", "size", "dtype", "dtypes", "T"}
+# apply作用于每个分组/窗口而不是每一行的方法
+_GROUPING_METHODS = {"groupby", "resample", "rolling", "expanding", "ewm"}
+
+_stats_lock = threading.Lock()
+# 累计命中次数
+pattern_stats = Counter()
+# 每个线程最近一次的分析报告（并行问答时各线程只取到自己执行的代码的报告）
+_local = threading.local()
+
+_VECTORIZE_PROMPT = """The following Python code runs on DataFrames with millions of rows, but it uses slow non-vectorized patterns: {{ patterns }}.
+Rewrite it with vectorized pandas/numpy operations (no iterrows/itertuples, no row-wise apply with lambda, no Python loops that append to lists).
+Keep the same logic, variable names, imports and the final `result` dictionary. Return the complete code only.
+
+```python
+{{ code }}
+```"""
+
+
+class _Unvectorizable(Exception):
+    """表达式无法安全地改写为向量化形式"""
+
+
+def _is_simple_receiver(node):
+    """判断接收对象是否为无副作用的简单表达式（df、self.df、dfs[0]、df['col']等）"""
+    if isinstance(node, ast.Name):
+        return True
+    if isinstance(node, ast.Attribute):
+        return _is_simple_receiver(node.value)
+    if isinstance(node, ast.Subscript):
+        return isinstance(node.slice, ast.Constant) and _is_simple_receiver(node.value)
+    return False
+
+
+def _is_column_series(node):
+    """判断表达式是否明确是单列Series（如 df['col']）"""
+    return (isinstance(node, ast.Subscript)
+            and isinstance(node.slice, ast.Constant)
+            and isinstance(node.slice.value, str)
+            and _is_simple_receiver(node.value))
+
+
+def _column(receiver, column_name):
+    """构造 receiver['column_name'] 表达式"""
+    return ast.Subscript(value=copy.deepcopy(receiver), slice=ast.Constant(value=column_name), ctx=ast.Load())
+
+
+def _formats_string(node):
+    """判断表达式是否包含字符串格式化（f-string、'...' % x、'...'.format(x)），逐元素格式化无法向量化"""
+    for child in ast.walk(node):
+        if isinstance(child, ast.JoinedStr):
+            return True
+        if (isinstance(child, ast.BinOp) and isinstance(child.op, ast.Mod)
+                and isinstance(child.left, ast.Constant) and isinstance(child.left.value, str)):
+            return True
+        if (isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute) and child.func.attr == "format"
+                and isinstance(child.func.value, ast.Constant) and isinstance(child.func.value.value, str)):
+            return True
+    return False
+
+
+def _is_grouped(node):
+    """判断接收对象是否为groupby/resample/rolling等分组结果（apply作用于整个分组）"""
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in _GROUPING_METHODS):
+            return True
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return False
+
+
+def _is_row_iteration(node):
+    """判断for循环的迭代对象是否逐行遍历数据（iterrows/itertuples、range(len(df))、单列Series）"""
+    if isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            return func.attr in ("iterrows", "itertuples")
+        return (isinstance(func, ast.Name) and func.id == "range" and len(node.args) == 1
+                and isinstance(node.args[0], ast.Call) and isinstance(node.args[0].func, ast.Name)
+                and node.args[0].func.id == "len" and len(node.args[0].args) == 1)
+    return _is_column_series(node)
+
+
+def _is_boolean_expr(node):
+    """判断表达式的结果是否一定是布尔值"""
+    if isinstance(node, (ast.Compare, ast.BoolOp)):
+        return True
+    return isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not) and _is_boolean_expr(node.operand)
+
+
+def _is_numeric_constant(node):
+    """判断表达式是否为数值常量（不包括布尔值），如 0、1.5、-1"""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        node = node.operand
+    return (isinstance(node, ast.Constant) and isinstance(node.value, (int, float))
+            and not isinstance(node.value, bool))
+
+
+class _ExprVectorizer:
+    """
+    将作用于单行（或单个元素）的表达式改写为作用于整列的表达式
+
+    row_mode为True时，arg['col'] / arg.col 被替换为 receiver['col']；
+    否则参数本身被替换为receiver（receiver为单列Series）
+    """
+
+    def __init__(self, arg_name, receiver, row_mode):
+        self.arg_name = arg_name
+        self.receiver = receiver
+        self.row_mode = row_mode
+        self.uses_column = False
+
+    def convert(self, node):
+        """改写表达式，无法改写时抛出 _Unvectorizable"""
+        result = self._visit(node)
+        if not self.uses_column:
+            # 不引用任何列时结果是标量，语义与逐行计算不同
+            raise _Unvectorizable()
+        return result
+
+    def _is_column_ref(self, node):
+        """表达式是否直接引用一列（row['col']、row.col，或逐元素时的参数本身）"""
+        if not self.row_mode:
+            return isinstance(node, ast.Name) and node.id == self.arg_name
+        if isinstance(node, ast.Subscript):
+            return (isinstance(node.value, ast.Name) and node.value.id == self.arg_name
+                    and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str))
+        return (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+                and node.value.id == self.arg_name and node.attr not in _ROW_RESERVED_ATTRS)
+
+    def _as_series(self, value):
+        """把ndarray或标量包装为与原数据对齐的Series"""
+        return ast.Call(
+            func=ast.Attribute(value=ast.Name(id="pd", ctx=ast.Load()), attr="Series", ctx=ast.Load()),
+            args=[value],
+            keywords=[ast.keyword(arg="index", value=ast.Attribute(
+                value=copy.deepcopy(self.receiver), attr="index", ctx=ast.Load()))]
+        )
+
+    def _visit_if(self, node):
+        """
+        改写条件表达式 a if cond else b
+
+        两个分支都是数值常量或都是列引用时使用np.where；其他情况（如数值列和字符串常量）
+        np.where会把结果提升为字符串类型，改用Series.where，结果保持object类型
+        """
+        uses_column, self.uses_column = self.uses_column, False
+        test = self._visit(node.test)
+        if not self.uses_column:
+            # 条件与行无关时无法构造逐行的条件
+            raise _Unvectorizable()
+        self.uses_column = False
+        body = self._visit(node.body)
+        body_is_series = self.uses_column
+        orelse = self._visit(node.orelse)
+        self.uses_column = True
+
+        if ((_is_numeric_constant(node.body) and _is_numeric_constant(node.orelse))
+                or (self._is_column_ref(node.body) and self._is_column_ref(node.orelse))):
+            return self._as_series(ast.Call(
+                func=ast.Attribute(value=ast.Name(id="np", ctx=ast.Load()), attr="where", ctx=ast.Load()),
+                args=[test, body, orelse],
+                keywords=[]
+            ))
+
+        # 引用列的分支本身就是对齐的Series，标量分支先包装为Series
+        if not body_is_series:
+            body = self._as_series(body)
+        return ast.Call(
+            func=ast.Attribute(value=body, attr="where", ctx=ast.Load()),
+            args=[test, orelse],
+            keywords=[]
+        )
+
+    def _visit(self, node):
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, (int, float, str, bool)):
+                return copy.deepcopy(node)
+            raise _Unvectorizable()
+
+        if isinstance(node, ast.Name):
+            if node.id == self.arg_name:
+                if self.row_mode:
+                    raise _Unvectorizable()
+                self.uses_column = True
+                return copy.deepcopy(self.receiver)
+            # 外部变量按标量处理
+            return copy.deepcopy(node)
+
+        if isinstance(node, ast.Subscript) and self.row_mode:
+            if (isinstance(node.value, ast.Name) and node.value.id == self.arg_name
+                    and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+                self.uses_column = True
+                return _column(self.receiver, node.slice.value)
+            raise _Unvectorizable()
+
+        if isinstance(node, ast.Attribute) and self.row_mode:
+            if (isinstance(node.value, ast.Name) and node.value.id == self.arg_name
+                    and node.attr not in _ROW_RESERVED_ATTRS):
+                self.uses_column = True
+                return _column(self.receiver, node.attr)
+            raise _Unvectorizable()
+
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mod):
+            # 左侧不引用列时 % 是字符串格式化（'%.2f' % x、fmt % x），不是取模
+            uses_column, self.uses_column = self.uses_column, False
+            left = self._visit(node.left)
+            if not self.uses_column:
+                raise _Unvectorizable()
+            self.uses_column = True
+            return ast.BinOp(left=left, op=ast.Mod(), right=self._visit(node.right))
+
+        if isinstance(node, ast.BinOp) and isinstance(node.op, _ARITHMETIC_OPS):
+            return ast.BinOp(left=self._visit(node.left), op=copy.deepcopy(node.op), right=self._visit(node.right))
+
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, (ast.USub, ast.UAdd)):
+                return ast.UnaryOp(op=copy.deepcopy(node.op), operand=self._visit(node.operand))
+            if isinstance(node.op, ast.Not) and _is_boolean_expr(node.operand):
+                return ast.UnaryOp(op=ast.Invert(), operand=self._visit(node.operand))
+            raise _Unvectorizable()
+
+        if isinstance(node, ast.Compare):
+            if len(node.ops) != 1 or not isinstance(node.ops[0], _COMPARE_OPS):
+                raise _Unvectorizable()
+            return ast.Compare(left=self._visit(node.left), ops=[copy.deepcopy(node.ops[0])],
+                               comparators=[self._visit(node.comparators[0])])
+
+        if isinstance(node, ast.BoolOp):
+            # and/or 只在操作数均为布尔表达式时等价于 &/|
+            if not all(_is_boolean_expr(value) for value in node.values):
+                raise _Unvectorizable()
+            op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+            result = self._visit(node.values[0])
+            for value in node.values[1:]:
+                result = ast.BinOp(left=result, op=op, right=self._visit(value))
+            return result
+
+        if isinstance(node, ast.IfExp):
+            return self._visit_if(node)
+
+        raise _Unvectorizable()
+
+
+def _vectorize_lambda(call):
+    """
+    尝试将 X.apply(lambda ...) / X.map(lambda ...) 改写为向量化表达式
+
+    Returns:
+        ast.expr或None: 改写后的表达式
+    """
+    func = call.func
+    if not (isinstance(func, ast.Attribute) and func.attr in ("apply", "map")):
+        return None
+    if len(call.args) != 1 or not isinstance(call.args[0], ast.Lambda):
+        return None
+    lam = call.args[0]
+    if len(lam.args.args) != 1 or lam.args.vararg or lam.args.kwarg or lam.args.kwonlyargs:
+        return None
+    receiver = func.value
+    if not _is_simple_receiver(receiver) or _formats_string(lam.body):
+        return None
+
+    axis = _axis_keyword(call)
+    other_keywords = [kw for kw in call.keywords if kw.arg != "axis"]
+    if other_keywords:
+        return None
+
+    if func.attr == "apply" and axis in (1, "columns"):
+        row_mode = True
+    elif axis is None and _is_column_series(receiver):
+        row_mode = False
+    else:
+        return None
+
+    try:
+        return _ExprVectorizer(lam.args.args[0].arg, receiver, row_mode).convert(lam.body)
+    except _Unvectorizable:
+        return None
+
+
+def _axis_keyword(call):
+    """获取调用中 axis 参数的常量值，未指定时返回None"""
+    for kw in call.keywords:
+        if kw.arg == "axis":
+            return kw.value.value if isinstance(kw.value, ast.Constant) else "unknown"
+    return None
+
+
+def _iterrows_loop(node):
+    """
+    解析 `for idx, row in X.iterrows():` 循环
+
+    Returns:
+        tuple或None: (receiver, idx_name, row_name)
+    """
+    if not isinstance(node, ast.For) or node.orelse:
+        return None
+    it = node.iter
+    if not (isinstance(it, ast.Call) and isinstance(it.func, ast.Attribute)
+            and it.func.attr == "iterrows" and not it.args and not it.keywords):
+        return None
+    if not _is_simple_receiver(it.func.value):
+        return None
+    target = node.target
+    if not (isinstance(target, ast.Tuple) and len(target.elts) == 2
+            and all(isinstance(elt, ast.Name) for elt in target.elts)):
+        return None
+    return it.func.value, target.elts[0].id, target.elts[1].id
+
+
+def _single_append(node):
+    """
+    判断循环体是否只有一句 `lst.append(expr)`
+
+    Returns:
+        tuple或None: (列表变量名, 追加的表达式)
+    """
+    if len(node.body) != 1 or not isinstance(node.body[0], ast.Expr):
+        return None
+    call = node.body[0].value
+    if (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) and call.func.attr == "append"
+            and isinstance(call.func.value, ast.Name) and len(call.args) == 1 and not call.keywords):
+        return call.func.value.id, call.args[0]
+    return None
+
+
+def _is_empty_list_assign(node, name):
+    """判断语句是否为 `name = []`"""
+    return (isinstance(node, ast.Assign) and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name) and node.targets[0].id == name
+            and isinstance(node.value, ast.List) and not node.value.elts)
+
+
+def _tolist(expr):
+    """构造 (expr).tolist() 表达式"""
+    return ast.Call(func=ast.Attribute(value=expr, attr="tolist", ctx=ast.Load()), args=[], keywords=[])
+
+
+class _VectorizingTransformer(ast.NodeTransformer):
+    """对整段代码执行向量化改写"""
+
+    def __init__(self):
+        self.rewrites = 0
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        vectorized = _vectorize_lambda(node)
+        if vectorized is None:
+            return node
+        self.rewrites += 1
+        return ast.copy_location(vectorized, node)
+
+    def generic_visit(self, node):
+        super().generic_visit(node)
+        for field in ("body", "orelse", "finalbody"):
+            statements = getattr(node, field, None)
+            if isinstance(statements, list) and statements and isinstance(statements[0], ast.stmt):
+                setattr(node, field, self._rewrite_block(statements))
+        return node
+
+    def _rewrite_block(self, statements):
+        """改写语句块中的循环"""
+        result = []
+        for stmt in statements:
+            replacement = self._rewrite_loop(stmt, result[-1] if result else None)
+            if replacement is None:
+                result.append(stmt)
+                continue
+            self.rewrites += 1
+            replaced_previous, new_stmt = replacement
+            if replaced_previous:
+                result.pop()
+            result.append(ast.copy_location(new_stmt, stmt))
+        return result
+
+    def _rewrite_loop(self, stmt, previous):
+        """
+        改写单个循环
+
+        Returns:
+            tuple或None: (是否替换了上一条语句, 新语句)
+        """
+        if not isinstance(stmt, ast.For) or stmt.orelse:
+            return None
+
+        iterrows = _iterrows_loop(stmt)
+        if iterrows:
+            receiver, idx_name, row_name = iterrows
+
+            # for idx, row in df.iterrows(): df.at[idx, 'c'] = expr  ->  df['c'] = expr
+            if len(stmt.body) == 1 and isinstance(stmt.body[0], ast.Assign):
+                assign = stmt.body[0]
+                column = self._indexed_column_target(assign, receiver, idx_name)
+                if column is not None:
+                    try:
+                        value = _ExprVectorizer(row_name, receiver, True).convert(assign.value)
+                    except _Unvectorizable:
+                        return None
+                    target = _column(receiver, column)
+                    target.ctx = ast.Store()
+                    return False, ast.Assign(targets=[target], value=value, lineno=stmt.lineno)
+
+            # lst = []; for idx, row in df.iterrows(): lst.append(expr)  ->  lst = (expr).tolist()
+            append = _single_append(stmt)
+            if append and previous is not None and _is_empty_list_assign(previous, append[0]):
+                try:
+                    value = _ExprVectorizer(row_name, receiver, True).convert(append[1])
+                except _Unvectorizable:
+                    return None
+                return True, self._list_assign(append[0], value, stmt)
+            return None
+
+        # lst = []; for v in df['col']: lst.append(expr)  ->  lst = (expr).tolist()
+        append = _single_append(stmt)
+        if (append and isinstance(stmt.target, ast.Name) and _is_column_series(stmt.iter)
+                and previous is not None and _is_empty_list_assign(previous, append[0])):
+            try:
+                value = _ExprVectorizer(stmt.target.id, stmt.iter, False).convert(append[1])
+            except _Unvectorizable:
+                return None
+            return True, self._list_assign(append[0], value, stmt)
+        return None
+
+    @staticmethod
+    def _indexed_column_target(assign, receiver, idx_name):
+        """匹配 receiver.at[idx, 'col'] / receiver.loc[idx, 'col'] 赋值，返回列名"""
+        if len(assign.targets) != 1 or not isinstance(assign.targets[0], ast.Subscript):
+            return None
+        target = assign.targets[0]
+        accessor = target.value
+        if not (isinstance(accessor, ast.Attribute) and accessor.attr in ("at", "loc")):
+            return None
+        if ast.dump(accessor.value) != ast.dump(receiver):
+            return None
+        index = target.slice
+        if not (isinstance(index, ast.Tuple) and len(index.elts) == 2):
+            return None
+        row_key, column = index.elts
+        if not (isinstance(row_key, ast.Name) and row_key.id == idx_name):
+            return None
+        if not (isinstance(column, ast.Constant) and isinstance(column.value, str)):
+            return None
+        return column.value
+
+    @staticmethod
+    def _list_assign(name, value, stmt):
+        return ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=_tolist(value), lineno=stmt.lineno)
+
+
+def analyze_code(code):
+    """
+    检测代码中的非向量化写法
+
+    Args:
+        code: Python代码
+
+    Returns:
+        list: 命中的模式列表，每项为 {"pattern": 模式名, "line": 行号}
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+
+    hits = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            if node.func.attr == "iterrows":
+                hits.append({"pattern": PATTERN_ITERROWS, "line": node.lineno})
+            elif node.func.attr == "itertuples":
+                hits.append({"pattern": PATTERN_ITERTUPLES, "line": node.lineno})
+            elif node.func.attr in ("apply", "map") and node.args and isinstance(node.args[0], ast.Lambda):
+                # 分组后的apply和逐元素的字符串格式化没有对应的向量化写法
+                if _is_grouped(node.func.value) or _formats_string(node.args[0].body):
+                    continue
+                axis = _axis_keyword(node)
+                pattern = PATTERN_APPLY_AXIS1 if axis in (1, "columns") else PATTERN_APPLY_LAMBDA
+                hits.append({"pattern": pattern, "line": node.lineno})
+    hits.extend({"pattern": PATTERN_LIST_APPEND_LOOP, "line": loop.lineno} for loop in _row_append_loops(tree))
+    return sorted(hits, key=lambda hit: hit["line"])
+
+
+def _row_append_loops(tree):
+    """
+    找出在逐行遍历的循环中追加列表的循环（遍历列名等少量元素的循环不算）
+
+    嵌套的逐行循环只记录离append最近的一层，每个循环只记录一次
+
+    Returns:
+        list: 循环节点
+    """
+    loops = []
+
+    def visit(node, row_loop):
+        if isinstance(node, ast.For) and _is_row_iteration(node.iter):
+            row_loop = node
+        elif (row_loop is not None and isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == "append" and isinstance(node.func.value, ast.Name)
+                and not any(loop is row_loop for loop in loops)):
+            loops.append(row_loop)
+        for child in ast.iter_child_nodes(node):
+            visit(child, row_loop)
+
+    visit(tree, None)
+    return loops
+
+
+def _ensure_imports(tree):
+    """改写使用了np/pd时，确保代码中导入了numpy和pandas"""
+    used = {node.value.id for node in ast.walk(tree)
+            if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)}
+    imported = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imported.update(alias.asname or alias.name for alias in node.names)
+    missing = []
+    if "np" in used and "np" not in imported:
+        missing.append(ast.Import(names=[ast.alias(name="numpy", asname="np")]))
+    if "pd" in used and "pd" not in imported:
+        missing.append(ast.Import(names=[ast.alias(name="pandas", asname="pd")]))
+    tree.body[0:0] = missing
+
+
+def vectorize_code(code):
+    """
+    分析并自动改写代码中的非向量化写法
+
+    Args:
+        code: Python代码
+
+    Returns:
+        tuple: (改写后的代码, 报告字典)
+            报告包含 hits（命中的模式）、remaining（改写后仍存在的模式）、rewrites（改写次数）
+    """
+    hits = analyze_code(code)
+    report = {"hits": hits, "remaining": hits, "rewrites": 0, "llm_rewritten": False}
+    if not hits:
+        return code, report
+
+    try:
+        tree = ast.parse(code)
+        transformer = _VectorizingTransformer()
+        tree = transformer.visit(tree)
+        if transformer.rewrites:
+            _ensure_imports(tree)
+            ast.fix_missing_locations(tree)
+            new_code = ast.unparse(tree)
+            compile(new_code, "<vectorized>", "exec")
+            code = new_code
+            report["rewrites"] = transformer.rewrites
+            report["remaining"] = analyze_code(code)
+    except Exception as e:
+        logging.warning(f"向量化改写失败，保留原始代码: {str(e)}")
+
+    return code, report
+
+
+def _request_llm_vectorization(code, remaining, context):
+    """
+    请求LLM将代码改写为向量化实现
+
+    Returns:
+        str或None: LLM返回的代码
+    """
+    try:
+        from pandasai.prompts.base import BasePrompt
+
+        class VectorizeCodePrompt(BasePrompt):
+            template = _VECTORIZE_PROMPT
+
+        patterns = ", ".join(sorted({hit["pattern"] for hit in remaining}))
+        llm = context.config.llm
+        with timed_stage("llm"):
+            return llm.generate_code(VectorizeCodePrompt(code=code, patterns=patterns), context)
+    except Exception as e:
+        logging.warning(f"请求LLM向量化代码失败: {str(e)}")
+        return None
+
+
+def _record(report):
+    """记录本次分析结果"""
+    _local.report = report
+    with _stats_lock:
+        pattern_stats.update(hit["pattern"] for hit in report["hits"])
+    if report["hits"]:
+        patterns = ", ".join(f"{hit['pattern']}@{hit['line']}" for hit in report["hits"])
+        logging.info(f"生成代码命中非向量化写法: {patterns}; 自动改写{report['rewrites']}处, "
+                     f"LLM重写: {report['llm_rewritten']}, 剩余{len(report['remaining'])}处")
+
+
+def pop_last_report():
+    """获取并清除当前线程上最近一次代码分析的报告"""
+    report = getattr(_local, "report", None)
+    _local.report = None
+    return report
+
+
+def get_pattern_stats():
+    """获取各模式的累计命中次数"""
+    with _stats_lock:
+        return dict(pattern_stats)
+
+
+def _patched_execute(original_execute):
+    """包装CodeCleaning.execute，在代码清理完成后执行向量化分析"""
+
+    def execute(self, input, **kwargs):
+        output = original_execute(self, input, **kwargs)
+        code = getattr(output, "output", None)
+        if not VECTORIZE_ENABLED or not isinstance(code, str):
+            return output
+
+        new_code, report = vectorize_code(code)
+        context = kwargs.get("context")
+        if report["remaining"] and VECTORIZE_LLM_RETRY and context is not None:
+            llm_code = _request_llm_vectorization(new_code, report["remaining"], context)
+            if llm_code:
+                try:
+                    # LLM返回的代码需要重新经过清理流程
+                    cleaned = original_execute(self, llm_code, **kwargs).output
+                    remaining = analyze_code(cleaned)
+                    compile(cleaned, "<vectorized>", "exec")
+                    if len(remaining) < len(report["remaining"]):
+                        new_code = cleaned
+                        report["remaining"] = remaining
+                        report["llm_rewritten"] = True
+                except Exception as e:
+                    logging.warning(f"LLM向量化代码不可用，保留原代码: {str(e)}")
+
+        output.output = new_code
+        if context is not None and hasattr(context, "add"):
+            context.add("vectorization_report", report)
+        _record(report)
+        return output
+
+    execute._vectorizer_patched = True
+    return execute
+
+
+def install_code_vectorizer():
+    """
+    为PandasAI的代码清理步骤安装向量化分析补丁
+
+    Returns:
+        bool: 是否成功安装
+    """
+    try:
+        from pandasai.pipelines.chat.code_cleaning import CodeCleaning
+
+        if not getattr(CodeCleaning.execute, "_vectorizer_patched", False):
+            CodeCleaning.execute = _patched_execute(CodeCleaning.execute)
+
+        logging.info(f"生成代码向量化分析已启用: LLM重写={VECTORIZE_LLM_RETRY}")
+        return True
+    except Exception as e:
+        logging.error(f"安装生成代码向量化补丁失败: {str(e)}")
+        return False
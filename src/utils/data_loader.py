@@ -1,4 +1,5 @@
 import os
+import json
 import pandas as pd
 from .language_utils import LanguageUtils
 
@@ -62,6 +63,31 @@ class DataLoader:
         except Exception as e:
             return None, LanguageUtils.get_text(language, "load_error", str(e)), False
     
+    @staticmethod
+    def profile_columns(dataframe, sample_size=3):
+        """
+        生成列概况（上传时计算一次，随会话快照保存，恢复会话时无需重新扫描数据）
+        
+        Args:
+            dataframe: 数据帧
+            sample_size: 每列保存的示例值数量
+            
+        Returns:
+            dict: {"rows": 行数, "columns": [{"name", "dtype", "nulls", "samples"}]}，可直接序列化为JSON
+        """
+        columns = []
+        for col in dataframe.columns:
+            series = dataframe[col]
+            samples = series.dropna().head(sample_size).tolist()
+            columns.append({
+                "name": str(col),
+                "dtype": str(series.dtype),
+                "nulls": int(series.isna().sum()),
+                # 日期等非JSON类型的示例值转换为字符串
+                "samples": json.loads(json.dumps(samples, ensure_ascii=False, default=str)),
+            })
+        return {"rows": len(dataframe), "columns": columns}
+    
     @staticmethod
     def generate_preview_html(dataframe, max_rows=500, language="zh"):
         """
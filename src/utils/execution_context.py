@@ -0,0 +1,217 @@
+"""
+单次问答的执行上下文
+每个问题在调用Agent前构建一个不可变的ExecutionContext（图表意图、回答语言、绘图参数、图表输出目录），
+在处理线程上随请求传递，PandasAI流水线中的补丁通过 current_execution() 读取，不再修改共享的Agent配置：
+- 生成代码的提示中追加本次的图表意图和回答语言
+- 执行生成的代码时应用本次的绘图参数（中文字体等）
+执行期间保存的图表路径记录在上下文中，取代按修改时间扫描图表目录（并行时会拿到别的请求的图表）。
+上下文只隔离单次问答的参数；Agent.chat会修改Agent自身的对话记忆和中间状态，
+同一个Agent上的问题仍需逐个处理，并行处理时每个线程使用独立的Agent（见batch_runner.py）
+"""
+import os
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+from .language_utils import LanguageUtils
+from .chart_spec import ChartSpecBuilder
+
+_local = threading.local()
+
+# matplotlib的pyplot状态机不是线程安全的，生成代码的执行阶段串行进行（调用LLM生成代码的阶段仍可并行）
+_code_execution_lock = threading.Lock()
+
+# 问题中已包含这些关键词时不再追加语言提示
+_ZH_HINT_KEYWORDS = ('中文', '请用中文', '用中文回答')
+_EN_HINT_KEYWORDS = ('english', 'in english', 'respond in english')
+
+# 追加到生成代码提示末尾的说明
+_CODE_HINT_NO_CHART = "Do not draw charts for this question; return a string, number or dataframe result."
+_CODE_HINT_CHART = "The user asked for a chart: draw it with matplotlib, save it as a PNG file and return a result of type \"plot\" with the file path."
+_CODE_HINT_LANGUAGE = {
+    "zh": "Write any text in the result (answers, titles, labels) in Simplified Chinese.",
+    "en": "Write any text in the result (answers, titles, labels) in English.",
+}
+
+
+@dataclass(frozen=True)
+class ExecutionContext:
+    """单次问答的执行参数（创建后不可修改）"""
+
+    # 用户的原始问题
+    question: str
+    # 发送给Agent的问题（追加了语言提示和图表规格提示）
+    prompt: str
+    # 回答语言: "zh" 或 "en"
+    response_language: str
+    # 用户是否明确要求绘图
+    chart_requested: bool
+    # 是否使用声明式图表规格（不在服务器端绘图）
+    use_chart_spec: bool
+    # 中文字体等绘图参数
+    plot_kwargs: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    # 图表文件的最终保存目录
+    output_dir: str = "charts"
+    # 执行期间保存的图表文件（由savefig补丁追加）
+    saved_charts: list = field(default_factory=list, compare=False, repr=False)
+
+    @property
+    def auto_vis(self):
+        """是否在服务器端生成图表"""
+        return self.chart_requested and not self.use_chart_spec
+
+    def latest_chart(self):
+        """执行期间最后保存的图表文件，没有时返回None"""
+        return self.saved_charts[-1] if self.saved_charts else None
+
+    def code_prompt_hints(self):
+        """追加到生成代码提示末尾的说明：图表意图和回答语言"""
+        hints = []
+        if not self.chart_requested:
+            hints.append(_CODE_HINT_NO_CHART)
+        elif self.auto_vis:
+            hints.append(_CODE_HINT_CHART)
+        # 声明式图表的要求已在问题中说明（见ChartSpecBuilder.build_prompt_hint）
+        hints.append(_CODE_HINT_LANGUAGE.get(self.response_language, _CODE_HINT_LANGUAGE["en"]))
+        return "\n".join(hints)
+
+
+def build_execution_context(question, chart_requested, use_chart_spec, plot_kwargs=None, output_dir="charts"):
+    """
+    根据用户问题构建执行上下文
+
+    Args:
+        question: 用户的原始问题
+        chart_requested: 用户是否明确要求绘图
+        use_chart_spec: 是否使用声明式图表规格
+        plot_kwargs: 绘图参数（初始化Agent时配置字体得到的结果）
+        output_dir: 图表文件的最终保存目录
+
+    Returns:
+        ExecutionContext: 执行上下文
+    """
+    # 根据提问的语言追加语言提示，确保用同一种语言回答
+    is_chinese = LanguageUtils.is_chinese(question)
+    prompt = question
+    lowered = question.lower()
+    if is_chinese:
+        if not any(keyword in lowered for keyword in _ZH_HINT_KEYWORDS):
+            prompt = f"{question}。请用中文回答。"
+    elif not any(keyword in lowered for keyword in _EN_HINT_KEYWORDS):
+        prompt = f"{question}. Please respond in English."
+
+    if use_chart_spec:
+        prompt = f"{prompt} {ChartSpecBuilder.build_prompt_hint(is_chinese)}"
+
+    return ExecutionContext(
+        question=question,
+        prompt=prompt,
+        response_language="zh" if is_chinese else "en",
+        chart_requested=bool(chart_requested),
+        use_chart_spec=bool(use_chart_spec),
+        plot_kwargs=MappingProxyType(dict(plot_kwargs or {})),
+        output_dir=output_dir,
+    )
+
+
+@contextmanager
+def execution_scope(context):
+    """在当前线程上激活执行上下文，结束时恢复之前的上下文"""
+    previous = getattr(_local, "context", None)
+    _local.context = context
+    try:
+        yield context
+    finally:
+        _local.context = previous
+
+
+def current_execution():
+    """获取当前线程上正在执行的上下文（没有时返回None）"""
+    return getattr(_local, "context", None)
+
+
+def _patched_savefig(original):
+    """包装Figure.savefig，把保存到文件路径的图表记录到当前执行上下文"""
+
+    def savefig(self, fname, *args, **kwargs):
+        result = original(self, fname, *args, **kwargs)
+        context = current_execution()
+        if context is not None and isinstance(fname, (str, os.PathLike)):
+            context.saved_charts.append(os.fspath(fname))
+        return result
+
+    savefig.__wrapped__ = original
+    savefig._execution_patched = True
+    return savefig
+
+
+def _patched_prompt_generation(original):
+    """包装PromptGeneration.execute，在生成代码的提示末尾追加当前执行上下文的图表意图和回答语言"""
+
+    def execute(self, *args, **kwargs):
+        output = original(self, *args, **kwargs)
+        context = current_execution()
+        prompt = getattr(output, "output", None)
+        if context is None or not hasattr(prompt, "to_string"):
+            return output
+
+        hints = context.code_prompt_hints()
+        render = prompt.to_string
+        # 只替换本次提示对象的to_string，不修改提示模板
+        prompt.to_string = lambda: f"{render()}\n\n{hints}"
+        return output
+
+    execute.__wrapped__ = original
+    execute._execution_patched = True
+    return execute
+
+
+def _patched_code_execution(original):
+    """包装CodeExecution.execute，并行问答时逐个执行生成的代码，执行期间应用当前上下文的绘图参数"""
+
+    def execute(self, *args, **kwargs):
+        context = current_execution()
+        with _code_execution_lock:
+            with _plot_style(context.plot_kwargs if context is not None else None):
+                return original(self, *args, **kwargs)
+
+    execute.__wrapped__ = original
+    execute._execution_patched = True
+    return execute
+
+
+def _plot_style(plot_kwargs):
+    """执行期间临时应用的matplotlib样式（rcParams），没有绘图参数时不做任何修改"""
+    if not plot_kwargs:
+        return nullcontext()
+    import matplotlib
+    return matplotlib.rc_context(dict(plot_kwargs))
+
+
+def install_execution_context():
+    """
+    为matplotlib的savefig安装图表记录补丁，在生成代码的提示中加入图表意图和回答语言，
+    并让PandasAI生成代码的执行串行进行（执行期间应用当前上下文的绘图参数）
+
+    Returns:
+        bool: 是否成功安装
+    """
+    try:
+        from matplotlib.figure import Figure
+        from pandasai.pipelines.chat.prompt_generation import PromptGeneration
+        from pandasai.pipelines.chat.code_execution import CodeExecution
+
+        if not getattr(Figure.savefig, "_execution_patched", False):
+            Figure.savefig = _patched_savefig(Figure.savefig)
+        if not getattr(PromptGeneration.execute, "_execution_patched", False):
+            PromptGeneration.execute = _patched_prompt_generation(PromptGeneration.execute)
+        if not getattr(CodeExecution.execute, "_execution_patched", False):
+            CodeExecution.execute = _patched_code_execution(CodeExecution.execute)
+
+        logging.info("执行上下文图表记录已启用")
+        return True
+    except Exception as e:
+        logging.error(f"安装执行上下文补丁失败: {str(e)}")
+        return False
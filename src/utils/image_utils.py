@@ -1,11 +1,12 @@
-import base64
 import os
 import shutil
 from typing import Optional
 
+from ..storage.chart_registry import chart_registry
+
 def image_to_base64(image_path: str) -> Optional[str]:
     """
-    将图片文件转换为Base64编码
+    将图片文件转换为Base64编码（按文件修改时间缓存，重复调用只需stat）
     
     Args:
         image_path: 图片文件路径
@@ -14,23 +15,7 @@ def image_to_base64(image_path: str) -> Optional[str]:
         Base64编码的字符串，如果失败则返回None
     """
     try:
-        if not os.path.exists(image_path):
-            return None
-            
-        with open(image_path, 'rb') as img_file:
-            # 读取图片文件
-            img_data = img_file.read()
-            
-            # 转换为Base64编码
-            base64_data = base64.b64encode(img_data).decode('utf-8')
-            
-            # 获取文件扩展名以确定MIME类型
-            ext = os.path.splitext(image_path)[1].lower()
-            mime_type = get_mime_type(ext)
-            
-            # 返回完整的data URL
-            return f"data:{mime_type};base64,{base64_data}"
-            
+        return chart_registry.data_uri(image_path)
     except Exception as e:
         print(f"图片转Base64失败: {str(e)}")
         return None
@@ -57,6 +42,39 @@ def get_mime_type(extension: str) -> str:
     
     return mime_types.get(extension.lower(), 'image/png')
 
+def get_image_url(image_path: str) -> Optional[str]:
+    """
+    获取图片的稳定访问URL
+    
+    图表按内容哈希注册一次，之后通过 /charts/<id> 提供并带长期缓存头；
+    图表路由未挂载时回退到Gradio文件服务（需在launch时通过allowed_paths放行图表目录）
+    
+    Args:
+        image_path: 图片文件路径
+        
+    Returns:
+        可在浏览器中访问的URL，文件不存在时返回None
+    """
+    return chart_registry.url_for(image_path)
+
+def create_thumbnail_markdown(image_path: str, alt_text: str = "Chart") -> str:
+    """
+    创建图表缩略图的Markdown（用于聊天框和历史记录表格）
+    
+    Args:
+        image_path: 原始图表文件路径
+        alt_text: 图片替代文本
+        
+    Returns:
+        Markdown图片字符串，没有缩略图时返回空字符串
+    """
+    from ..storage.chart_optimizer import chart_optimizer
+    
+    thumbnail_path = chart_optimizer.get_thumbnail(image_path)
+    if not thumbnail_path:
+        return ""
+    return f"![{alt_text}]({get_image_url(thumbnail_path)})"
+
 def copy_to_public_dir(image_path: str) -> Optional[str]:
     """
     将图片复制到public目录以便通过HTTP访问
@@ -89,83 +107,48 @@ def copy_to_public_dir(image_path: str) -> Optional[str]:
         print(f"复制图片到public目录失败: {str(e)}")
         return None
 
-def create_image_html(image_path: str, alt_text: str = "Chart", max_width: str = "100%") -> str:
+def create_image_html(image_path: str, alt_text: str = "Chart", max_width: str = "100%", chart_id: Optional[str] = None) -> str:
     """
-    创建包含图片的HTML代码，使用多种fallback方案
+    创建包含图片的HTML代码
+    
+    优先使用按内容哈希生成的稳定URL，浏览器可直接复用缓存；
+    无法生成URL时使用缓存的Base64数据。重复调用只会stat图片文件，
+    传入已保存的chart_id时不访问文件
     
     Args:
         image_path: 图片文件路径
         alt_text: 图片替代文本
         max_width: 图片最大宽度
+        chart_id: 记录中保存的图表内容ID（可选）
         
     Returns:
         HTML代码字符串
     """
-    if not os.path.exists(image_path):
+    if chart_id:
+        src = chart_registry.url_for_id(chart_id, image_path)
+    else:
+        src = get_image_url(image_path) or image_to_base64(image_path)
+    if not src:
         return f'<p style="color: red;">图片文件不存在: {image_path}</p>'
     
-    # 方案1: 尝试Gradio file service
-    absolute_path = os.path.abspath(image_path)
-    gradio_file_url = f"/file={absolute_path}"
-    
-    # 方案2: 复制到public目录
-    public_url = copy_to_public_dir(image_path)
-    
-    # 方案3: Base64编码
-    base64_data = image_to_base64(image_path)
-    
-    # 构建HTML，按优先级使用不同方案
-    html_parts = []
-    
-    if public_url:
-        html_parts.append(f'<img src="{public_url}" alt="{alt_text}" style="max-width:{max_width}; height:auto; margin-top:10px;" />')
-    
-    if base64_data:
-        html_parts.append(f'<img src="{base64_data}" alt="{alt_text}" style="max-width:{max_width}; height:auto; margin-top:10px;" />')
-    
-    # Gradio file service作为fallback
-    html_parts.append(f'<img src="{gradio_file_url}" alt="{alt_text}" style="max-width:{max_width}; height:auto; margin-top:10px;" />')
-    
-    # 创建带有多个fallback的HTML
-    if len(html_parts) > 1:
-        return f'''
-        <div class="chart-container">
-            {html_parts[0]}
-            <script>
-                // 如果图片加载失败，尝试其他方案
-                document.querySelectorAll('.chart-container img').forEach((img, index) => {{
-                    img.onerror = function() {{
-                        if (index < {len(html_parts) - 1}) {{
-                            this.style.display = 'none';
-                            // 尝试下一个图片
-                        }}
-                    }};
-                }});
-            </script>
-        </div>
-        '''
-    else:
-        return html_parts[0]
+    return f'<img src="{src}" alt="{alt_text}" loading="lazy" style="max-width:{max_width}; height:auto; margin-top:10px;" />'
 
-def create_markdown_image(image_path: str, alt_text: str = "Chart") -> str:
+def create_markdown_image(image_path: str, alt_text: str = "Chart", chart_id: Optional[str] = None) -> str:
     """
     创建Markdown格式的图片链接（适用于Gradio）
     
     Args:
         image_path: 图片文件路径
         alt_text: 图片替代文本
+        chart_id: 记录中保存的图表内容ID（可选，提供时不访问文件）
         
     Returns:
         Markdown格式的图片字符串
     """
-    if not os.path.exists(image_path):
+    if chart_id:
+        return f"![{alt_text}]({chart_registry.url_for_id(chart_id, image_path)})"
+    image_url = get_image_url(image_path)
+    if not image_url:
         return f"**图片文件不存在**: {image_path}"
     
-    # 尝试复制到public目录
-    public_url = copy_to_public_dir(image_path)
-    if public_url:
-        return f"![{alt_text}]({public_url})"
-    
-    # Fallback: 使用绝对路径
-    absolute_path = os.path.abspath(image_path).replace('\\', '/')
-    return f"![{alt_text}](file://{absolute_path})" 
\ No newline at end of file
+    return f"![{alt_text}]({image_url})" 
\ No newline at end of file
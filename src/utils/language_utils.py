@@ -55,6 +55,7 @@ class LanguageUtils:
             "history_answer": "回答",
             "chart_action": "图表操作",
             "load_record_action": "点击加载数据",
+            "load_more_history": "加载更多记录",
             "delete_action": "删除操作",
             "delete_session_button": "删除当前会话",
             "delete_all_button": "清空所有记录",
@@ -63,8 +64,56 @@ class LanguageUtils:
             "session_history_deleted": "已删除当前会话记录",
             "record_deleted": "已删除选中记录",
             "record_delete_failed": "删除记录失败",
+            "record_changed": "表格中的记录已变化，请刷新后重试",
+            "history_save_failed": "本次问答未能保存到对话记录",
             "session_history_delete_failed": "删除会话记录失败",
             "all_history_deleted": "已清空所有对话记录",
+            "deleting_history_progress": "正在删除对话记录: {0}/{1}",
+            "result_table_summary": "查询结果为表格",
+            "result_table_view_below": "完整结果可在下方“结果数据”区域分页查看",
+            "result_data": "结果数据",
+            "no_result_table": "没有表格结果",
+            "result_page_info": "第 {0}/{1} 页，共 {2} 行",
+            "prev_page": "上一页",
+            "next_page": "下一页",
+            "request_stats": "性能统计",
+            "stats_period": "统计范围",
+            "stats_period_24h": "最近24小时",
+            "stats_period_7d": "最近7天",
+            "stats_period_30d": "最近30天",
+            "refresh_stats": "刷新统计",
+            "no_request_stats": "暂无请求统计数据",
+            "stats_provider": "提供方",
+            "stats_model": "模型",
+            "stats_metric": "指标",
+            "stats_count": "请求数",
+            "stats_avg": "平均",
+            "stats_max": "最大",
+            "metric_queue_ms": "排队时间(ms)",
+            "metric_llm_ms": "LLM延迟(ms)",
+            "metric_exec_ms": "代码执行(ms)",
+            "metric_chart_ms": "图表渲染保存(ms)",
+            "metric_upload_ms": "OSS上传(ms)",
+            "metric_total_ms": "总耗时(ms)",
+            "metric_prompt_tokens": "提示token数",
+            "metric_completion_tokens": "生成token数",
+            "metric_retries": "重试次数",
+            "history_transfer": "导出/导入对话记录",
+            "export_format": "导出格式",
+            "export_history_button": "导出对话记录",
+            "import_history_button": "导入对话记录",
+            "export_bundle_file": "导出包",
+            "import_bundle_file": "选择要导入的导出包 (.zip)",
+            "transfer_table_sessions": "会话",
+            "transfer_table_result_blobs": "表格结果",
+            "transfer_table_chat_history": "对话记录",
+            "exporting_history_progress": "正在导出{0}: {1}/{2}",
+            "importing_history_progress": "正在导入{0}: {1}/{2}",
+            "history_exported": "已导出 {0} 条对话记录",
+            "history_imported": "已导入 {0} 条对话记录，跳过已存在的 {1} 条",
+            "history_transfer_failed": "导出/导入失败: {0}",
+            "session_resumed": "已恢复会话数据（{0} 行）和 {1} 模型，耗时 {2:.1f} 秒",
+            "session_data_unavailable": "会话数据已不在缓存中，如需继续提问请重新上传数据文件",
             "all_history_delete_failed": "清空所有记录失败",
             "confirm_delete_session": "确定要删除当前会话的所有记录吗？",
             "confirm_delete_all": "确定要清空所有对话记录吗？",
@@ -89,10 +138,39 @@ class LanguageUtils:
             "chart_tag": "[图表]",
             "delete_this_record": "删除此条",
             "search_question": "搜索问题",
-            "search_placeholder": "输入问题关键词进行搜索",
+            "search_placeholder": "输入关键词搜索问题和回答，多个关键词用空格分隔",
             "search_button": "搜索",
             "search_results": "搜索结果",
-            "no_search_results": "未找到匹配的记录"
+            "no_search_results": "未找到匹配的记录",
+            "chart_output_mode": "图表输出模式",
+            "chart_mode_image": "图片（服务器渲染）",
+            "chart_mode_spec": "交互式（浏览器渲染）",
+            "interactive_chart": "交互式图表",
+            "chart_spec_generated": "已生成交互式图表（{0}行聚合数据）",
+            "export_png_button": "导出PNG",
+            "no_chart_spec": "当前没有可导出的交互式图表",
+            "batch_tab": "批量问题",
+            "batch_questions_input": "问题清单（每行一个问题）",
+            "batch_questions_placeholder": "每行输入一个问题，以#开头的行会被忽略",
+            "batch_questions_file": "或上传问题清单 (.txt / .csv)",
+            "batch_parallelism": "并发数",
+            "batch_run_button": "开始批量运行",
+            "batch_report_file": "汇总报告 (HTML/ZIP)",
+            "batch_no_questions": "请输入或上传至少一个问题",
+            "batch_progress": "正在批量运行: 已完成 {0}/{1}",
+            "batch_completed": "批量运行完成: 成功 {0}/{1}，耗时 {2:.1f} 秒",
+            "batch_failed": "批量运行失败: {0}",
+            "batch_status_pending": "等待中",
+            "batch_status_ok": "完成",
+            "batch_status_error": "失败",
+            "batch_col_status": "状态",
+            "batch_col_elapsed": "耗时(秒)",
+            "batch_report_title": "批量分析报告",
+            "batch_report_failed": "处理失败",
+            "batch_report_full_table": "完整表格 (CSV)",
+            "batch_report_generated_at": "生成时间",
+            "batch_report_model": "模型",
+            "batch_report_data": "数据文件"
         },
         "en": {
             "title": "Pandas AI Web - Data Conversation Assistant",
@@ -146,6 +224,7 @@ class LanguageUtils:
             "history_answer": "Answer",
             "chart_action": "Chart Action",
             "load_record_action": "Click to Load Data",
+            "load_more_history": "Load More Records",
             "delete_action": "Delete Action",
             "delete_session_button": "Delete Current Session",
             "delete_all_button": "Clear All History",
@@ -154,8 +233,56 @@ class LanguageUtils:
             "session_history_deleted": "Session history deleted",
             "record_deleted": "Selected record deleted",
             "record_delete_failed": "Failed to delete record",
+            "record_changed": "The history table has changed, please refresh and try again",
+            "history_save_failed": "This answer could not be saved to the chat history",
             "session_history_delete_failed": "Failed to delete session history",
             "all_history_deleted": "All history cleared",
+            "deleting_history_progress": "Deleting history: {0}/{1}",
+            "result_table_summary": "The result is a table",
+            "result_table_view_below": "Browse the full result page by page in the \"Result Data\" section below",
+            "result_data": "Result Data",
+            "no_result_table": "No table result",
+            "result_page_info": "Page {0}/{1}, {2} rows in total",
+            "prev_page": "Previous",
+            "next_page": "Next",
+            "request_stats": "Performance",
+            "stats_period": "Time range",
+            "stats_period_24h": "Last 24 hours",
+            "stats_period_7d": "Last 7 days",
+            "stats_period_30d": "Last 30 days",
+            "refresh_stats": "Refresh stats",
+            "no_request_stats": "No request statistics yet",
+            "stats_provider": "Provider",
+            "stats_model": "Model",
+            "stats_metric": "Metric",
+            "stats_count": "Requests",
+            "stats_avg": "Avg",
+            "stats_max": "Max",
+            "metric_queue_ms": "Queue time (ms)",
+            "metric_llm_ms": "LLM latency (ms)",
+            "metric_exec_ms": "Code execution (ms)",
+            "metric_chart_ms": "Chart render/save (ms)",
+            "metric_upload_ms": "OSS upload (ms)",
+            "metric_total_ms": "Total (ms)",
+            "metric_prompt_tokens": "Prompt tokens",
+            "metric_completion_tokens": "Completion tokens",
+            "metric_retries": "Retries",
+            "history_transfer": "Export / Import History",
+            "export_format": "Export format",
+            "export_history_button": "Export history",
+            "import_history_button": "Import history",
+            "export_bundle_file": "Export bundle",
+            "import_bundle_file": "Select an export bundle to import (.zip)",
+            "transfer_table_sessions": "sessions",
+            "transfer_table_result_blobs": "table results",
+            "transfer_table_chat_history": "history records",
+            "exporting_history_progress": "Exporting {0}: {1}/{2}",
+            "importing_history_progress": "Importing {0}: {1}/{2}",
+            "history_exported": "Exported {0} history records",
+            "history_imported": "Imported {0} history records, skipped {1} existing",
+            "history_transfer_failed": "Export/import failed: {0}",
+            "session_resumed": "Session data ({0} rows) and {1} model restored in {2:.1f}s",
+            "session_data_unavailable": "Session data is no longer cached; re-upload the data file to continue asking questions",
             "all_history_delete_failed": "Failed to clear all history",
             "confirm_delete_session": "Are you sure you want to delete all records for this session?",
             "confirm_delete_all": "Are you sure you want to clear all conversation history?",
@@ -180,10 +307,39 @@ class LanguageUtils:
             "chart_tag": "[Chart]",
             "delete_this_record": "Delete",
             "search_question": "Search Question",
-            "search_placeholder": "Enter keywords to search questions",
+            "search_placeholder": "Search questions and answers; separate multiple keywords with spaces",
             "search_button": "Search",
             "search_results": "Search Results",
-            "no_search_results": "No matching records found"
+            "no_search_results": "No matching records found",
+            "chart_output_mode": "Chart Output Mode",
+            "chart_mode_image": "Image (server rendered)",
+            "chart_mode_spec": "Interactive (browser rendered)",
+            "interactive_chart": "Interactive Chart",
+            "chart_spec_generated": "Interactive chart generated ({0} rows of aggregated data)",
+            "export_png_button": "Export PNG",
+            "no_chart_spec": "No interactive chart to export",
+            "batch_tab": "Batch Questions",
+            "batch_questions_input": "Question list (one question per line)",
+            "batch_questions_placeholder": "Enter one question per line; lines starting with # are ignored",
+            "batch_questions_file": "Or upload a question list (.txt / .csv)",
+            "batch_parallelism": "Parallelism",
+            "batch_run_button": "Run batch",
+            "batch_report_file": "Combined report (HTML/ZIP)",
+            "batch_no_questions": "Please enter or upload at least one question",
+            "batch_progress": "Running batch: {0}/{1} completed",
+            "batch_completed": "Batch completed: {0}/{1} succeeded in {2:.1f}s",
+            "batch_failed": "Batch run failed: {0}",
+            "batch_status_pending": "Pending",
+            "batch_status_ok": "Done",
+            "batch_status_error": "Failed",
+            "batch_col_status": "Status",
+            "batch_col_elapsed": "Time (s)",
+            "batch_report_title": "Batch Analysis Report",
+            "batch_report_failed": "Failed",
+            "batch_report_full_table": "Full table (CSV)",
+            "batch_report_generated_at": "Generated at",
+            "batch_report_model": "Model",
+            "batch_report_data": "Data file"
         }
     }
     
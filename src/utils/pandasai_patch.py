@@ -4,6 +4,11 @@ PandasAI补丁模块，用于修复库中的问题
 import uuid
 import logging
 
+from .plot_downsampler import install_plot_downsampling
+from .code_vectorizer import install_code_vectorizer
+from .request_timing import install_request_timing
+from .execution_context import install_execution_context
+
 def apply_patches():
     """应用所有PandasAI补丁"""
     logging.info("正在应用PandasAI补丁...")
@@ -21,7 +26,35 @@ def apply_patches():
         logging.info("✓ 成功修复PandasAI的Series序列化问题")
     else:
         logging.warning("⚠ 无法应用PandasAI的Series序列化补丁")
-    
+
+    # 为大数据量图表安装降采样补丁（对LLM生成代码和直接绘图都生效）
+    fixed = install_plot_downsampling()
+    if fixed:
+        logging.info("✓ 成功安装绘图降采样补丁")
+    else:
+        logging.warning("⚠ 无法安装绘图降采样补丁")
+
+    # 在生成代码执行前检测并改写非向量化写法
+    fixed = install_code_vectorizer()
+    if fixed:
+        logging.info("✓ 成功安装生成代码向量化补丁")
+    else:
+        logging.warning("⚠ 无法安装生成代码向量化补丁")
+
+    # 记录代码生成、代码执行和图表保存的耗时
+    fixed = install_request_timing()
+    if fixed:
+        logging.info("✓ 成功安装请求耗时采集补丁")
+    else:
+        logging.warning("⚠ 无法安装请求耗时采集补丁")
+
+    # 把执行期间保存的图表记录到当前请求的执行上下文
+    fixed = install_execution_context()
+    if fixed:
+        logging.info("✓ 成功安装执行上下文补丁")
+    else:
+        logging.warning("⚠ 无法安装执行上下文补丁")
+
     logging.info("补丁应用完成")
 
 def fix_prompt_id_issue():
@@ -0,0 +1,248 @@
+"""
+大数据量绘图预处理模块
+在matplotlib的Axes层面拦截折线图和散点图，对超大序列自动降采样：
+- 折线图使用 Largest-Triangle-Three-Buckets (LTTB) 算法保留形状特征
+- 散点图超过阈值时替换为 hexbin 或 2D 直方图
+由于补丁作用于 Axes.plot / Axes.scatter，LLM生成的代码和直接调用matplotlib的渲染逻辑都会经过这里
+"""
+import os
+import logging
+
+# 折线图单条序列的最大点数，超过则使用LTTB降采样
+LINE_MAX_POINTS = int(os.getenv("CHART_LINE_MAX_POINTS", "5000"))
+# 散点图的最大点数，超过则替换为密度图
+SCATTER_MAX_POINTS = int(os.getenv("CHART_SCATTER_MAX_POINTS", "20000"))
+# 散点图替换方式: hexbin 或 hist2d
+SCATTER_DENSITY_MODE = os.getenv("CHART_SCATTER_DENSITY_MODE", "hexbin").lower()
+# 密度图网格大小
+DENSITY_GRID_SIZE = int(os.getenv("CHART_DENSITY_GRID_SIZE", "80"))
+
+# 散点图替换为密度图时可以透传的参数
+_DENSITY_PASSTHROUGH_KWARGS = ("alpha", "cmap", "norm", "vmin", "vmax", "label", "zorder")
+
+
+def _to_numeric(values):
+    """
+    将x轴数据转换为可参与计算的浮点数组
+
+    Args:
+        values: 任意数组（数值、datetime64、pandas索引等）
+
+    Returns:
+        numpy.ndarray或None: 浮点数组，无法转换时返回None
+    """
+    import numpy as np
+
+    arr = np.asarray(values)
+    if arr.dtype.kind == "M":
+        return arr.astype("datetime64[ns]").astype("int64").astype(float)
+    if arr.dtype.kind == "m":
+        return arr.astype("timedelta64[ns]").astype("int64").astype(float)
+    if arr.dtype.kind in "biuf":
+        return arr.astype(float)
+    return None
+
+
+def lttb_indices(x, y, n_out):
+    """
+    使用 Largest-Triangle-Three-Buckets 算法计算需要保留的点的下标
+
+    Args:
+        x: 单调的x轴浮点数组
+        y: y轴浮点数组
+        n_out: 输出点数
+
+    Returns:
+        numpy.ndarray: 保留点的下标（升序）
+    """
+    import numpy as np
+
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    # 中间的点均分到 n_out - 2 个桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    selected = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # 下一个桶的平均点作为三角形的第三个顶点
+        next_start = edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = next_start + 1
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        ax, ay = x[selected], y[selected]
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+
+        # 计算三角形面积（省略常数1/2），选择面积最大的点
+        areas = np.abs((ax - avg_x) * (bucket_y - ay) - (ax - bucket_x) * (avg_y - ay))
+        selected = start + int(np.argmax(areas))
+        indices[i + 1] = selected
+
+    return indices
+
+
+def downsample_line(x, y, max_points=None):
+    """
+    对一条折线序列进行LTTB降采样
+
+    Args:
+        x: x轴数据，可以为None（表示使用下标；y为Series时使用其索引）
+        y: y轴数据
+        max_points: 最大点数，默认使用 CHART_LINE_MAX_POINTS
+
+    Returns:
+        tuple: (x, y, 是否进行了降采样)
+    """
+    import numpy as np
+
+    max_points = max_points or LINE_MAX_POINTS
+    y_arr = np.asarray(y)
+    if y_arr.ndim != 1 or len(y_arr) <= max_points:
+        return x, y, False
+
+    y_num = _to_numeric(y_arr)
+    if y_num is None:
+        return x, y, False
+
+    index = getattr(y, "index", None)
+    if x is None and index is not None and not callable(index):
+        # matplotlib对单独传入的Series使用其索引作为x轴，降采样后需保留对应的索引值
+        x = index
+
+    if x is None:
+        x_num = np.arange(len(y_arr), dtype=float)
+    else:
+        x_arr = np.asarray(x)
+        if x_arr.ndim != 1 or len(x_arr) != len(y_arr):
+            return x, y, False
+        x_num = _to_numeric(x_arr)
+        if x_num is None:
+            return x, y, False
+        # LTTB要求x单调递增，无序数据不做处理
+        if np.any(np.diff(x_num) < 0):
+            return x, y, False
+
+    # 缺失值无法参与面积计算，先剔除
+    finite = np.isfinite(x_num) & np.isfinite(y_num)
+    if not finite.all():
+        keep = np.flatnonzero(finite)
+        idx = keep[lttb_indices(x_num[keep], y_num[keep], max_points)]
+    else:
+        idx = lttb_indices(x_num, y_num, max_points)
+
+    new_x = np.asarray(x)[idx] if x is not None else idx
+    return new_x, y_arr[idx], True
+
+
+def _split_plot_args(args):
+    """
+    解析 Axes.plot 的位置参数，仅支持单条序列的常见写法
+
+    Returns:
+        tuple: (x, y, fmt) 无法安全解析时返回None
+    """
+    if len(args) == 1:
+        return None, args[0], None
+    if len(args) == 2:
+        if isinstance(args[1], str):
+            return None, args[0], args[1]
+        return args[0], args[1], None
+    if len(args) == 3 and isinstance(args[2], str):
+        return args[0], args[1], args[2]
+    return None
+
+
+def _patched_plot(original_plot):
+    """包装 Axes.plot，对超长折线做LTTB降采样"""
+    def plot(self, *args, **kwargs):
+        try:
+            if "data" not in kwargs:
+                parsed = _split_plot_args(args)
+                if parsed is not None:
+                    x, y, fmt = parsed
+                    new_x, new_y, changed = downsample_line(x, y)
+                    if changed:
+                        logging.info(f"折线图降采样: {len(y)} -> {len(new_y)} 个点")
+                        # 原本使用下标作为x轴时，降采样后需要显式传入保留点的下标
+                        new_args = (new_x, new_y)
+                        if fmt is not None:
+                            new_args = new_args + (fmt,)
+                        return original_plot(self, *new_args, **kwargs)
+        except Exception as e:
+            logging.warning(f"折线图降采样失败，使用原始数据绘制: {e}")
+        return original_plot(self, *args, **kwargs)
+
+    plot.__wrapped__ = original_plot
+    plot._downsampling_patched = True
+    return plot
+
+
+def _patched_scatter(original_scatter):
+    """包装 Axes.scatter，对超大散点图改用密度图"""
+    def scatter(self, x, y, *args, **kwargs):
+        try:
+            import numpy as np
+
+            if not args and "data" not in kwargs and np.ndim(x) == 1 and len(x) > SCATTER_MAX_POINTS:
+                x_num = _to_numeric(x)
+                y_num = _to_numeric(y)
+                if x_num is not None and y_num is not None and len(x_num) == len(y_num):
+                    logging.info(f"散点图点数 {len(x_num)} 超过阈值 {SCATTER_MAX_POINTS}，改用{SCATTER_DENSITY_MODE}")
+                    density_kwargs = {k: kwargs[k] for k in _DENSITY_PASSTHROUGH_KWARGS if k in kwargs}
+
+                    if SCATTER_DENSITY_MODE == "hist2d":
+                        finite = np.isfinite(x_num) & np.isfinite(y_num)
+                        density_kwargs.pop("label", None)
+                        _, _, _, image = self.hist2d(
+                            x_num[finite], y_num[finite], bins=DENSITY_GRID_SIZE, cmin=1, **density_kwargs
+                        )
+                        return image
+
+                    # 散点颜色为数值数组时，使用每个格子的均值着色
+                    c = kwargs.get("c")
+                    if c is not None and np.ndim(c) == 1 and len(c) == len(x_num) and _to_numeric(c) is not None:
+                        density_kwargs["C"] = _to_numeric(c)
+                        density_kwargs["reduce_C_function"] = np.mean
+                    return self.hexbin(x_num, y_num, gridsize=DENSITY_GRID_SIZE, mincnt=1, **density_kwargs)
+        except Exception as e:
+            logging.warning(f"散点图密度替换失败，使用原始数据绘制: {e}")
+        return original_scatter(self, x, y, *args, **kwargs)
+
+    scatter.__wrapped__ = original_scatter
+    scatter._downsampling_patched = True
+    return scatter
+
+
+def install_plot_downsampling():
+    """
+    为matplotlib安装绘图降采样补丁
+
+    Returns:
+        bool: 是否成功安装
+    """
+    try:
+        from matplotlib.axes import Axes
+
+        if not getattr(Axes.plot, "_downsampling_patched", False):
+            Axes.plot = _patched_plot(Axes.plot)
+        if not getattr(Axes.scatter, "_downsampling_patched", False):
+            Axes.scatter = _patched_scatter(Axes.scatter)
+
+        logging.info(
+            f"绘图降采样已启用: 折线最多{LINE_MAX_POINTS}点, 散点超过{SCATTER_MAX_POINTS}点改用{SCATTER_DENSITY_MODE}"
+        )
+        return True
+    except Exception as e:
+        logging.error(f"安装绘图降采样补丁失败: {str(e)}")
+        return False
@@ -0,0 +1,196 @@
+"""
+请求耗时与用量采集模块
+每个问题在处理线程上对应一个RequestTimer，各阶段通过 timed_stage 计时：
+- llm: PandasAI生成代码（以及向量化重写）时调用LLM的时间
+- exec: 执行生成代码的时间
+- chart: 保存图表（savefig）和生成展示图/缩略图的时间
+- upload: 上传图表到OSS的时间
+阶段可以嵌套，内层阶段的时间不会重复计入外层阶段（例如执行代码期间的savefig只计入chart）。
+LLM返回的token用量通过 record_tokens 累加
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# 记录的阶段
+STAGES = ("queue", "llm", "exec", "chart", "upload")
+
+_local = threading.local()
+
+
+class RequestTimer:
+    """单个请求的阶段耗时（毫秒）、token用量和重试次数"""
+
+    def __init__(self, queue_ms=0.0):
+        self.timings = {stage: 0.0 for stage in STAGES}
+        self.timings["queue"] = max(queue_ms, 0.0)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self._started = time.perf_counter()
+        # 正在计时的阶段: [阶段名, 开始时间, 内层阶段耗时]
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        """对一个阶段计时，嵌套的内层阶段时间从外层扣除"""
+        frame = [name, time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = (time.perf_counter() - frame[1]) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed - frame[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def add_tokens(self, prompt_tokens, completion_tokens):
+        """累加token用量"""
+        self.prompt_tokens += int(prompt_tokens or 0)
+        self.completion_tokens += int(completion_tokens or 0)
+
+    def total_ms(self):
+        """从排队开始到现在的总耗时（毫秒）"""
+        return self.timings["queue"] + (time.perf_counter() - self._started) * 1000
+
+    def to_metrics(self):
+        """
+        转换为写入数据库的指标字典
+
+        Returns:
+            dict: queue_ms, llm_ms, exec_ms, chart_ms, upload_ms, total_ms, prompt_tokens, completion_tokens, retries
+        """
+        metrics = {f"{stage}_ms": round(self.timings[stage], 1) for stage in STAGES}
+        metrics["total_ms"] = round(self.total_ms(), 1)
+        metrics["prompt_tokens"] = self.prompt_tokens
+        metrics["completion_tokens"] = self.completion_tokens
+        metrics["retries"] = self.retries
+        return metrics
+
+
+def start_request(queue_ms=0.0):
+    """
+    开始记录当前线程上的一个请求
+
+    Args:
+        queue_ms: 请求开始处理前的排队时间（毫秒）
+
+    Returns:
+        RequestTimer: 当前请求的计时器
+    """
+    timer = RequestTimer(queue_ms)
+    _local.timer = timer
+    return timer
+
+
+def finish_request():
+    """
+    结束当前线程上的请求
+
+    Returns:
+        RequestTimer或None: 结束的计时器
+    """
+    timer = getattr(_local, "timer", None)
+    _local.timer = None
+    return timer
+
+
+def current_request():
+    """获取当前线程上正在记录的请求（没有时返回None）"""
+    return getattr(_local, "timer", None)
+
+
+@contextmanager
+def timed_stage(name):
+    """对当前请求的一个阶段计时，当前线程没有正在记录的请求时不做任何事"""
+    timer = current_request()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def record_tokens(prompt_tokens, completion_tokens):
+    """把一次LLM调用的token用量计入当前请求"""
+    timer = current_request()
+    if timer is not None:
+        timer.add_tokens(prompt_tokens, completion_tokens)
+
+
+class _UsageRecordingClient:
+    """包装OpenAI客户端的completions对象，从响应的usage中记录token用量"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def create(self, *args, **kwargs):
+        response = self._client.create(*args, **kwargs)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_tokens(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+        return response
+
+
+def instrument_llm(llm):
+    """
+    为OpenAI/Azure LLM实例记录token用量（Ollama在CustomOllamaLLM中直接记录）
+
+    Args:
+        llm: LLM实例
+
+    Returns:
+        LLM实例
+    """
+    client = getattr(llm, "client", None)
+    if client is not None and hasattr(client, "create") and not isinstance(client, _UsageRecordingClient):
+        try:
+            llm.client = _UsageRecordingClient(client)
+        except Exception as e:
+            logging.warning(f"无法记录LLM的token用量: {str(e)}")
+    return llm
+
+
+def _patched_stage(original, stage):
+    """包装一个函数，调用期间计入指定阶段"""
+
+    def wrapper(*args, **kwargs):
+        with timed_stage(stage):
+            return original(*args, **kwargs)
+
+    wrapper.__wrapped__ = original
+    wrapper._timing_patched = True
+    return wrapper
+
+
+def install_request_timing():
+    """
+    为PandasAI的代码生成/执行步骤和matplotlib的savefig安装计时补丁
+
+    Returns:
+        bool: 是否成功安装
+    """
+    try:
+        from pandasai.pipelines.chat.code_generator import CodeGenerator
+        from pandasai.pipelines.chat.code_execution import CodeExecution
+        from matplotlib.figure import Figure
+
+        for owner, attr, stage in (
+            (CodeGenerator, "execute", "llm"),
+            (CodeExecution, "execute", "exec"),
+            (Figure, "savefig", "chart"),
+        ):
+            original = getattr(owner, attr)
+            if not getattr(original, "_timing_patched", False):
+                setattr(owner, attr, _patched_stage(original, stage))
+
+        logging.info("请求耗时采集已启用")
+        return True
+    except Exception as e:
+        logging.error(f"安装请求耗时采集补丁失败: {str(e)}")
+        return False
@@ -1,7 +1,7 @@
 """
 应用启动文件，使用share=False参数避免Gradio下载frpc文件
 """
-from src.app import main
+from src.app import main, launch_interface
 
 if __name__ == "__main__":
     # 重定义main函数
@@ -29,7 +29,7 @@ if __name__ == "__main__":
         
         # 启动应用 - 使用share=False避免下载frpc
         print("使用本地URL启动应用（不创建共享链接）...")
-        interface.launch(share=False)
+        launch_interface(interface, share=False)
     
     # 替换main函数并运行
     patched_main() 
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+代码向量化改写的单元测试
+在同一个DataFrame上分别执行原始代码和改写后的代码，比较结果是否一致
+"""
+import pandas as pd
+import pytest
+
+from src.utils.code_vectorizer import analyze_code, vectorize_code
+
+
+def _sample_df():
+    return pd.DataFrame({
+        "a": [5, -1, 3, 0],
+        "b": [1.5, 2.0, -0.5, 4.0],
+        "name": ["x", "y", "z", "w"],
+    })
+
+
+def _run(code):
+    """执行代码并返回其中的 df 和 result"""
+    namespace = {"pd": pd, "df": _sample_df()}
+    exec(code, namespace)
+    return namespace["df"], namespace.get("result")
+
+
+def _assert_same_result(code):
+    """改写后的代码与原始代码结果一致，且确实发生了改写"""
+    new_code, report = vectorize_code(code)
+    assert report["rewrites"] > 0, new_code
+    original_df, original = _run(code)
+    rewritten_df, rewritten = _run(new_code)
+    if original is not None:
+        assert list(rewritten) == list(original)
+    pd.testing.assert_frame_equal(rewritten_df.astype(object), original_df.astype(object))
+    return new_code
+
+
+@pytest.mark.parametrize("code", [
+    # 数值列与字符串常量混合的分支，不能被np.where提升为字符串
+    "result = df.apply(lambda r: r['a'] if r['a'] > 0 else 'neg', axis=1)",
+    "result = df.apply(lambda r: 'pos' if r['a'] > 0 else r['a'], axis=1)",
+    "result = df['a'].apply(lambda v: v if v > 0 else 'neg')",
+    "result = df['a'].map(lambda v: 'big' if v > 3 else ('small' if v > 0 else v))",
+    # 两个分支都是数值或都是列引用
+    "result = df.apply(lambda r: 1 if r['a'] > 0 else -1, axis=1)",
+    "result = df.apply(lambda r: r['a'] if r['a'] > r['b'] else r['b'], axis=1)",
+    "result = df.apply(lambda r: r['a'] * 2 if r['b'] > 0 else 0, axis=1)",
+    # 算术表达式
+    "result = df.apply(lambda r: r['a'] * r['b'] + 1, axis=1)",
+    "result = df['a'].apply(lambda v: v % 2)",
+])
+def test_apply_lambda_rewrite_matches_original(code):
+    _assert_same_result(code)
+
+
+def test_mixed_branches_keep_original_values():
+    new_code = _assert_same_result("result = df.apply(lambda r: r['a'] if r['a'] > 0 else 'neg', axis=1)")
+    assert "np.where" not in new_code
+    _, result = _run(new_code)
+    assert list(result) == [5, "neg", 3, "neg"]
+
+
+def test_iterrows_column_assignment():
+    code = (
+        "for idx, row in df.iterrows():\n"
+        "    df.at[idx, 'c'] = row['a'] + row['b']\n"
+    )
+    _assert_same_result(code)
+
+
+def test_iterrows_list_append():
+    code = (
+        "result = []\n"
+        "for idx, row in df.iterrows():\n"
+        "    result.append(row['a'] if row['a'] > 0 else 'neg')\n"
+    )
+    _assert_same_result(code)
+
+
+def test_grouped_and_format_lambdas_are_not_reported():
+    assert analyze_code("result = df.groupby('name')['a'].apply(lambda s: s.sum())") == []
+    assert analyze_code("result = df['a'].apply(lambda v: f'{v:.2f}')") == []
+
+
+def test_condition_without_column_is_left_unchanged():
+    code = "result = df.apply(lambda r: 1 if True else 0, axis=1)"
+    new_code, report = vectorize_code(code)
+    assert report["rewrites"] == 0
+    assert new_code == code
@@ -0,0 +1,52 @@
+"""
+SQLite连接池的单元测试
+"""
+import sqlite3
+
+from src.database.connection_pool import SQLiteConnectionPool
+
+
+def _pool(tmp_path):
+    pool = SQLiteConnectionPool(str(tmp_path / "pool.db"))
+    conn = pool.connection()
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.commit()
+    conn.close()
+    return pool
+
+
+def test_nested_use_keeps_outer_transaction(tmp_path):
+    pool = _pool(tmp_path)
+    outer = pool.connection()
+    outer.row_factory = sqlite3.Row
+    outer.execute("INSERT INTO items (name) VALUES ('a')")
+
+    # 同一线程中嵌套获取并归还连接，不能回滚外层的事务或重置外层的行格式
+    inner = pool.connection()
+    inner.execute("SELECT COUNT(*) FROM items").fetchone()
+    inner.close()
+
+    assert outer.in_transaction
+    assert outer.execute("SELECT name FROM items").fetchone()["name"] == "a"
+    outer.commit()
+    outer.close()
+
+    conn = pool.connection()
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+    conn.close()
+    pool.close_all()
+
+
+def test_outermost_close_discards_uncommitted_changes(tmp_path):
+    pool = _pool(tmp_path)
+    conn = pool.connection()
+    conn.row_factory = sqlite3.Row
+    conn.execute("INSERT INTO items (name) VALUES ('a')")
+    conn.close()
+
+    conn = pool.connection()
+    # 取出时恢复默认的行格式
+    row = conn.execute("SELECT COUNT(*) FROM items").fetchone()
+    assert isinstance(row, tuple) and row[0] == 0
+    conn.close()
+    pool.close_all()